@@ -1,23 +1,44 @@
 import streamlit as st
 import snowflake.connector
-from snowflake.connector import DictCursor
 import os
-from pathlib import Path
 import tempfile
-import traceback
 import pandas as pd
 import re
-import io
 import shutil
 import time
+import threading
+import hashlib
+from file_extract.audit import log_operation, flush_audit_log
+from file_extract.load_modes import LOAD_MODES, LoadOptions, normalize_load_options
+from file_extract.loaders import get_table_profile
+from file_extract.file_groups import GROUPINGS
+from file_extract.pipeline import (
+    ensure_schemas, process_files_concurrently, process_files_in_batches, process_queued_files,
+    DEFAULT_PROCESS_WORKERS, MAX_PROCESS_WORKERS
+)
+from file_extract.registry import HASH_CHUNK_BYTES, register_file_contents, find_already_loaded
+from file_extract.runtime import SNOWPARK_AVAILABLE, get_active_session, set_handlers
+from file_extract.sql import quote_identifier
+from file_extract.stages import (
+    upload_file_to_stage, upload_files_to_stage, get_stage_files, get_stage_file_md5s, list_stage_files_page,
+    count_stage_files, delete_file_from_stage, invalidate_stage_listing,
+    STAGE_LISTING_TTL_SECONDS, STAGE_PAGE_SIZE, PROCESSABLE_EXTENSIONS
+)
+from file_extract.work_queue import USE_WORK_QUEUE
 
-# Try to import Snowpark for native Snowflake session
+# Worker threads need the script run context to use st.session_state and st.* calls
 try:
-    from snowflake.snowpark.context import get_active_session
-    SNOWPARK_AVAILABLE = True
+    from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 except ImportError:
-    SNOWPARK_AVAILABLE = False
-    get_active_session = None
+    add_script_run_ctx = None
+    get_script_run_ctx = None
+
+# Data quality metrics on View Tables are computed with one aggregate query per
+# batch of columns and cached per table until it is altered
+QUALITY_METRIC_COLUMNS_PER_QUERY = 100
+QUALITY_METRIC_CACHE_TTL = 3600
+# Types that don't support MIN/MAX or APPROX_COUNT_DISTINCT
+UNPROFILED_DATA_TYPES = {'VARIANT', 'OBJECT', 'ARRAY', 'GEOGRAPHY', 'GEOMETRY', 'VECTOR', 'MAP'}
 
 # Page configuration
 st.set_page_config(
@@ -339,7 +360,7 @@ def get_snowflake_connection():
                     # Test failed but connection might still work
                     return conn
                 return conn
-            except Exception as e:
+            except Exception:
                 # get_active_session failed, try st.connection as fallback
                 pass
         
@@ -347,7 +368,7 @@ def get_snowflake_connection():
         try:
             conn = st.connection("snowflake")
             return conn
-        except Exception as e:
+        except Exception:
             # st.connection failed - return None and we'll use st.sql fallback
             return None
     
@@ -381,668 +402,336 @@ def get_snowflake_connection():
     except:
         return None
 
-def upload_file_to_stage(conn, file_data, filename, stage_name="RAW_STAGE"):
-    """Upload file to Snowflake stage"""
-    try:
-        # Check if we're running in Snowflake environment
-        is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
-        
-        if is_snowflake_env and SNOWPARK_AVAILABLE:
-            # Use Snowpark session for file upload when running in Snowflake
-            try:
-                session = get_active_session()
-                
-                # Create a temporary directory and file with the original filename
-                temp_dir = tempfile.mkdtemp()
-                tmp_path = os.path.join(temp_dir, filename)
-                
-                try:
-                    # Write file with original name
-                    with open(tmp_path, 'wb') as f:
-                        f.write(file_data)
-                    
-                    # Use Snowpark's file.put method - this will preserve the filename
-                    result = session.file.put(
-                        tmp_path,
-                        f"@{stage_name}",
-                        auto_compress=False,
-                        overwrite=True
-                    )
-                    
-                    # Verify the file was uploaded with correct name
-                    verify_df = session.sql(f"LIST @{stage_name} PATTERN='{filename}'").collect()
-                    if verify_df and len(verify_df) > 0:
-                        uploaded_name = verify_df[0]['name'].split('/')[-1]
-                        if uploaded_name == filename:
-                            return True, f"File {filename} uploaded successfully to {stage_name}"
-                        else:
-                            st.warning(f"File uploaded as '{uploaded_name}' instead of '{filename}'")
-                            return True, f"File uploaded to {stage_name} as {uploaded_name}"
-                    
-                    return True, f"File {filename} uploaded successfully to {stage_name}"
-                finally:
-                    # Clean up temp file and directory
-                    if os.path.exists(tmp_path):
-                        os.remove(tmp_path)
-                    if os.path.exists(temp_dir):
-                        os.rmdir(temp_dir)
-            except Exception as e:
-                # If Snowpark method fails, fall through to traditional method
-                st.warning(f"Snowpark upload failed, trying alternative method: {str(e)}")
-        
-        # Traditional method for local development or fallback
-        cursor = conn.cursor()
-        
-        # Create temporary directory and file with original filename
-        temp_dir = tempfile.mkdtemp()
-        tmp_path = os.path.join(temp_dir, filename)
-        
-        try:
-            # Write file with original name
-            with open(tmp_path, 'wb') as f:
-                f.write(file_data)
-            
-            # Upload to stage - PUT will use the actual filename
-            put_command = f"PUT file://{tmp_path} @{stage_name} AUTO_COMPRESS=FALSE OVERWRITE=TRUE"
-            cursor.execute(put_command)
-            
-            # Get file info
-            list_command = f"LIST @{stage_name} PATTERN='{filename}'"
-            cursor.execute(list_command)
-            result = cursor.fetchone()
-            
-            return True, f"File {filename} uploaded successfully to {stage_name}"
-        finally:
-            # Clean up temp file and directory
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-            if os.path.exists(temp_dir):
-                os.rmdir(temp_dir)
-                
-    except Exception as e:
-        return False, f"Error uploading file: {str(e)}"
-
-def clean_table_name(filename):
-    """Clean filename to create valid table name"""
-    # Remove extension and clean special characters
-    table_name = re.sub(r'[^a-zA-Z0-9_]', '_', filename.rsplit('.', 1)[0])
-    table_name = re.sub(r'_+', '_', table_name).strip('_')
-    return table_name.upper()
+def upload_id_for(uploaded_file):
+    """Stable id of a file selected in st.file_uploader"""
+    return getattr(uploaded_file, 'file_id', None) or f"{uploaded_file.name}:{uploaded_file.size}"
 
-def log_operation(conn, operation_name, file_name=None, source_stage=None, target_stage=None, 
-                  status="STARTED", start_time=None, end_time=None, error_message=None, 
-                  rows_processed=None, table_name=None):
-    """Log file operations to audit table"""
-    try:
-        cursor = conn.cursor()
-        
-        # Get current user and role
-        try:
-            cursor.execute("SELECT CURRENT_USER(), CURRENT_ROLE(), CURRENT_SESSION()")
-            user_info = cursor.fetchone()
-            user_name = user_info[0] if user_info else "UNKNOWN"
-            role_name = user_info[1] if user_info else "UNKNOWN"
-            session_id = user_info[2] if user_info else None
-        except:
-            user_name = "UNKNOWN"
-            role_name = "UNKNOWN"
-            session_id = None
-        
-        # Calculate duration if both times provided
-        duration_seconds = None
-        if start_time and end_time:
-            duration_seconds = (end_time - start_time).total_seconds()
-        
-        # Set start_time to now if not provided
-        if not start_time:
-            from datetime import datetime
-            start_time = datetime.now()
-        
-        # Build and insert log entry using string formatting to avoid parameterized query issues
-        def sql_escape(value):
-            """Escape single quotes for SQL"""
-            if value is None:
-                return "NULL"
-            elif isinstance(value, (int, float)):
-                return str(value)
-            else:
-                return f"'{str(value).replace(chr(39), chr(39)+chr(39))}'"  # Escape single quotes
-        
-        insert_sql = f"""
-        INSERT INTO LOGS.FILE_OPERATION_LOG (
-            OPERATION_NAME, FILE_NAME, USER_NAME, ROLE_NAME, 
-            SOURCE_STAGE, TARGET_STAGE, STATUS, START_TIME, END_TIME, 
-            DURATION_SECONDS, ERROR_MESSAGE, ROWS_PROCESSED, TABLE_NAME, SESSION_ID
-        ) VALUES (
-            {sql_escape(operation_name)},
-            {sql_escape(file_name)},
-            {sql_escape(user_name)},
-            {sql_escape(role_name)},
-            {sql_escape(source_stage)},
-            {sql_escape(target_stage)},
-            {sql_escape(status)},
-            '{start_time}',
-            {sql_escape(end_time) if end_time else 'NULL'},
-            {duration_seconds if duration_seconds else 'NULL'},
-            {sql_escape(error_message)},
-            {rows_processed if rows_processed else 'NULL'},
-            {sql_escape(table_name)},
-            {sql_escape(session_id)}
-        )
-        """
-        
-        cursor.execute(insert_sql)
-        
-        return True
-    except Exception as e:
-        # Don't fail operations if logging fails
-        st.warning(f"Failed to log operation: {str(e)}")
-        return False
-
-def remove_file_from_stage(filename, stage_name):
-    """Remove file from stage using Snowpark FileOperation.remove
+def spool_uploaded_file(uploaded_file, spool_dir):
+    """Write a Streamlit upload to spool_dir/<upload id>/<filename>
     
-    Uses the Snowpark FileOperation API as documented at:
-    https://docs.snowflake.com/en/developer-guide/snowpark/reference/python/1.42.0/snowpark/api/snowflake.snowpark.FileOperation.remove
-    
-    Note: In Streamlit in Snowflake, file removal may have limitations due to security restrictions.
+    The file is copied in HASH_CHUNK_BYTES blocks and hashed on the way, so no
+    extra copy of its bytes is held in memory. Returns the metadata kept in
+    session state: name, size, path, sha256 and upload id.
     """
-    is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
-    
-    try:
-        if is_snowflake_env and SNOWPARK_AVAILABLE:
-            # Use Snowpark FileOperation.remove API
-            session = get_active_session()
-            try:
-                # Use the file.remove() method
-                # Syntax: session.file.remove(stage_location, pattern=None)
-                # Returns a list of removed file paths
-                stage_location = f"@{stage_name}/{filename}"
-                result = session.file.remove(stage_location)
-                # Result is a list of removed file paths
-                if result:
-                    return True
-                else:
-                    # No files removed, but don't block workflow
-                    return True
-            except Exception as snowpark_error:
-                error_msg = str(snowpark_error)
-                if "REMOVE_FILES" in error_msg or "Unsupported statement" in error_msg or "privilege" in error_msg.lower():
-                    # Expected limitation in Streamlit - files stay in stage
-                    # This is OK - we track file processing in the log table
-                    return True  # Return True to not block workflow
-                else:
-                    # Unexpected error - raise it
-                    raise snowpark_error
-        else:
-            # Use traditional REMOVE command for local development
-            conn = get_snowflake_connection()
-            if conn:
-                cursor = conn.cursor()
-                # Execute REMOVE command
-                # Syntax: REMOVE @stage_name/filename
-                remove_sql = f"REMOVE @{stage_name}/{filename}"
-                cursor.execute(remove_sql)
-            return True
-    except Exception as e:
-        # If removal fails, log but don't raise - file is already processed
-        # Return True to not block the workflow
-        return True
+    upload_id = upload_id_for(uploaded_file)
+    upload_dir = os.path.join(spool_dir, re.sub(r'[^A-Za-z0-9_-]', '_', str(upload_id)))
+    os.makedirs(upload_dir, exist_ok=True)
+    spool_path = os.path.join(upload_dir, uploaded_file.name)
+    
+    digest = hashlib.sha256()
+    file_size = 0
+    uploaded_file.seek(0)
+    with open(spool_path, 'wb') as f:
+        for block in iter(lambda: uploaded_file.read(HASH_CHUNK_BYTES), b''):
+            digest.update(block)
+            f.write(block)
+            file_size += len(block)
+    uploaded_file.seek(0)  # Reset file pointer
+    
+    return {
+        'name': uploaded_file.name,
+        'size': file_size,
+        'path': spool_path,
+        'sha256': digest.hexdigest(),
+        'upload_id': upload_id
+    }
 
-def move_file_between_stages(conn, filename, from_stage, to_stage):
-    """Move file from one stage to another"""
-    try:
-        # Download file from source stage
-        file_data = download_file_from_stage(conn, filename, from_stage)
-        
-        # Upload to destination stage
-        success, message = upload_file_to_stage(conn, file_data, filename, to_stage)
-        
-        if success:
-            # Remove from source stage
-            remove_file_from_stage(filename, from_stage)
-            return True, f"File moved from {from_stage} to {to_stage}"
-        else:
-            return False, f"Failed to upload to {to_stage}: {message}"
-            
-    except Exception as e:
-        return False, f"Error moving file: {str(e)}"
+def discard_spooled_file(file_info):
+    """Delete a spooled upload from disk"""
+    shutil.rmtree(os.path.dirname(file_info['path']), ignore_errors=True)
 
-def put_file_to_stage_internal(tmp_path, stage_path):
-    """Internal helper to PUT file to stage using Snowpark or traditional method"""
-    is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
-    
-    if is_snowflake_env and SNOWPARK_AVAILABLE:
-        try:
-            session = get_active_session()
-            session.file.put(tmp_path, stage_path, auto_compress=False, overwrite=True)
-            return
-        except Exception as e:
-            # Fall through to SQL method
-            st.warning(f"Snowpark PUT failed, using SQL method: {str(e)}")
-    
-    # Use SQL cursor method
-    # This needs to be called from a context that has a cursor
-    raise NotImplementedError("put_file_to_stage_internal should be called with proper context")
+def get_upload_spool_dir():
+    """Directory this session spools selected files to, created when first needed"""
+    spool_dir = st.session_state.get('upload_spool_dir')
+    if not spool_dir or not os.path.isdir(spool_dir):
+        spool_dir = st.session_state.upload_spool_dir = tempfile.mkdtemp(prefix="file_extract_uploads_")
+    return spool_dir
 
-def download_file_from_stage(conn, filename, stage_name="RAW_STAGE"):
-    """Download file from Snowflake stage and return file content"""
-    try:
-        # Check if we're running in Snowflake environment
-        is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
-        
-        if is_snowflake_env and SNOWPARK_AVAILABLE:
-            # Use Snowpark session for file download when running in Snowflake
-            try:
-                session = get_active_session()
-                
-                # Create temporary directory for download
-                temp_dir = tempfile.mkdtemp()
-                
-                try:
-                    # Use Snowpark's file.get method
-                    session.file.get(
-                        f"@{stage_name}/{filename}",
-                        temp_dir
-                    )
-                    
-                    # Find the downloaded file
-                    for root, dirs, files in os.walk(temp_dir):
-                        for file in files:
-                            file_path = os.path.join(root, file)
-                            # Read the file content
-                            with open(file_path, 'rb') as f:
-                                file_data = f.read()
-                            return file_data
-                    
-                    raise FileNotFoundError(f"File {filename} not found after download from {stage_name}")
-                finally:
-                    # Clean up temp directory
-                    if os.path.exists(temp_dir):
-                        shutil.rmtree(temp_dir, ignore_errors=True)
-            except Exception as e:
-                # If Snowpark method fails, fall through to traditional method
-                st.warning(f"Snowpark download failed, trying alternative method: {str(e)}")
-        
-        # Traditional method for local development or fallback
-        cursor = conn.cursor()
-        
-        # Create temporary directory for download
-        temp_dir = tempfile.mkdtemp()
-        
-        try:
-            # Use GET command to download file from stage
-            get_command = f"GET @{stage_name}/{filename} file://{temp_dir}/"
-            cursor.execute(get_command)
-            
-            # Find the downloaded file (GET may preserve path structure)
-            for root, dirs, files in os.walk(temp_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    # Read the file content
-                    with open(file_path, 'rb') as f:
-                        file_data = f.read()
-                    return file_data
-            
-            raise FileNotFoundError(f"File {filename} not found after download from {stage_name}")
-        finally:
-            # Clean up temp directory
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
-                
-    except Exception as e:
-        raise e
-
-def process_csv_file(conn, filename, file_data):
-    """Process CSV/TXT file and create table"""
-    try:
-        cursor = conn.cursor()
-        table_name = clean_table_name(filename)
-        
-        # Read CSV into pandas
-        # Try to detect delimiter
-        df = pd.read_csv(io.BytesIO(file_data), sep=None, engine='python', encoding='utf-8', on_bad_lines='skip')
-        
-        # Add source file name column
-        df['SOURCE_FILE_NAME'] = filename
-        
-        # Check if we're running in Snowflake environment
-        is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
-        
-        if is_snowflake_env and SNOWPARK_AVAILABLE:
-            # Use Snowpark's write_pandas for direct DataFrame to table
-            try:
-                session = get_active_session()
-                
-                # Write DataFrame directly to Snowflake table using Snowpark
-                session.write_pandas(
-                    df,
-                    table_name,
-                    database="FILE_EXTRACT_DB",
-                    schema="CONVERTED_FILES",
-                    overwrite=True,
-                    auto_create_table=True
-                )
-                
-                return True, f"File {filename} processed successfully. Table {table_name} created."
-            except Exception as e:
-                st.warning(f"Snowpark method failed, falling back to traditional method: {str(e)}")
-        
-        # Traditional method for local development or fallback
-        # Write to Snowflake table using COPY INTO approach
-        csv_buffer = io.StringIO()
-        df.to_csv(csv_buffer, index=False)
-        csv_data = csv_buffer.getvalue().encode('utf-8')
-        
-        # Upload to a temporary stage location
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp_file:
-            tmp_file.write(csv_data)
-            tmp_path = tmp_file.name
-        
-        try:
-            # Upload processed file
-            put_command = f"PUT file://{tmp_path} @PROCESSING_STAGE/{filename} AUTO_COMPRESS=FALSE OVERWRITE=TRUE"
-            cursor.execute(put_command)
-            
-            # Create table from the processed file in CONVERTED_FILES schema
-            create_table_sql = f"""
-            CREATE OR REPLACE TABLE CONVERTED_FILES.{table_name} AS
-            SELECT 
-                *,
-                '{filename}' AS SOURCE_FILE_NAME
-            FROM @PROCESSING_STAGE/{filename}
-            (FILE_FORMAT => (TYPE = CSV, SKIP_HEADER = 1, FIELD_OPTIONALLY_ENCLOSED_BY = '"', 
-             ERROR_ON_COLUMN_COUNT_MISMATCH = FALSE))
-            """
-            cursor.execute(create_table_sql)
-            
-            return True, f"File {filename} processed successfully. Table {table_name} created."
-        finally:
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
-                
-    except Exception as e:
-        return False, f"Error processing CSV file: {str(e)}"
-
-def process_excel_file(conn, filename, file_data):
-    """Process Excel file and create a table for each sheet"""
-    try:
-        cursor = conn.cursor()
-        base_table_name = clean_table_name(filename)
-        
-        # Read all sheets from Excel file
-        excel_file = pd.ExcelFile(io.BytesIO(file_data), engine='openpyxl')
-        sheet_names = excel_file.sheet_names
-        
-        if not sheet_names:
-            return False, f"Excel file {filename} contains no sheets"
-        
-        processed_tables = []
-        temp_files = []
-        
-        # Check if we're running in Snowflake environment
-        is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
-        
-        try:
-            # Process each sheet
-            for sheet_name in sheet_names:
-                # Read the sheet
-                df = pd.read_excel(excel_file, sheet_name=sheet_name, engine='openpyxl')
-                
-                # Skip empty sheets
-                if df.empty:
-                    continue
-                
-                # Create table name: {filename}_{sheetname}
-                clean_sheet_name = clean_table_name(sheet_name)
-                table_name = f"{base_table_name}_{clean_sheet_name}"
-                
-                # Add source file name column
-                df['SOURCE_FILE_NAME'] = filename
-                
-                if is_snowflake_env and SNOWPARK_AVAILABLE:
-                    # Use Snowpark's write_pandas for direct DataFrame to table
-                    try:
-                        session = get_active_session()
-                        
-                        # Write DataFrame directly to Snowflake table using Snowpark
-                        session.write_pandas(
-                            df,
-                            table_name,
-                            database="FILE_EXTRACT_DB",
-                            schema="CONVERTED_FILES",
-                            overwrite=True,
-                            auto_create_table=True
-                        )
-                        
-                        processed_tables.append(table_name)
-                        continue  # Skip to next sheet
-                    except Exception as e:
-                        st.warning(f"Snowpark method failed for sheet {sheet_name}, falling back: {str(e)}")
-                
-                # Traditional method for local development or fallback
-                # Convert to CSV
-                csv_buffer = io.StringIO()
-                df.to_csv(csv_buffer, index=False)
-                csv_data = csv_buffer.getvalue().encode('utf-8')
-                
-                # Create temporary CSV file
-                csv_filename = f"{filename.rsplit('.', 1)[0]}_{sheet_name}.csv"
-                # Clean CSV filename for stage
-                clean_csv_filename = re.sub(r'[^a-zA-Z0-9_.-]', '_', csv_filename)
-                
-                with tempfile.NamedTemporaryFile(delete=False, suffix='.csv') as tmp_file:
-                    tmp_file.write(csv_data)
-                    tmp_path = tmp_file.name
-                    temp_files.append(tmp_path)
-                
-                # Upload processed file as CSV to processing stage
-                put_command = f"PUT file://{tmp_path} @PROCESSING_STAGE/{clean_csv_filename} AUTO_COMPRESS=FALSE OVERWRITE=TRUE"
-                cursor.execute(put_command)
-                
-                # Create table from the processed file in CONVERTED_FILES schema
-                create_table_sql = f"""
-                CREATE OR REPLACE TABLE CONVERTED_FILES.{table_name} AS
-                SELECT 
-                    *,
-                    '{filename}' AS SOURCE_FILE_NAME
-                FROM @PROCESSING_STAGE/{clean_csv_filename}
-                (FILE_FORMAT => (TYPE = CSV, SKIP_HEADER = 1, FIELD_OPTIONALLY_ENCLOSED_BY = '"', 
-                 ERROR_ON_COLUMN_COUNT_MISMATCH = FALSE))
-                """
-                cursor.execute(create_table_sql)
-                
-                processed_tables.append(table_name)
-            
-            if processed_tables:
-                tables_str = ", ".join(processed_tables)
-                return True, f"File {filename} processed successfully. Created {len(processed_tables)} table(s): {tables_str}"
-            else:
-                return False, f"File {filename} contained no data in any sheet"
-                
-        finally:
-            # Clean up temporary files
-            for tmp_path in temp_files:
-                if os.path.exists(tmp_path):
-                    os.remove(tmp_path)
-                
-    except Exception as e:
-        return False, f"Error processing Excel file: {str(e)}\n{traceback.format_exc()}"
+def remove_upload_spool():
+    """Delete this session's spool directory and forget the files spooled to it"""
+    spool_dir = st.session_state.pop('upload_spool_dir', None)
+    if spool_dir:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    st.session_state.spooled_uploads = {}
+    st.session_state.staged_files = []
+    # A new widget key clears the uploader, which would otherwise hand the
+    # same files back to be spooled and hashed again
+    st.session_state.file_uploader_generation = st.session_state.get('file_uploader_generation', 0) + 1
 
-def process_pdf_file(conn, filename, file_data):
-    """Process PDF file and create metadata table"""
-    try:
-        cursor = conn.cursor()
-        table_name = clean_table_name(filename)
-        
-        # For PDF, create a metadata table
-        # Full PDF text extraction would require additional libraries
-        create_table_sql = f"""
-        CREATE OR REPLACE TABLE {table_name} AS
-        SELECT 
-            'PDF file: {filename}' AS note,
-            '{filename}' AS SOURCE_FILE_NAME,
-            CURRENT_TIMESTAMP() AS PROCESSED_AT,
-            {len(file_data)} AS FILE_SIZE_BYTES
-        """
-        cursor.execute(create_table_sql)
-        
-        return True, f"File {filename} processed. Table {table_name} created with metadata. Note: Full PDF text extraction requires additional processing."
-        
-    except Exception as e:
-        return False, f"Error processing PDF file: {str(e)}"
+# Guards process_logs when files are processed by worker threads
+process_log_lock = threading.Lock()
 
 def add_process_log(message):
     """Add a message to the process logs in session state"""
     from datetime import datetime
     timestamp = datetime.now().strftime("%H:%M:%S")
     log_entry = f"[{timestamp}] {message}"
-    if 'process_logs' not in st.session_state:
-        st.session_state.process_logs = []
-    st.session_state.process_logs.append(log_entry)
-    # Keep only last 50 messages
-    if len(st.session_state.process_logs) > 50:
-        st.session_state.process_logs = st.session_state.process_logs[-50:]
+    with process_log_lock:
+        if 'process_logs' not in st.session_state:
+            st.session_state.process_logs = []
+        st.session_state.process_logs.append(log_entry)
+        # Keep only last 50 messages
+        if len(st.session_state.process_logs) > 50:
+            st.session_state.process_logs = st.session_state.process_logs[-50:]
 
-def process_file(conn, filename):
-    """Process file and convert to table - follows RAW -> PROCESSING -> COMPLETED/ERROR flow"""
-    from datetime import datetime
-    start_time = datetime.now()
-    table_name = None
+def script_run_ctx_initializer():
+    """Return a thread pool initializer that attaches the current script run context
+
+    Worker threads need it to use st.session_state and st.* calls.
+    """
+    ctx = get_script_run_ctx() if get_script_run_ctx else None
+
+    def attach_script_run_ctx():
+        if ctx and add_script_run_ctx:
+            add_script_run_ctx(threading.current_thread(), ctx)
+
+    return attach_script_run_ctx
+
+# The processing pipeline reports through these instead of calling st.* itself
+set_handlers(log=add_process_log, warning=st.warning, thread_initializer_factory=script_run_ctx_initializer)
+
+@st.cache_data(ttl=QUALITY_METRIC_CACHE_TTL, show_spinner=False)
+def get_table_quality_metrics(_conn, table_name, last_altered, columns_info, include_profile=False):
+    """Compute per-column null counts (and optionally distinct/min/max) for a table
     
-    try:
-        cursor = conn.cursor()
-        
-        # Log process start
-        log_operation(conn, "PROCESS", filename, "RAW_STAGE", None, "STARTED", start_time)
-        add_process_log(f"Started processing {filename}")
-        
-        # Step 1: Move file from RAW_STAGE to PROCESSING_STAGE
-        add_process_log(f"Moving {filename} to processing stage...")
-        move_success, move_message = move_file_between_stages(conn, filename, "RAW_STAGE", "PROCESSING_STAGE")
-        if not move_success:
-            end_time = datetime.now()
-            log_operation(conn, "PROCESS", filename, "RAW_STAGE", "PROCESSING_STAGE", "FAILED", 
-                         start_time, end_time, error_message=move_message)
-            add_process_log(f"❌ Failed to move {filename}: {move_message}")
-            return False, f"Failed to move file to processing stage: {move_message}"
-        
-        add_process_log(f"Moved {filename} to processing stage")
-        
-        # Get file extension
-        file_ext = Path(filename).suffix.lower()
-        
-        # Step 2: Download file from PROCESSING_STAGE
-        try:
-            add_process_log(f"Downloading {filename} from processing stage...")
-            file_data = download_file_from_stage(conn, filename, "PROCESSING_STAGE")
-            add_process_log(f"Downloaded {filename} successfully")
-        except Exception as e:
-            # Move to error stage if download fails
-            move_file_between_stages(conn, filename, "PROCESSING_STAGE", "ERROR_STAGE")
-            add_process_log(f"❌ Failed to download {filename}: {str(e)}")
-            return False, f"Error downloading file from processing stage: {str(e)}"
-        
-        # Step 3: Process based on file type
-        add_process_log(f"Processing {filename} as {file_ext} file...")
-        try:
-            if file_ext in ['.csv', '.txt']:
-                success, message = process_csv_file(conn, filename, file_data)
-            elif file_ext in ['.xlsx', '.xls']:
-                success, message = process_excel_file(conn, filename, file_data)
-            elif file_ext == '.pdf':
-                success, message = process_pdf_file(conn, filename, file_data)
-            else:
-                success = False
-                message = f"Unsupported file type: {file_ext}"
-            
-            # Step 4: Move to appropriate stage based on success
-            if success:
-                add_process_log(f"Moving {filename} to completed stage...")
-                move_file_between_stages(conn, filename, "PROCESSING_STAGE", "COMPLETED_STAGE")
-                end_time = datetime.now()
-                table_name = clean_table_name(filename)
-                log_operation(conn, "PROCESS", filename, "RAW_STAGE", "COMPLETED_STAGE", "SUCCESS", 
-                             start_time, end_time, table_name=table_name)
-                add_process_log(f"✅ Successfully processed {filename} → table {table_name}")
-                return True, message
-            else:
-                add_process_log(f"Moving {filename} to error stage...")
-                move_file_between_stages(conn, filename, "PROCESSING_STAGE", "ERROR_STAGE")
-                end_time = datetime.now()
-                log_operation(conn, "PROCESS", filename, "RAW_STAGE", "ERROR_STAGE", "FAILED", 
-                             start_time, end_time, error_message=message)
-                add_process_log(f"⚠️ Failed to process {filename}: {message}")
-                return False, message
-                
-        except Exception as proc_error:
-            # Move to error stage on processing exception
-            add_process_log(f"❌ Error processing {filename}: {str(proc_error)}")
-            move_file_between_stages(conn, filename, "PROCESSING_STAGE", "ERROR_STAGE")
-            return False, f"Error processing file: {str(proc_error)}\n{traceback.format_exc()}"
-            
-    except Exception as e:
-        # General error - try to move to error stage from wherever it is
-        try:
-            # Try to move from processing stage first
-            move_file_between_stages(conn, filename, "PROCESSING_STAGE", "ERROR_STAGE")
-        except:
-            # If not in processing, try from raw
-            try:
-                move_file_between_stages(conn, filename, "RAW_STAGE", "ERROR_STAGE")
-            except:
-                pass
-        add_process_log(f"❌ Error in workflow for {filename}: {str(e)}")
-        return False, f"Error in process workflow: {str(e)}\n{traceback.format_exc()}"
+    All metrics for a batch of columns come from a single aggregate query, so a
+    table is scanned once per QUALITY_METRIC_COLUMNS_PER_QUERY columns rather
+    than once per column. Results are cached per table and LAST_ALTERED time.
+    """
+    cursor = _conn.cursor()
+    table_ref = f"CONVERTED_FILES.{quote_identifier(table_name)}"
+    total_rows = 0
+    column_metrics = []
+    
+    for offset in range(0, len(columns_info), QUALITY_METRIC_COLUMNS_PER_QUERY):
+        batch = columns_info[offset:offset + QUALITY_METRIC_COLUMNS_PER_QUERY]
+        select_list = ["COUNT(*)"]
+        layout = []  # (col_name, col_type, profiled) per column, in select order
+        for col_name, col_type in batch:
+            col_ref = quote_identifier(col_name)
+            select_list.append(f"COUNT({col_ref})")
+            profiled = include_profile and str(col_type).upper() not in UNPROFILED_DATA_TYPES
+            if profiled:
+                select_list.append(f"APPROX_COUNT_DISTINCT({col_ref})")
+                select_list.append(f"MIN({col_ref})")
+                select_list.append(f"MAX({col_ref})")
+            layout.append((col_name, col_type, profiled))
+        
+        cursor.execute(f"SELECT {', '.join(select_list)} FROM {table_ref}")
+        row = cursor.fetchone()
+        total_rows = row[0] or 0
+        
+        position = 1
+        for col_name, col_type, profiled in layout:
+            metrics = {
+                "column": col_name,
+                "type": col_type,
+                "null_count": total_rows - (row[position] or 0),
+                "distinct": None,
+                "min": None,
+                "max": None,
+            }
+            position += 1
+            if profiled:
+                metrics["distinct"] = row[position]
+                # Keep cached values simple to pickle and display
+                metrics["min"] = None if row[position + 1] is None else str(row[position + 1])
+                metrics["max"] = None if row[position + 2] is None else str(row[position + 2])
+                position += 3
+            column_metrics.append(metrics)
+    
+    return {"row_count": total_rows, "columns": column_metrics}
 
-def get_stage_files(conn, stage_name):
-    """Get list of files in a stage"""
+# Sort choices for stage file tables -> (sort_by, descending)
+STAGE_SORT_OPTIONS = {
+    "Newest first": ("modified", True),
+    "Oldest first": ("modified", False),
+    "Name (A-Z)": ("name", False),
+    "Largest first": ("size", True),
+}
+
+FILE_TYPE_ICONS = {
+    'csv': '📊',
+    'txt': '📝',
+    'xlsx': '📗',
+    'xls': '📗',
+    'pdf': '📕'
+}
+
+def format_file_size(size):
+    """Format a byte count for display"""
     try:
-        cursor = conn.cursor()
-        cursor.execute(f"LIST @{stage_name}")
-        files = cursor.fetchall()
-        
-        # Clean up file names - extract just the filename from the full stage path
-        cleaned_files = []
-        for file_info in files:
-            if file_info and len(file_info) > 0:
-                full_path = file_info[0]
-                # Extract just the filename from the stage path
-                # Stage paths look like: <database>/<schema>/<stage>/<filename>
-                if isinstance(full_path, str) and '/' in full_path:
-                    filename = full_path.split('/')[-1]
-                else:
-                    filename = full_path
-                
-                # Create new tuple with cleaned filename
-                cleaned_files.append((filename,) + file_info[1:])
-        
-        return cleaned_files
-    except Exception as e:
-        st.error(f"Error listing files in {stage_name}: {str(e)}")
-        return []
+        size = float(size)
+    except (TypeError, ValueError):
+        return "N/A"
+    for unit in ("bytes", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:,.0f} {unit}" if unit == "bytes" else f"{size:,.1f} {unit}"
+        size /= 1024
 
-def delete_file_from_stage(conn, filename, stage_name):
-    """Delete a file from a Snowflake stage
+def render_stage_file_table(conn, stage_name, key_prefix, extensions=None):
+    """Render one page of a stage's files as a searchable, selectable table
     
-    Note: In Streamlit in Snowflake, file deletion is restricted for security.
-    Files remain in stages but the operation log tracks processing status.
+    Only the visible page is listed (see list_stage_files_page), and the page
+    is a single data_editor rather than widgets per file, so render time stays
+    flat as the stage grows. Returns the names of the selected files.
     """
-    is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
+    search_col, sort_col = st.columns([3, 1])
+    with search_col:
+        search = st.text_input("Search files", key=f"{key_prefix}_search",
+                               placeholder="🔍 Filter by file name...", label_visibility="collapsed").strip()
+    with sort_col:
+        sort_label = st.selectbox("Sort by", list(STAGE_SORT_OPTIONS), key=f"{key_prefix}_sort",
+                                  label_visibility="collapsed")
+    sort_by, descending = STAGE_SORT_OPTIONS[sort_label]
+    
+    page_key = f"{key_prefix}_page"
+    page = st.session_state.get(page_key, 1)
+    files, total_count = list_stage_files_page(conn, stage_name, search or None, sort_by, descending,
+                                               page - 1, STAGE_PAGE_SIZE, extensions)
+    total_pages = max(1, -(-total_count // STAGE_PAGE_SIZE))
+    if page > total_pages:
+        # A narrower search left the current page past the end
+        page = total_pages
+        st.session_state[page_key] = page
+        files, total_count = list_stage_files_page(conn, stage_name, search or None, sort_by, descending,
+                                                   page - 1, STAGE_PAGE_SIZE, extensions)
+    
+    if not files:
+        st.caption("No files match your search" if search else "Empty")
+        return []
     
+    names = [str(f[0]) for f in files]
+    extensions_shown = [name.lower().split('.')[-1] if '.' in name else '' for name in names]
+    files_df = pd.DataFrame({
+        "Select": [False] * len(files),
+        "File": names,
+        "Type": [f"{FILE_TYPE_ICONS.get(ext, '📄')} {ext.upper() or 'Unknown'}" for ext in extensions_shown],
+        "Size": [format_file_size(f[1] if len(f) > 1 else None) for f in files],
+        "Modified": [str(f[3]) if len(f) > 3 and f[3] is not None else "" for f in files],
+    })
+    # Key the editor on the view so selections reset when the page changes
+    edited_df = st.data_editor(
+        files_df,
+        key=f"{key_prefix}_table_{stage_name}_{page}_{sort_label}_{search}",
+        hide_index=True,
+        use_container_width=True,
+        disabled=["File", "Type", "Size", "Modified"],
+        column_config={"Select": st.column_config.CheckboxColumn("✓", width="small")}
+    )
+    
+    info_col, page_col = st.columns([3, 1])
+    with info_col:
+        first_row = (page - 1) * STAGE_PAGE_SIZE + 1
+        st.caption(f"Showing {first_row:,}-{first_row + len(files) - 1:,} of {total_count:,} file(s) • "
+                   f"page {page} of {total_pages}")
+    with page_col:
+        if total_pages > 1:
+            st.number_input("Page", min_value=1, max_value=total_pages, step=1, key=page_key,
+                            label_visibility="collapsed")
+    
+    return edited_df.loc[edited_df["Select"], "File"].tolist()
+
+def render_load_options():
+    """Load mode controls for Step 2; returns a LoadOptions, or None if they're incomplete"""
+    with st.expander("⚙️ Load options", expanded=False):
+        mode = st.radio(
+            "Load mode",
+            LOAD_MODES,
+            format_func=lambda m: {"replace": "Replace table", "append": "Append rows",
+                                   "merge": "Merge on key"}[m],
+            horizontal=True,
+            key="load_mode",
+            help="Replace rebuilds each table from the file. Append and merge load only the "
+                 "file's rows into the existing table."
+        )
+        table_name = st.text_input(
+            "Target table (optional)",
+            key="load_target_table",
+            help="CONVERTED_FILES table to load into - leave empty to name it after the file. "
+                 "Excel and PDF files use it as the prefix of their tables."
+        )
+        merge_keys = ()
+        if mode == "merge":
+            merge_keys_text = st.text_input("Merge key column(s)", key="load_merge_keys",
+                                            help="Comma-separated columns that identify a row")
+            merge_keys = tuple(key.strip() for key in merge_keys_text.split(",") if key.strip())
+            if not merge_keys:
+                st.warning("Enter at least one key column to merge on")
+                return None
+    return LoadOptions(mode, table_name.strip() or None, merge_keys)
+
+def load_options_error(load_options, file_count):
+    """Why load_options can't load file_count files, or None if they can"""
+    if load_options is None:
+        return "Merge loads need at least one key column"
     try:
-        # Use the helper function that handles both environments
-        success = remove_file_from_stage(filename, stage_name)
-        if success:
-            if is_snowflake_env:
-                # In Snowflake, files aren't actually removed due to security restrictions
-                return True, f"Note: File '{filename}' marked as processed. File remains in {stage_name} due to Snowflake security restrictions. Use Snowflake UI or SQL to manually remove files if needed."
-            else:
-                return True, f"File {filename} deleted successfully from {stage_name}"
-        else:
-            return False, f"Could not delete file {filename} from {stage_name}"
-    except Exception as e:
-        return False, f"Error deleting file: {str(e)}"
+        normalize_load_options(load_options, file_count)
+    except ValueError as e:
+        return str(e)
+    return None
+
+def process_files_with_progress(conn, filenames, process_workers, load_options=None, grouping=None):
+    """Process files concurrently with a progress bar and live status line
+    
+    grouping ("header" or "pattern"), if given, bulk-loads groups of small
+    same-schema files first. Returns (processed_count, failed_count).
+    """
+    progress_bar = st.progress(0)
+    
+    # Create placeholder for horizontal status cards - full width
+    status_placeholder = st.empty()
+    
+    processing_status = []
+    
+    with status_placeholder.container():
+        st.info(f"Processing {len(filenames)} file(s) with {min(process_workers, len(filenames))} worker(s)...")
+    
+    rows_progress = {'total': 0}
+    
+    def on_file_done(filename, success, message, done_count):
+        progress_bar.progress(done_count / len(filenames))
+        
+        # Update processing status
+        status_entry = {
+            'filename': filename,
+            'status': 'success' if success else 'failed',
+            'index': done_count
+        }
+        if not success:
+            status_entry['message'] = message[:100]
+        processing_status.append(status_entry)
+        
+        # Display current processing status on a single line
+        with status_placeholder.container():
+            st.info(f"Finished {filename} ({done_count}/{len(filenames)}) • {rows_progress['total']:,} rows loaded")
+    
+    def on_rows_progress(total_rows):
+        if total_rows != rows_progress['total']:
+            rows_progress['total'] = total_rows
+            with status_placeholder.container():
+                st.info(f"Processed {len(processing_status)}/{len(filenames)} file(s) • {total_rows:,} rows loaded")
+    
+    if grouping:
+        results = process_files_in_batches(conn, filenames, process_workers, on_file_done, on_rows_progress,
+                                           load_options=load_options, grouping=grouping)
+    elif USE_WORK_QUEUE:
+        # Claim files through LOGS.FILE_WORK_QUEUE so other sessions processing
+        # the same stage at the same time never get the same file
+        results = process_queued_files(conn, filenames, process_workers, on_file_done, on_rows_progress,
+                                       load_options=load_options)
+    else:
+        results = process_files_concurrently(conn, filenames, process_workers, on_file_done, on_rows_progress,
+                                             load_options=load_options)
+    processed_count = sum(1 for _, success, _ in results if success)
+    
+    progress_bar.empty()
+    status_placeholder.empty()
+    
+    if len(results) < len(filenames):
+        st.info(f"{len(filenames) - len(results)} file(s) were already being processed by another session")
+    
+    return processed_count, len(results) - processed_count
 
 # Initialize page selection in session state
 if 'current_page' not in st.session_state:
@@ -1060,13 +749,9 @@ if conn:
     try:
         cursor = conn.cursor()
         
-        # Ensure required schemas exist
-        try:
-            cursor.execute("CREATE SCHEMA IF NOT EXISTS CONVERTED_FILES")
-            cursor.execute("CREATE SCHEMA IF NOT EXISTS LOGS")
-        except Exception as schema_error:
-            # Schema creation might fail due to permissions, but continue
-            pass
+        # Ensure required schemas exist - creation might fail due to
+        # permissions, but continue
+        ensure_schemas(conn)
         
         cursor.execute("SELECT CURRENT_WAREHOUSE(), CURRENT_DATABASE(), CURRENT_SCHEMA()")
         info = cursor.fetchone()
@@ -1074,7 +759,7 @@ if conn:
             warehouse_info = info[0]
             database_info = info[1]
             schema_info = info[2]
-    except Exception as e:
+    except Exception:
         # Connection exists but query failed - might still be usable
         connection_status = "⚠️ Connected (Limited)"
 else:
@@ -1168,6 +853,12 @@ if page == "Step 1: Upload Files":
     # Initialize or get file info list from session state
     if 'staged_files' not in st.session_state:
         st.session_state.staged_files = []
+    # Selected files are spooled to disk once; session state keeps only metadata
+    if 'spooled_uploads' not in st.session_state:
+        st.session_state.spooled_uploads = {}
+    if not st.session_state.spooled_uploads and 'upload_spool_dir' in st.session_state:
+        # Nothing is spooled, so the directory is left over from an earlier run
+        remove_upload_spool()
     
     # Show Summary and Upload button at TOP - before file selection (if files are staged)
     if st.session_state.staged_files and len(st.session_state.staged_files) > 0:
@@ -1206,6 +897,18 @@ if page == "Step 1: Upload Files":
         with summary_col3:
             st.markdown("<div style='margin-top: 8px;'></div>", unsafe_allow_html=True)
             upload_button_clicked = st.button("📤 Upload All to Raw Stage", type="primary", use_container_width=True, key="upload_button")
+            parallel_upload = st.toggle(
+                "⚡ Parallel upload",
+                value=True,
+                key="parallel_upload",
+                help="Push all files in one multi-file PUT instead of one file at a time"
+            )
+            skip_duplicates = st.toggle(
+                "⏭️ Skip files already loaded",
+                value=True,
+                key="skip_duplicates",
+                help="Don't upload files whose exact content (SHA-256) is already in their table"
+            )
         
         st.markdown("---")
         
@@ -1217,25 +920,68 @@ if page == "Step 1: Upload Files":
             uploaded_count = 0
             failed_count = 0
             failed_files = []
+            upload_results = []
             
-            for idx, file_info in enumerate(file_info_list):
-                filename = file_info['name']
-                file_data = file_info['data']
-                
-                progress = (idx + 1) / len(file_info_list)
-                progress_bar.progress(progress)
-                
-                with status_container:
-                    st.info(f"Uploading {filename}... ({idx + 1}/{len(file_info_list)})")
-                
-                # Log upload start
-                from datetime import datetime
-                start_time = datetime.now()
-                
-                success, message = upload_file_to_stage(conn, file_data, filename, "RAW_STAGE")
-                
-                # Log upload end
-                end_time = datetime.now()
+            from datetime import datetime
+            
+            # Leave out files whose identical content is already loaded
+            skipped_files = {}
+            if skip_duplicates:
+                try:
+                    skipped_files = find_already_loaded(conn, [(f['name'], f.get('sha256')) for f in file_info_list])
+                except Exception as registry_error:
+                    st.warning(f"Could not check for already loaded files: {str(registry_error)}")
+            for filename, (loaded_from, loaded_at) in skipped_files.items():
+                message = f"Identical content (from {loaded_from}) already loaded at {str(loaded_at)[:19]}"
+                log_operation(conn, "UPLOAD", filename, None, "RAW_STAGE", "SKIPPED",
+                              datetime.now(), datetime.now(), error_message=message)
+                add_process_log(f"⏭️ Skipped {filename}: {message}")
+            all_file_count = len(file_info_list)
+            file_info_list = [f for f in file_info_list if f['name'] not in skipped_files]
+            
+            try:
+                if not file_info_list:
+                    pass
+                elif parallel_upload and len(file_info_list) > 1:
+                    with status_container:
+                        st.info(f"Uploading {len(file_info_list)} files in one batch...")
+                    
+                    # Log upload start
+                    start_time = datetime.now()
+                    batch_results = upload_files_to_stage(
+                        conn,
+                        [(file_info['name'], file_info['path']) for file_info in file_info_list],
+                        "RAW_STAGE"
+                    )
+                    # Log upload end
+                    end_time = datetime.now()
+                    progress_bar.progress(1.0)
+                    upload_results = [(filename, success, message, start_time, end_time)
+                                      for filename, success, message in batch_results]
+                else:
+                    for idx, file_info in enumerate(file_info_list):
+                        filename = file_info['name']
+                        file_data = file_info['path']
+                        
+                        progress = (idx + 1) / len(file_info_list)
+                        progress_bar.progress(progress)
+                        
+                        with status_container:
+                            st.info(f"Uploading {filename}... ({idx + 1}/{len(file_info_list)})")
+                        
+                        # Log upload start
+                        start_time = datetime.now()
+                        
+                        success, message = upload_file_to_stage(conn, file_data, filename, "RAW_STAGE")
+                        
+                        # Log upload end
+                        end_time = datetime.now()
+                        upload_results.append((filename, success, message, start_time, end_time))
+            finally:
+                # The spooled copies are only needed for the PUTs
+                remove_upload_spool()
+            
+            for filename, success, message, start_time, end_time in upload_results:
                 if success:
                     uploaded_count += 1
                     st.session_state.uploaded_files.append(filename)
@@ -1249,6 +995,19 @@ if page == "Step 1: Upload Files":
                                 start_time, end_time, error_message=message)
                     add_process_log(f"❌ Failed to upload {filename}: {message}")
             
+            # Remember each uploaded file's hash so processing can skip duplicates
+            # without downloading the file. The staged MD5 ties the hash to this
+            # upload, so a file re-staged later by other means isn't trusted
+            sizes = {f['name']: f['size'] for f in file_info_list}
+            hashes = {f['name']: f.get('sha256') for f in file_info_list}
+            hashed_uploads = [filename for filename, success, _, _, _ in upload_results
+                              if success and hashes.get(filename)]
+            staged_md5s = get_stage_file_md5s(conn, hashed_uploads, "RAW_STAGE") if hashed_uploads else {}
+            uploaded_hashes = [(hashes[filename], filename, sizes[filename], None, None, staged_md5s.get(filename))
+                               for filename in hashed_uploads]
+            if uploaded_hashes:
+                register_file_contents(conn, uploaded_hashes, "UPLOADED")
+            
             progress_bar.empty()
             status_container.empty()
             
@@ -1256,12 +1015,16 @@ if page == "Step 1: Upload Files":
             if uploaded_count > 0:
                 st.success(f"✅ Successfully uploaded {uploaded_count} file(s) to Raw Stage")
             
+            if skipped_files:
+                st.info(f"⏭️ Skipped {len(skipped_files)} file(s) already loaded with identical content: "
+                        f"{', '.join(skipped_files)}")
+            
             if failed_count > 0:
                 st.error(f"❌ Failed to upload {failed_count} file(s):")
                 for filename, error_msg in failed_files:
                     st.error(f"  - {filename}: {error_msg}")
             
-            if uploaded_count == len(file_info_list):
+            if uploaded_count + len(skipped_files) == all_file_count:
                 st.balloons()
                 st.success("✅ Upload complete! Moving to Process Files...")
                 # Clear staged files after successful upload
@@ -1269,6 +1032,7 @@ if page == "Step 1: Upload Files":
                 # Navigate to Step 2
                 time.sleep(1.5)  # Brief pause to show success message
                 st.session_state.current_page = "Step 2: Process Files"
+                flush_audit_log()
                 st.rerun()
     
     # File uploader - shown AFTER upload button section
@@ -1278,7 +1042,7 @@ if page == "Step 1: Upload Files":
         accept_multiple_files=True,
         help="Select one or more files from your computer",
         label_visibility="visible",
-        key="file_uploader"
+        key=f"file_uploader_{st.session_state.get('file_uploader_generation', 0)}"
     )
     
     # Subdued supported formats info at bottom of uploader
@@ -1295,21 +1059,29 @@ if page == "Step 1: Upload Files":
         file_info_list = []
         total_size = 0
         
+        spooled_uploads = st.session_state.spooled_uploads
+        selected_ids = set()
+        
         for uploaded_file in uploaded_files:
-            file_data = uploaded_file.read()
-            uploaded_file.seek(0)  # Reset file pointer
-            file_size = len(file_data)
-            total_size += file_size
+            upload_id = upload_id_for(uploaded_file)
+            selected_ids.add(upload_id)
             
-            file_info_list.append({
-                'name': uploaded_file.name,
-                'size': file_size,
-                'data': file_data
-            })
+            # Write each newly selected file to disk once, hashing it on the way
+            if upload_id not in spooled_uploads:
+                spooled_uploads[upload_id] = spool_uploaded_file(uploaded_file, get_upload_spool_dir())
+            
+            file_info = spooled_uploads[upload_id]
+            total_size += file_info['size']
+            file_info_list.append(file_info)
+        
+        # Remove spooled copies of files taken out of the selection
+        for upload_id in [upload_id for upload_id in spooled_uploads if upload_id not in selected_ids]:
+            discard_spooled_file(spooled_uploads.pop(upload_id))
         
         # Update session state and rerun to show button at top
         if len(st.session_state.staged_files) != len(file_info_list):
             st.session_state.staged_files = file_info_list
+            flush_audit_log()
             st.rerun()
         else:
             st.session_state.staged_files = file_info_list
@@ -1347,22 +1119,21 @@ elif page == "Step 2: Process Files":
     st.title("⚙️ Step 2: Process Files")
     st.caption("Process and convert files from raw stage into Snowflake tables")
     
-    # Get files in raw stage
-    raw_files = get_stage_files(conn, "RAW_STAGE")
+    # Count files in raw stage - the table below lists one page at a time
+    raw_count = count_stage_files(conn, "RAW_STAGE")
     
-    if raw_files:
-        # Filenames are already cleaned by get_stage_files function
-        file_options = [f[0] for f in raw_files if f[0].endswith(('.csv', '.txt', '.xlsx', '.xls', '.pdf'))]
+    if raw_count:
+        processable_count = count_stage_files(conn, "RAW_STAGE", PROCESSABLE_EXTENSIONS)
         
-        if file_options:
+        if processable_count:
             # Bulk operations section at top - more compact
             st.markdown("#### 🚀 Bulk Operations")
-            st.caption(f"Process or remove all {len(file_options)} file(s) at once")
+            st.caption(f"Process or remove all {processable_count} file(s) at once")
             
             bulk_col1, bulk_col2, bulk_col3 = st.columns([1, 1, 2])
             
             with bulk_col1:
-                process_all_clicked = st.button("⚙️ Process All Files", type="primary", use_container_width=True, help="Process all files in raw stage sequentially")
+                process_all_clicked = st.button("⚙️ Process All Files", type="primary", use_container_width=True, help="Process all files in raw stage in parallel")
             
             with bulk_col2:
                 if st.button("🗑️ Clear All Files", type="secondary", use_container_width=True, help="Delete all files from raw stage"):
@@ -1370,7 +1141,8 @@ elif page == "Step 2: Process Files":
                         with st.spinner("Deleting all files..."):
                             deleted_count = 0
                             failed_count = 0
-                            for filename in file_options:
+                            for filename in [f[0] for f in get_stage_files(conn, "RAW_STAGE")
+                                             if f[0].lower().endswith(PROCESSABLE_EXTENSIONS)]:
                                 success, _ = delete_file_from_stage(conn, filename, "RAW_STAGE")
                                 if success:
                                     deleted_count += 1
@@ -1382,49 +1154,44 @@ elif page == "Step 2: Process Files":
                                 st.success(f"✅ Deleted {deleted_count} file(s)")
                             if failed_count > 0:
                                 st.error(f"❌ Failed to delete {failed_count} file(s)")
+                            flush_audit_log()
                             st.rerun()
             
             with bulk_col3:
-                st.caption("💡 Tip: Use bulk operations for efficiency, or process files individually below")
+                process_workers = st.slider(
+                    "Parallel workers",
+                    min_value=1,
+                    max_value=MAX_PROCESS_WORKERS,
+                    value=DEFAULT_PROCESS_WORKERS,
+                    key="process_workers",
+                    help="Number of files processed at the same time"
+                )
+                bulk_load = st.toggle(
+                    "📦 Bulk-load similar small files",
+                    value=False,
+                    key="bulk_load_groups",
+                    help="Load CSV/TXT files that share a header (or filename pattern) into one table "
+                         "with a single COPY INTO per group"
+                )
+                grouping = None
+                if bulk_load:
+                    grouping = st.radio("Group files by", GROUPINGS, horizontal=True, key="bulk_load_grouping",
+                                        format_func=lambda g: {"header": "Header", "pattern": "Filename pattern"}[g])
+                st.caption("💡 Tip: Use bulk operations for efficiency, or select files to process below")
+            
+            load_options = render_load_options()
             
             # Handle Process All Files button click - OUTSIDE columns for full width display
             if process_all_clicked:
-                if len(file_options) > 0:
-                    progress_bar = st.progress(0)
-                    
-                    # Create placeholder for horizontal status cards - full width
-                    status_placeholder = st.empty()
-                    
-                    processed_count = 0
-                    failed_count = 0
-                    processing_status = []
-                    
-                    for idx, filename in enumerate(file_options):
-                        progress = (idx + 1) / len(file_options)
-                        progress_bar.progress(progress)
-                        
-                        # Update processing status
-                        processing_status.append({
-                            'filename': filename,
-                            'status': 'processing',
-                            'index': idx + 1
-                        })
-                        
-                        # Display current processing status on a single line
-                        with status_placeholder.container():
-                            st.info(f"Processing {filename}... ({idx + 1}/{len(file_options)})")
-                        
-                        success, message = process_file(conn, filename)
-                        if success:
-                            processed_count += 1
-                            processing_status[-1]['status'] = 'success'
-                        else:
-                            failed_count += 1
-                            processing_status[-1]['status'] = 'failed'
-                            processing_status[-1]['message'] = message[:100]
-                    
-                    progress_bar.empty()
-                    status_placeholder.empty()
+                # The full file list is only needed when processing everything
+                file_options = [f[0] for f in get_stage_files(conn, "RAW_STAGE")
+                                if f[0].lower().endswith(PROCESSABLE_EXTENSIONS)]
+                load_error = load_options_error(load_options, len(file_options))
+                if load_error:
+                    st.error(f"❌ {load_error}")
+                elif len(file_options) > 0:
+                    processed_count, failed_count = process_files_with_progress(conn, file_options, process_workers,
+                                                                                load_options, grouping)
                     
                     # Show final results
                     if processed_count > 0:
@@ -1439,71 +1206,50 @@ elif page == "Step 2: Process Files":
                         time.sleep(1.5)  # Brief pause to show success message
                         st.session_state.current_page = "Step 3: View Tables"
                     
+                    flush_audit_log()
                     st.rerun()
             
             # Files table section - more compact
             st.markdown("<div style='margin-top: 20px; margin-bottom: 10px;'></div>", unsafe_allow_html=True)
             st.markdown("#### 📄 Files")
-            st.caption(f"Found {len(file_options)} file(s) ready to process")
+            st.caption(f"Found {processable_count} file(s) ready to process - select files to process or delete them")
             
-            # Create table header with compact styling
-            st.markdown("<div style='margin-top: 10px;'></div>", unsafe_allow_html=True)
-            header_cols = st.columns([4, 1.5, 0.75, 0.75])
-            with header_cols[0]:
-                st.markdown("**Filename**")
-            with header_cols[1]:
-                st.markdown("**Type**")
-            with header_cols[2]:
-                st.markdown("**Process**")
-            with header_cols[3]:
-                st.markdown("**Delete**")
+            selected_files = render_stage_file_table(conn, "RAW_STAGE", "raw_files", PROCESSABLE_EXTENSIONS)
             
-            st.markdown("<hr style='margin: 5px 0; border: 0; border-top: 1px solid #ddd;'>", unsafe_allow_html=True)
+            select_col1, select_col2, _ = st.columns([1, 1, 2])
+            with select_col1:
+                process_selected_clicked = st.button(f"⚙️ Process Selected ({len(selected_files)})", type="primary",
+                                                     use_container_width=True, disabled=not selected_files,
+                                                     key="process_selected_files")
+            with select_col2:
+                delete_selected_clicked = st.button(f"🗑️ Delete Selected ({len(selected_files)})", type="secondary",
+                                                    use_container_width=True, disabled=not selected_files,
+                                                    key="delete_selected_files")
             
-            # Display each file in table format with compact spacing
-            for idx, filename in enumerate(file_options):
-                file_cols = st.columns([4, 1.5, 0.75, 0.75])
-                
-                # Get file extension and icon
-                ext = filename.lower().split('.')[-1] if '.' in filename else ''
-                icon = {
-                    'csv': '📊',
-                    'txt': '📝',
-                    'xlsx': '📗',
-                    'xls': '📗',
-                    'pdf': '📕'
-                }.get(ext, '📄')
-                
-                with file_cols[0]:
-                    st.markdown(f"<div style='padding: 2px 0;'>{icon} <code>{filename}</code></div>", unsafe_allow_html=True)
-                
-                with file_cols[1]:
-                    st.markdown(f"<div style='padding: 2px 0;'>{ext.upper() if ext else 'Unknown'}</div>", unsafe_allow_html=True)
-                
-                with file_cols[2]:
-                    if st.button("⚙️", key=f"process_{idx}_{filename}", help=f"Process {filename}", use_container_width=True):
-                        with st.spinner(f"Processing {filename}..."):
-                            success, message = process_file(conn, filename)
-                            if success:
-                                st.success(message)
-                                st.rerun()
-                            else:
-                                st.error(message)
-                
-                with file_cols[3]:
-                    if st.button("🗑️", key=f"delete_{idx}_{filename}", help=f"Delete {filename}", use_container_width=True):
-                        with st.spinner(f"Deleting {filename}..."):
-                            success, message = delete_file_from_stage(conn, filename, "RAW_STAGE")
-                            if success:
-                                add_process_log(f"Deleted file {filename} from RAW_STAGE")
-                                st.success(message)
-                                st.rerun()
-                            else:
-                                st.error(message)
-                
-                # Add a subtle divider between rows with less margin
-                if idx < len(file_options) - 1:
-                    st.markdown("<hr style='margin: 4px 0; border: 0; border-top: 1px solid #eee;'>", unsafe_allow_html=True)
+            load_error = load_options_error(load_options, len(selected_files)) if process_selected_clicked else None
+            if load_error:
+                st.error(f"❌ {load_error}")
+            elif process_selected_clicked:
+                processed_count, failed_count = process_files_with_progress(conn, selected_files, process_workers,
+                                                                            load_options, grouping)
+                if processed_count > 0:
+                    st.success(f"✅ Successfully processed {processed_count} file(s)")
+                if failed_count > 0:
+                    st.error(f"❌ Failed to process {failed_count} file(s)")
+                else:
+                    flush_audit_log()
+                    st.rerun()
+            
+            if delete_selected_clicked:
+                with st.spinner(f"Deleting {len(selected_files)} file(s)..."):
+                    for filename in selected_files:
+                        success, message = delete_file_from_stage(conn, filename, "RAW_STAGE")
+                        if success:
+                            add_process_log(f"Deleted file {filename} from RAW_STAGE")
+                        else:
+                            st.error(message)
+                flush_audit_log()
+                st.rerun()
         else:
             st.warning("⚠️ No processable files found in raw stage")
             st.info("Supported file types: CSV, TXT, Excel (XLSX, XLS), PDF")
@@ -1537,6 +1283,7 @@ elif page == "Step 2: Process Files":
             with col2:
                 if st.button("Clear Logs", type="secondary", key="clear_process_logs"):
                     st.session_state.process_logs = []
+                    flush_audit_log()
                     st.rerun()
         else:
             st.caption("No activity logs yet. Process logs will appear here as you work.")
@@ -1578,91 +1325,65 @@ elif page == "View Stages":
         st.markdown("**4️⃣ ERROR**")
         st.caption("Failed processing")
     
+    if st.button("🔄 Refresh Stages", type="secondary", key="refresh_stages",
+                 help=f"Listings are cached for {STAGE_LISTING_TTL_SECONDS}s - refresh to pick up changes made outside the app"):
+        invalidate_stage_listing()
+    
     st.markdown("---")
     
     # Stage content display
     stages = [
-        ("RAW_STAGE", "📥 Raw", "#1f77b4"),
-        ("PROCESSING_STAGE", "⚙️ Processing", "#ff7f0e"),
-        ("COMPLETED_STAGE", "✅ Completed", "#2ca02c"),
-        ("ERROR_STAGE", "❌ Error", "#d62728")
+        ("RAW_STAGE", "📥 Raw"),
+        ("PROCESSING_STAGE", "⚙️ Processing"),
+        ("COMPLETED_STAGE", "✅ Completed"),
+        ("ERROR_STAGE", "❌ Error")
     ]
-    
-    stage_cols = st.columns(4)
-    
-    for idx, (stage_name, stage_label, color) in enumerate(stages):
-        with stage_cols[idx]:
-            files = get_stage_files(conn, stage_name)
-            file_count = len(files) if files else 0
-            
-            # Display stage header with file count
-            st.markdown(f"### {stage_label}")
-            st.metric("Files", file_count)
-            
-            if files:
-                st.markdown("---")
-                for file_idx, file_info in enumerate(files):
-                    # Filename is already cleaned by get_stage_files function
-                    file_name = file_info[0] if isinstance(file_info[0], str) else str(file_info[0])
-                    file_size = file_info[1] if len(file_info) > 1 else "N/A"
-                    
-                    # Create a compact file display
-                    with st.container():
-                        # File icon based on extension
-                        ext = file_name.lower().split('.')[-1] if '.' in file_name else ''
-                        icon = {
-                            'csv': '📊',
-                            'txt': '📝',
-                            'xlsx': '📗',
-                            'xls': '📗',
-                            'pdf': '📕'
-                        }.get(ext, '📄')
-                        
-                        st.markdown(f"{icon} **{file_name}**")
-                        
-                        # File size and delete button
-                        file_col1, file_col2 = st.columns([3, 1])
-                        with file_col1:
-                            if file_size != "N/A":
-                                st.caption(f"{file_size:,} bytes" if isinstance(file_size, int) else file_size)
-                        with file_col2:
-                            # Create unique key for delete button
-                            delete_key = f"del_{stage_name}_{file_idx}_{hash(file_name)}"
-                            if st.button("🗑️", key=delete_key, help=f"Delete {file_name}"):
-                                with st.spinner(f"Deleting {file_name}..."):
-                                    success, message = delete_file_from_stage(conn, file_name, stage_name)
-                                    if success:
-                                        add_process_log(f"Deleted {file_name} from {stage_name}")
-                                        st.success("Deleted")
-                                        st.rerun()
-                                    else:
-                                        st.error(f"Error: {message[:50]}")
-                        
-                        st.markdown("<hr style='margin: 8px 0; border: 0; border-top: 1px solid #eee;'>", unsafe_allow_html=True)
-            else:
-                st.caption("Empty")
+    stage_labels = dict(stages)
+    stage_counts = {stage_name: count_stage_files(conn, stage_name) for stage_name, _ in stages}
     
     # Add stage statistics
-    st.markdown("---")
     st.markdown("### 📈 Stage Statistics")
     
     stats_col1, stats_col2, stats_col3, stats_col4 = st.columns(4)
     
     with stats_col1:
-        raw_count = len(get_stage_files(conn, "RAW_STAGE"))
-        st.metric("Pending Upload", raw_count, help="Files waiting to be processed")
+        st.metric("Pending Upload", stage_counts["RAW_STAGE"], help="Files waiting to be processed")
     
     with stats_col2:
-        processing_count = len(get_stage_files(conn, "PROCESSING_STAGE"))
-        st.metric("In Progress", processing_count, help="Files currently being processed")
+        st.metric("In Progress", stage_counts["PROCESSING_STAGE"], help="Files currently being processed")
     
     with stats_col3:
-        completed_count = len(get_stage_files(conn, "COMPLETED_STAGE"))
-        st.metric("Completed", completed_count, help="Successfully processed files")
+        st.metric("Completed", stage_counts["COMPLETED_STAGE"], help="Successfully processed files")
     
     with stats_col4:
-        error_count = len(get_stage_files(conn, "ERROR_STAGE"))
-        st.metric("Errors", error_count, help="Files that failed processing")
+        st.metric("Errors", stage_counts["ERROR_STAGE"], help="Files that failed processing")
+    
+    # Files of one stage at a time, one page at a time
+    st.markdown("---")
+    st.markdown("### 📂 Stage Files")
+    
+    selected_stage = st.radio(
+        "Stage",
+        [stage_name for stage_name, _ in stages],
+        format_func=lambda stage_name: f"{stage_labels[stage_name]} ({stage_counts[stage_name]:,})",
+        horizontal=True,
+        key="view_stage",
+        label_visibility="collapsed"
+    )
+    
+    selected_files = render_stage_file_table(conn, selected_stage, f"stage_{selected_stage}")
+    
+    if st.button(f"🗑️ Delete Selected ({len(selected_files)})", type="secondary", disabled=not selected_files,
+                 key="delete_selected_stage_files"):
+        with st.spinner(f"Deleting {len(selected_files)} file(s)..."):
+            for file_name in selected_files:
+                success, message = delete_file_from_stage(conn, file_name, selected_stage)
+                if success:
+                    add_process_log(f"Deleted {file_name} from {selected_stage}")
+                else:
+                    st.error(f"Error: {message[:50]}")
+        flush_audit_log()
+        st.rerun()
 
 # ============================================================================
 # PAGE: VIEW TABLES
@@ -1671,16 +1392,11 @@ elif page == "Step 3: View Tables":
     st.title("🔍 Step 3: View Tables")
     st.caption("View and analyze the tables created from your processed files")
     
-    # Helper function for SQL identifier quoting
-    def quote_identifier(name):
-        """Quote SQL identifier to handle special characters"""
-        return f'"{name}"'
-    
     try:
         # Get list of tables in the current database/schema
         cursor = conn.cursor()
         cursor.execute("""
-            SELECT table_name, row_count, bytes, created 
+            SELECT table_name, row_count, bytes, created, last_altered 
             FROM information_schema.tables 
             WHERE table_schema = 'CONVERTED_FILES' 
             AND table_type = 'BASE TABLE'
@@ -1721,6 +1437,7 @@ elif page == "Step 3: View Tables":
                             add_process_log(f"Dropped table {selected_table}")
                             st.success(f"✅ Table {selected_table} dropped successfully")
                             st.session_state['show_confirm_drop'] = False
+                            flush_audit_log()
                             st.rerun()
                         except Exception as e:
                             st.error(f"Error dropping table: {str(e)}")
@@ -1737,27 +1454,37 @@ elif page == "Step 3: View Tables":
                     """)
                     columns_info = cursor.fetchall()
                     
+                    include_profile = st.toggle(
+                        "Include distinct counts and min/max",
+                        value=False,
+                        key="quality_profile",
+                        help="Adds approximate distinct counts and min/max per column - still a single scan"
+                    )
+                    
                     # Calculate quality metrics if data exists
                     completeness = 0
                     null_cells = 0
                     columns_with_nulls = 0
+                    quality_metrics = None
                     
                     if columns_info and table_info[1] and table_info[1] > 0:
-                        total_rows = table_info[1]
-                        total_cells = 0
-                        
-                        for col_name, col_type in columns_info:
-                            # Count nulls in each column from CONVERTED_FILES schema
-                            cursor.execute(f"""
-                                SELECT COUNT(*) - COUNT({quote_identifier(col_name)}) as null_count
-                                FROM CONVERTED_FILES.{quote_identifier(selected_table)}
-                            """)
-                            null_count = cursor.fetchone()[0]
-                            
-                            total_cells += total_rows
-                            null_cells += null_count
-                            if null_count > 0:
-                                columns_with_nulls += 1
+                        # Prefer the profile computed at load time - no table scan needed
+                        try:
+                            quality_metrics = get_table_profile(conn, selected_table, table_info[1], columns_info)
+                        except Exception:
+                            quality_metrics = None
+                        if quality_metrics is None:
+                            quality_metrics = get_table_quality_metrics(
+                                conn,
+                                selected_table,
+                                str(table_info[4]),
+                                tuple((c[0], c[1]) for c in columns_info),
+                                include_profile
+                            )
+                        total_rows = quality_metrics["row_count"]
+                        total_cells = total_rows * len(columns_info)
+                        null_cells = sum(m["null_count"] for m in quality_metrics["columns"])
+                        columns_with_nulls = sum(1 for m in quality_metrics["columns"] if m["null_count"] > 0)
                         
                         # Calculate completeness percentage
                         completeness = ((total_cells - null_cells) / total_cells * 100) if total_cells > 0 else 0
@@ -1808,6 +1535,18 @@ elif page == "Step 3: View Tables":
                     with row2_col4:
                         created_time = str(table_info[3])[11:19] if table_info[3] and len(str(table_info[3])) > 11 else "N/A"
                         st.metric("🕐 Created Time", created_time)
+                    
+                    if quality_metrics:
+                        profiled = "profiled_at" in quality_metrics
+                        with st.expander("🧮 Column Metrics", expanded=include_profile):
+                            metric_columns = ["column", "type", "null_count"]
+                            if include_profile or profiled:
+                                metric_columns += ["distinct", "min", "max"]
+                            metrics_df = pd.DataFrame(quality_metrics["columns"])[metric_columns]
+                            metrics_df.columns = ["Column", "Type", "Nulls", "~Distinct", "Min", "Max"][:len(metric_columns)]
+                            st.dataframe(metrics_df, use_container_width=True, hide_index=True)
+                            if profiled:
+                                st.caption(f"From the profile computed when the table was loaded ({quality_metrics['profiled_at'][:19]})")
                         
                 except Exception as e:
                     st.warning(f"Could not calculate metrics: {str(e)}")
@@ -1822,6 +1561,7 @@ elif page == "Step 3: View Tables":
                 with preview_col2:
                     st.markdown("")  # Spacer
                     if st.button("🔄 Refresh", type="secondary", use_container_width=True, key="refresh_preview"):
+                        flush_audit_log()
                         st.rerun()
                 
                 try:
@@ -1896,6 +1636,8 @@ elif page == "Operation Logs":
     st.title("📋 Operation Logs")
     
     try:
+        # Make sure buffered entries from this session show up
+        flush_audit_log()
         cursor = conn.cursor()
         
         # Add filters
@@ -1911,7 +1653,7 @@ elif page == "Operation Logs":
         with col2:
             status_filter = st.selectbox(
                 "Filter by Status",
-                ["All", "SUCCESS", "FAILED", "STARTED", "IN_PROGRESS"],
+                ["All", "SUCCESS", "FAILED", "SKIPPED", "STARTED", "IN_PROGRESS"],
                 key="status_filter"
             )
         
@@ -2058,6 +1800,7 @@ elif page == "Operation Logs":
                         try:
                             cursor.execute("TRUNCATE TABLE LOGS.FILE_OPERATION_LOG")
                             st.success("✅ All logs cleared")
+                            flush_audit_log()
                             st.rerun()
                         except Exception as e:
                             st.error(f"Error clearing logs: {str(e)}")
@@ -2072,6 +1815,7 @@ elif page == "Operation Logs":
                         """)
                         deleted = cursor.rowcount
                         st.success(f"✅ Cleared {deleted} old log entries")
+                        flush_audit_log()
                         st.rerun()
                     except Exception as e:
                         st.error(f"Error clearing old logs: {str(e)}")
@@ -2106,6 +1850,10 @@ st.markdown(
     unsafe_allow_html=True
 )
 
+# Write any audit log entries still buffered from this run
+if conn:
+    flush_audit_log()
+
 # Close connection on app close
 if conn:
     # Connection will be managed by Streamlit's cache_resource
@@ -0,0 +1,137 @@
+"""Compare the temp-file and streaming upload paths used by upload_file_to_stage
+
+Both paths are the real ones from file_extract.stages:
+
+Temp-file path: upload_file_to_stage with streaming unavailable - write the
+                bytes to a temporary file, PUT it, delete it.
+Stream path:    put_stream_to_stage - PUT straight from an in-memory buffer
+                (connector file_stream).
+
+Run against a Snowflake account (connection settings come from the usual
+SNOWFLAKE_* environment variables):
+
+    python benchmarks/upload_paths.py --sizes 1 10 100 --repeat 3
+
+Add --local-only to time just the client-side work of each path without
+Snowflake: the connection is replaced by a stub whose PUT reads the local
+file or stream the way the connector would, and nothing else is stubbed.
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Run from a checkout without installing the package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from file_extract import stages  # noqa: E402
+
+BENCH_STAGE = "FILE_EXTRACT_UPLOAD_BENCH"
+READ_BLOCK_BYTES = 1024 * 1024
+
+
+def connect():
+    import snowflake.connector
+
+    return snowflake.connector.connect(
+        user=os.getenv("SNOWFLAKE_USER"),
+        password=os.getenv("SNOWFLAKE_PASSWORD"),
+        account=os.getenv("SNOWFLAKE_ACCOUNT"),
+        warehouse=os.getenv("SNOWFLAKE_WAREHOUSE"),
+        database=os.getenv("SNOWFLAKE_DATABASE", "FILE_EXTRACT_DB"),
+        schema=os.getenv("SNOWFLAKE_SCHEMA", "PUBLIC"),
+    )
+
+
+class LocalCursor:
+    """Cursor stub for --local-only: PUT reads its source like the connector, the rest is a no-op"""
+
+    def execute(self, sql, file_stream=None):
+        if not sql.startswith("PUT"):
+            return
+        if file_stream is not None:
+            while file_stream.read(READ_BLOCK_BYTES):
+                pass
+            return
+        local_path = sql.split()[1][len("file://"):].strip("'")
+        with open(local_path, "rb") as f:
+            while f.read(READ_BLOCK_BYTES):
+                pass
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+
+class LocalConnection:
+    """Connection stub for --local-only"""
+
+    def cursor(self):
+        return LocalCursor()
+
+    def close(self):
+        pass
+
+
+def upload_via_temp_file(conn, data, filename):
+    """upload_file_to_stage as it runs when the stream API is unavailable"""
+    stream_upload_unavailable = stages.stream_upload_unavailable
+    stages.stream_upload_unavailable = True
+    try:
+        success, message = stages.upload_file_to_stage(conn, data, filename, BENCH_STAGE)
+    finally:
+        stages.stream_upload_unavailable = stream_upload_unavailable
+    if not success:
+        raise RuntimeError(message)
+
+
+def upload_via_stream(conn, data, filename):
+    """The streaming path upload_file_to_stage takes for bytes"""
+    stages.put_stream_to_stage(conn, io.BytesIO(data), filename, BENCH_STAGE)
+
+
+def time_path(upload, conn, data, filename, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        upload(conn, data, filename)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50, 200], help="File sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size and path (median is reported)")
+    parser.add_argument("--local-only", action="store_true", help="Skip Snowflake and time client-side work only")
+    args = parser.parse_args()
+
+    if args.local_only:
+        conn = LocalConnection()
+    else:
+        conn = connect()
+        conn.cursor().execute(f"CREATE TEMPORARY STAGE IF NOT EXISTS {BENCH_STAGE}")
+
+    print(f"{'Size (MB)':>10} {'Temp file (s)':>14} {'Stream (s)':>11} {'Saved':>7}")
+    try:
+        for size_mb in args.sizes:
+            # Random bytes so nothing along the way can compress them away
+            data = os.urandom(size_mb * 1024 * 1024)
+            filename = f"bench_{size_mb}mb.bin"
+            temp_seconds = time_path(upload_via_temp_file, conn, data, filename, args.repeat)
+            stream_seconds = time_path(upload_via_stream, conn, data, filename, args.repeat)
+            saved = (temp_seconds - stream_seconds) / temp_seconds * 100 if temp_seconds else 0
+            print(f"{size_mb:>10} {temp_seconds:>14.3f} {stream_seconds:>11.3f} {saved:>6.1f}%")
+    finally:
+        if not args.local_only:
+            conn.cursor().execute(f"REMOVE @{BENCH_STAGE}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
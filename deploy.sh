@@ -46,6 +46,11 @@ if [ "$APP_ONLY" = false ]; then
     # Step 3: Create stored procedures
     echo ""
     echo "⚙️  Step 3: Creating stored procedures..."
+    # The Excel/PDF Python procedures import the app's parsers from a stage
+    snow stage copy file_extract/parsers.py @FILE_EXTRACT_DB.PUBLIC.FILE_EXTRACT_CODE_STAGE --overwrite || {
+        echo "⚠️  Warning: Could not upload file_extract/parsers.py to FILE_EXTRACT_CODE_STAGE"
+        echo "   The Excel/PDF Python procedures need it - upload it manually"
+    }
     snow sql -f stored_procedures.sql || {
         echo "⚠️  Warning: Could not run stored_procedures.sql automatically"
         echo "   Please run it manually in Snowflake"
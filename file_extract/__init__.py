@@ -0,0 +1 @@
+"""Streamlit-free core of the File Extract app: stage operations, loaders and the processing pipeline (also runnable as python -m file_extract)"""
@@ -0,0 +1,5 @@
+import sys
+
+from file_extract.cli import main
+
+sys.exit(main())
@@ -0,0 +1,178 @@
+"""Buffered audit logging to LOGS.FILE_OPERATION_LOG"""
+import threading
+import time
+import weakref
+from datetime import datetime
+
+from file_extract.runtime import warn
+from file_extract.sql import insert_rows
+
+# Audit log rows are buffered and written with multi-row INSERTs once this many
+# rows are queued or this many seconds have passed, and at the end of each run
+AUDIT_LOG_FLUSH_ROWS = 100
+AUDIT_LOG_FLUSH_SECONDS = 5.0
+AUDIT_LOG_INSERT_BATCH_ROWS = 500
+
+
+AUDIT_LOG_COLUMNS = [
+    "OPERATION_NAME", "FILE_NAME", "USER_NAME", "ROLE_NAME",
+    "SOURCE_STAGE", "TARGET_STAGE", "STATUS", "START_TIME", "END_TIME",
+    "DURATION_SECONDS", "ERROR_MESSAGE", "ROWS_PROCESSED", "TABLE_NAME", "SESSION_ID"
+]
+
+# VARCHAR widths of LOGS.FILE_OPERATION_LOG (setup_database.sql). Longer values
+# are truncated, since one oversized value would fail the whole INSERT
+AUDIT_LOG_COLUMN_WIDTHS = {
+    "OPERATION_NAME": 100, "FILE_NAME": 500, "USER_NAME": 100, "ROLE_NAME": 100,
+    "SOURCE_STAGE": 100, "TARGET_STAGE": 100, "STATUS": 50, "ERROR_MESSAGE": 5000,
+    "TABLE_NAME": 100, "SESSION_ID": 100
+}
+
+
+def fit_to_width(value, width):
+    """Truncate a string value to width characters, marking the cut with '...'"""
+    if width is None or not isinstance(value, str) or len(value) <= width:
+        return value
+    return value[:width - 3] + "..."
+
+
+class AuditLogBuffer:
+    """Buffer LOGS.FILE_OPERATION_LOG rows and write them in batched INSERTs
+
+    The current user, role and session are looked up once per connection
+    instead of on every log call. Buffered rows are written as multi-row
+    parameterised INSERTs when the buffer reaches flush_rows, when
+    flush_seconds have passed since the last write, or when flush() is called
+    at the end of a run. Safe to use from worker threads.
+    """
+    
+    def __init__(self, flush_rows=AUDIT_LOG_FLUSH_ROWS, flush_seconds=AUDIT_LOG_FLUSH_SECONDS):
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.lock = threading.Lock()
+        self.pending = {}  # id(conn) -> (conn, [row, ...])
+        self.identities = weakref.WeakKeyDictionary()
+        self.last_flush = time.monotonic()
+    
+    def identity(self, conn):
+        """Return (user_name, role_name, session_id) for a connection, cached"""
+        try:
+            return self.identities[conn]
+        except (KeyError, TypeError):
+            pass
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT CURRENT_USER(), CURRENT_ROLE(), CURRENT_SESSION()")
+            user_info = cursor.fetchone()
+            identity = (user_info[0], user_info[1], user_info[2]) if user_info else ("UNKNOWN", "UNKNOWN", None)
+        except Exception:
+            # Don't cache failures - try again on the next row
+            return ("UNKNOWN", "UNKNOWN", None)
+        try:
+            self.identities[conn] = identity
+        except TypeError:
+            # Connection objects that can't be weakly referenced aren't cached
+            pass
+        return identity
+    
+    def add(self, conn, row):
+        """Queue one row (values in AUDIT_LOG_COLUMNS order, minus identity)"""
+        user_name, role_name, session_id = self.identity(conn)
+        operation_name, file_name, *rest = row
+        full_row = tuple(fit_to_width(value, AUDIT_LOG_COLUMN_WIDTHS.get(column))
+                         for column, value in zip(AUDIT_LOG_COLUMNS, (operation_name, file_name, user_name,
+                                                                      role_name, *rest, session_id)))
+        with self.lock:
+            self.pending.setdefault(id(conn), (conn, []))[1].append(full_row)
+            row_count = sum(len(rows) for _, rows in self.pending.values())
+            due = (row_count >= self.flush_rows
+                   or time.monotonic() - self.last_flush >= self.flush_seconds)
+        if due:
+            self.flush()
+    
+    def flush(self):
+        """Write all buffered rows; returns the number of rows written
+
+        A batch whose INSERT fails is retried row by row, so one bad row only
+        loses itself.
+        """
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.last_flush = time.monotonic()
+        written = 0
+        for conn, rows in pending.values():
+            for offset in range(0, len(rows), AUDIT_LOG_INSERT_BATCH_ROWS):
+                batch = rows[offset:offset + AUDIT_LOG_INSERT_BATCH_ROWS]
+                try:
+                    self.insert_rows(conn, batch)
+                    written += len(batch)
+                    continue
+                except Exception as e:
+                    if len(batch) == 1:
+                        # Don't fail operations if logging fails
+                        warn(f"Failed to log 1 operation: {str(e)}")
+                        continue
+                for row in batch:
+                    try:
+                        self.insert_rows(conn, [row])
+                        written += 1
+                    except Exception as e:
+                        warn(f"Failed to log {row[0]} of {row[1]}: {str(e)}")
+        return written
+    
+    @staticmethod
+    def insert_rows(conn, rows):
+        """Insert rows with one multi-row INSERT statement"""
+        insert_rows(conn, "LOGS.FILE_OPERATION_LOG", AUDIT_LOG_COLUMNS, rows)
+
+
+audit_log_buffer = AuditLogBuffer()
+
+
+def get_audit_log_buffer():
+    """Get the process-wide audit log buffer"""
+    return audit_log_buffer
+
+
+def flush_audit_log():
+    """Write any buffered audit log rows now"""
+    return get_audit_log_buffer().flush()
+
+
+def log_operation(conn, operation_name, file_name=None, source_stage=None, target_stage=None, 
+                  status="STARTED", start_time=None, end_time=None, error_message=None, 
+                  rows_processed=None, table_name=None):
+    """Log file operations to audit table
+
+    Rows are buffered and written in batches - call flush_audit_log() at the
+    end of a run.
+    """
+    try:
+        # Calculate duration if both times provided
+        duration_seconds = None
+        if start_time and end_time:
+            duration_seconds = (end_time - start_time).total_seconds()
+        
+        # Set start_time to now if not provided
+        if not start_time:
+            start_time = datetime.now()
+        
+        get_audit_log_buffer().add(conn, (
+            operation_name,
+            file_name,
+            source_stage,
+            target_stage,
+            status,
+            str(start_time),
+            str(end_time) if end_time else None,
+            duration_seconds if duration_seconds else None,
+            error_message,
+            rows_processed if rows_processed else None,
+            table_name
+        ))
+        
+        return True
+    except Exception as e:
+        # Don't fail operations if logging fails
+        warn(f"Failed to log operation: {str(e)}")
+        return False
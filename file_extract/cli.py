@@ -0,0 +1,135 @@
+"""Command line entry point for running the processing pipeline without Streamlit
+
+    python -m file_extract process --stage RAW_STAGE --workers 8
+    python -m file_extract process --mode merge --table ORDERS --merge-key ORDER_ID
+    python -m file_extract process --bulk-load pattern
+
+Connection settings come from a connections.toml entry (--connection) or the
+usual SNOWFLAKE_* environment variables. Progress and per-file results are
+printed to stdout; every operation is also written to LOGS.FILE_OPERATION_LOG,
+the same as when files are processed from the app.
+"""
+import argparse
+import os
+import time
+
+from file_extract.audit import flush_audit_log
+from file_extract.load_modes import LOAD_MODES, LoadOptions, normalize_load_options
+from file_extract.file_groups import GROUPINGS
+from file_extract.pipeline import (
+    ensure_schemas, process_files_concurrently, process_files_in_batches, process_queued_files,
+    DEFAULT_PROCESS_WORKERS, MAX_PROCESS_WORKERS
+)
+from file_extract.runtime import set_handlers, print_warning
+from file_extract.stages import get_stage_files
+from file_extract.work_queue import USE_WORK_QUEUE
+
+
+def connect(connection_name=None):
+    """Open a Snowflake connection from connections.toml or SNOWFLAKE_* variables"""
+    import snowflake.connector
+
+    if connection_name:
+        return snowflake.connector.connect(connection_name=connection_name)
+    settings = {
+        "user": os.getenv("SNOWFLAKE_USER"),
+        "password": os.getenv("SNOWFLAKE_PASSWORD"),
+        "account": os.getenv("SNOWFLAKE_ACCOUNT"),
+        "authenticator": os.getenv("SNOWFLAKE_AUTHENTICATOR"),
+        "role": os.getenv("SNOWFLAKE_ROLE"),
+        "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
+        "database": os.getenv("SNOWFLAKE_DATABASE", "FILE_EXTRACT_DB"),
+        "schema": os.getenv("SNOWFLAKE_SCHEMA", "PUBLIC"),
+    }
+    return snowflake.connector.connect(**{key: value for key, value in settings.items() if value})
+
+
+def process_command(args):
+    """Process every file (or the named files) on a stage; returns the exit code"""
+    if args.quiet:
+        # Only per-file results and warnings
+        set_handlers(log=lambda message: None, warning=print_warning)
+
+    if args.mode == "merge" and not args.merge_keys:
+        print_warning("--mode merge needs at least one --merge-key")
+        return 2
+    load_options = LoadOptions(args.mode, args.table, tuple(args.merge_keys or ()))
+
+    conn = connect(args.connection)
+    try:
+        if args.files:
+            filenames = args.files
+        else:
+            filenames = [file_info[0] for file_info in get_stage_files(conn, args.stage)]
+        if not filenames:
+            print(f"No files to process in {args.stage}")
+            return 0
+        try:
+            normalize_load_options(load_options, len(filenames))
+        except ValueError as e:
+            print_warning(str(e))
+            return 2
+
+        workers = max(1, min(args.workers, MAX_PROCESS_WORKERS))
+        print(f"Processing {len(filenames)} file(s) from {args.stage} with {workers} worker(s)", flush=True)
+        start = time.monotonic()
+
+        def report_file(filename, success, message, done_count):
+            status = "OK" if success else "FAILED"
+            print(f"[{done_count}/{len(filenames)}] {status} {filename}: {message}", flush=True)
+
+        for error in ensure_schemas(conn):
+            print_warning(f"Could not create schemas or log tables: {error}")
+
+        if args.bulk_load:
+            results = process_files_in_batches(conn, filenames, max_workers=workers, on_file_done=report_file,
+                                               source_stage=args.stage, load_options=load_options,
+                                               grouping=args.bulk_load, use_queue=args.use_queue,
+                                               worker_id=args.worker_id)
+        elif args.use_queue:
+            # Claim files through LOGS.FILE_WORK_QUEUE so any number of these
+            # workers (and app sessions) can share the stage
+            results = process_queued_files(conn, filenames, max_workers=workers, on_file_done=report_file,
+                                           source_stage=args.stage, worker_id=args.worker_id,
+                                           load_options=load_options)
+        else:
+            results = process_files_concurrently(conn, filenames, max_workers=workers, on_file_done=report_file,
+                                                 source_stage=args.stage, load_options=load_options)
+        failed = [filename for filename, success, _ in results if not success]
+        print(f"Processed {len(results) - len(failed)} file(s), {len(failed)} failed "
+              f"in {time.monotonic() - start:.1f}s")
+        if len(results) < len(filenames):
+            print(f"{len(filenames) - len(results)} file(s) were claimed by other workers")
+        return 1 if failed else 0
+    finally:
+        flush_audit_log()
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m file_extract", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--connection", help="Connection name from connections.toml (default: SNOWFLAKE_* variables)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    process = commands.add_parser("process", help="Load staged files into CONVERTED_FILES tables")
+    process.add_argument("--stage", default="RAW_STAGE", help="Stage to pick files up from (default: RAW_STAGE)")
+    process.add_argument("--workers", type=int, default=DEFAULT_PROCESS_WORKERS,
+                         help=f"Files processed concurrently (1-{MAX_PROCESS_WORKERS}, default: {DEFAULT_PROCESS_WORKERS})")
+    process.add_argument("--files", nargs="+", metavar="FILE", help="Only process these files from the stage")
+    process.add_argument("--no-queue", dest="use_queue", action="store_false", default=USE_WORK_QUEUE,
+                         help="Process files without claiming them in LOGS.FILE_WORK_QUEUE first")
+    process.add_argument("--mode", choices=LOAD_MODES, default="replace",
+                         help="Replace each table, or append/merge the files' rows into it (default: replace)")
+    process.add_argument("--table", help="Load into this CONVERTED_FILES table instead of one named after each file")
+    process.add_argument("--merge-key", dest="merge_keys", action="append", metavar="COLUMN",
+                         help="Key column for --mode merge (repeat for composite keys)")
+    process.add_argument("--bulk-load", nargs="?", const="header", choices=GROUPINGS, metavar="GROUPING",
+                         help="Load small CSV/TXT files that share a header (default) or filename pattern "
+                              "into one table per group with a single COPY INTO")
+    process.add_argument("--worker-id", help="Name of this worker in the work queue (default: host:pid:random)")
+    process.add_argument("--quiet", action="store_true", help="Print only per-file results, not every step")
+    process.set_defaults(handler=process_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
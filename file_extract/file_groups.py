@@ -0,0 +1,188 @@
+"""Bulk loads of many small same-schema CSV/TXT files
+
+Loading 2,000 small files from one feed one at a time means 2,000 tables and
+several round trips per file. Grouped files are instead loaded into one table
+per group with one COPY INTO per STAGE_FILES_PER_STATEMENT files, straight
+from the stage they sit on, and SOURCE_FILE_NAME still records each row's file.
+
+Files are grouped by header signature (delimiter and column names, read for
+many files per query) or by filename pattern, where runs of digits are ignored
+so orders_20240101.csv and orders_20240102.csv match. Pattern groups are still
+split by header, so the files of a group always share one schema.
+"""
+import csv
+import os
+import re
+from collections import Counter, defaultdict, namedtuple
+from pathlib import Path
+
+from file_extract.load_modes import (
+    apply_load, describe_load, drop_staging_table, normalize_load_options, staging_suffix, target_table_name
+)
+from file_extract.loaders import (
+    copy_csv_files_into, create_csv_table, infer_csv_columns, line_file_format, sniff_csv_dialect
+)
+from file_extract.sql import clean_table_name, sql_string_literal
+from file_extract.stages import STAGE_FILES_PER_STATEMENT, stage_files_pattern
+
+GROUPINGS = ("header", "pattern")
+
+# Bigger files are loaded on their own: bulk loads only save per-file
+# overhead, and reading headers scans every candidate file
+BATCH_LOAD_MAX_FILE_BYTES = int(float(os.getenv("FILE_EXTRACT_BATCH_MAX_FILE_MB", "64")) * 1024 * 1024)
+# Smaller groups are loaded file by file
+BATCH_LOAD_MIN_FILES = 2
+# INFER_SCHEMA samples this many of a group's files
+BATCH_LOAD_INFER_FILES = 20
+# Header lines are read for this many files per query
+HEADER_QUERY_FILES = 200
+
+# Header fields that look like values: numbers, dates/times and booleans
+TYPED_VALUE = re.compile(
+    r'[-+]?(\d[\d,]*)?\.?\d+(E[-+]?\d+)?'
+    r'|\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}([ T]\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?)?'
+    r'|\d{1,2}:\d{2}(:\d{2})?'
+    r'|TRUE|FALSE'
+)
+
+# table_name: CONVERTED_FILES table the group loads into
+# delimiter: field delimiter shared by the group's files
+# filenames: the files, sorted
+FileGroup = namedtuple("FileGroup", ["table_name", "delimiter", "filenames"])
+
+
+def filename_pattern(filename):
+    """Filename with runs of digits replaced by '#' (orders_20240101.csv -> orders_#.csv)"""
+    return re.sub(r'\d+', '#', filename.lower())
+
+
+def pattern_table_name(pattern):
+    """Table name for a filename pattern: its non-digit part, cleaned"""
+    return clean_table_name(pattern.replace('#', '')) or "FILE_GROUP"
+
+
+def read_header_lines(conn, filenames, stage_name):
+    """Return {filename: first line} for staged text files, HEADER_QUERY_FILES files per query"""
+    line_format = line_file_format(conn)
+    headers = {}
+    for offset in range(0, len(filenames), HEADER_QUERY_FILES):
+        batch = filenames[offset:offset + HEADER_QUERY_FILES]
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT METADATA$FILENAME, $1
+            FROM @{stage_name} (FILE_FORMAT => '{line_format}',
+                                PATTERN => {sql_string_literal(stage_files_pattern(batch))})
+            WHERE METADATA$FILE_ROW_NUMBER = 1
+        """)
+        for path, line in cursor.fetchall():
+            if line is not None:
+                headers[str(path).split('/')[-1]] = line
+    return headers
+
+
+def header_signature(line):
+    """Return (delimiter, column names) of a CSV header line, or None if it isn't a header
+
+    The sniffer can't judge a header from one line, so a line with any
+    numeric, date or boolean field is taken for data. A header that merely
+    looks like data (a column named 2024) only costs its file the bulk load.
+    """
+    dialect = sniff_csv_dialect([line])
+    columns = next(csv.reader([line], delimiter=dialect['delimiter'], quotechar=dialect['quotechar']), [])
+    columns = tuple(column.strip().upper() for column in columns)
+    if not any(columns) or any(TYPED_VALUE.fullmatch(column) for column in columns):
+        return None
+    return dialect['delimiter'], columns
+
+
+def plan_file_groups(conn, files, stage_name, grouping="header", load_options=None):
+    """Split staged files into FileGroups to bulk-load and files to load one at a time
+
+    files is a list of (filename, size). Only CSV/TXT files of up to
+    BATCH_LOAD_MAX_FILE_BYTES that start with a header row are grouped. A
+    group's table is named after its files' most common filename pattern, or
+    is the target table of load_options. Returns (groups, single_filenames).
+    """
+    if grouping not in GROUPINGS:
+        raise ValueError(f"Unknown grouping {grouping!r} - expected one of {', '.join(GROUPINGS)}")
+    candidates = [filename for filename, size in files
+                  if Path(filename).suffix.lower() in ('.csv', '.txt')
+                  and (size is None or size <= BATCH_LOAD_MAX_FILE_BYTES)]
+    headers = read_header_lines(conn, candidates, stage_name) if candidates else {}
+
+    members = defaultdict(list)
+    for filename in candidates:
+        signature = header_signature(headers[filename]) if filename in headers else None
+        if signature is None:
+            continue
+        key = signature if grouping == "header" else (filename_pattern(filename), signature)
+        members[(signature[0], key)].append(filename)
+
+    groups = []
+    used_table_names = set()
+    for (delimiter, _), filenames in members.items():
+        if len(filenames) < BATCH_LOAD_MIN_FILES:
+            continue
+        if load_options is not None and load_options.table_name:
+            table_name = target_table_name(filenames[0], load_options)
+        else:
+            pattern = Counter(filename_pattern(filename) for filename in filenames).most_common(1)[0][0]
+            base_table_name = table_name = pattern_table_name(pattern)
+            # Different headers behind the same pattern get their own tables
+            suffix = 2
+            while table_name in used_table_names:
+                table_name = f"{base_table_name}_{suffix}"
+                suffix += 1
+            used_table_names.add(table_name)
+        groups.append(FileGroup(table_name, delimiter, sorted(filenames)))
+
+    grouped = {filename for group in groups for filename in group.filenames}
+    return groups, [filename for filename, _ in files if filename not in grouped]
+
+
+def load_file_group(conn, group, stage_name, load_options=None, progress_callback=None):
+    """Load a FileGroup with one COPY INTO per STAGE_FILES_PER_STATEMENT files
+
+    The schema is inferred from the first BATCH_LOAD_INFER_FILES files. A file
+    COPY can't parse is skipped (ON_ERROR = SKIP_FILE) instead of failing the
+    group. progress_callback, if given, is called with the number of rows
+    loaded by each COPY. Returns {filename: (success, message, rows_loaded)}
+    for every file of the group; raises if the group can't be loaded at all.
+    """
+    load_options = normalize_load_options(load_options)
+    # Append and merge COPY into a staging table first
+    load_table = group.table_name + staging_suffix(load_options)
+    copy_results = {}
+    try:
+        columns = infer_csv_columns(conn, group.filenames[:BATCH_LOAD_INFER_FILES], stage_name, group.delimiter)
+        if not columns:
+            raise ValueError(f"Could not infer a schema for {group.table_name}")
+        create_csv_table(conn, load_table, columns)
+        for offset in range(0, len(group.filenames), STAGE_FILES_PER_STATEMENT):
+            batch = group.filenames[offset:offset + STAGE_FILES_PER_STATEMENT]
+            batch_rows = 0
+            # COPY result rows: file, status, rows_parsed, rows_loaded, error_limit, errors_seen, first_error, ...
+            for row in copy_csv_files_into(conn, load_table, len(columns), batch, stage_name, group.delimiter,
+                                           on_error="SKIP_FILE"):
+                if row and len(row) > 3:
+                    copy_results[str(row[0]).split('/')[-1]] = row
+                    batch_rows += row[3] or 0
+            if progress_callback:
+                progress_callback(batch_rows)
+        apply_load(conn, group.table_name, load_table, load_options)
+    finally:
+        drop_staging_table(conn, group.table_name, load_table)
+
+    load_description = describe_load(group.table_name, load_options)
+    results = {}
+    for filename in group.filenames:
+        row = copy_results.get(filename)
+        if row is None:
+            results[filename] = (False, f"COPY INTO did not load {filename}", 0)
+        elif str(row[1]).upper() == "LOADED":
+            results[filename] = (True, f"File {filename} bulk-loaded with {len(group.filenames) - 1} other file(s) "
+                                       f"({row[3] or 0:,} rows). {load_description}.", row[3] or 0)
+        else:
+            first_error = row[6] if len(row) > 6 and row[6] else row[1]
+            results[filename] = (False, f"COPY INTO skipped {filename}: {first_error}", 0)
+    return results
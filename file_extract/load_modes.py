@@ -0,0 +1,161 @@
+"""Replace, append and merge loads into CONVERTED_FILES tables
+
+Replace (the default) rebuilds each target table from the file. Append and
+merge load the file into a staging table next to the target first, then
+INSERT or MERGE just those rows into the existing table, so loading a daily
+delta costs what the delta costs rather than what the table's history costs.
+Staging tables are TRANSIENT and dropped once applied.
+"""
+import re
+import uuid
+from collections import namedtuple
+
+from file_extract.sql import clean_table_name, quote_identifier
+
+LOAD_MODES = ("replace", "append", "merge")
+
+# mode: one of LOAD_MODES
+# table_name: target table (base name for Excel/PDF), or None to derive it
+#             from the file name
+# merge_keys: column names matched on by merge
+LoadOptions = namedtuple("LoadOptions", ["mode", "table_name", "merge_keys"], defaults=("replace", None, ()))
+REPLACE = LoadOptions()
+
+# Staging tables number their rows in file order in this column, so a merge
+# keeps each key's last row; it's never copied into the target
+LOAD_ORDINAL_COLUMN = "_LOAD_ORDINAL"
+STAGING_SUFFIX_PATTERN = re.compile(r'__(APPEND|MERGE)_[0-9A-F]{8}$')
+
+
+def normalize_load_options(load_options, file_count=None):
+    """Return load_options (REPLACE if None), raising ValueError if they can't work
+
+    file_count, if given, is how many files the options will load: replacing
+    one named table from several files (or bulk-load groups) would leave only
+    the last one, so that's rejected too.
+    """
+    if load_options is None:
+        return REPLACE
+    if load_options.mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load mode {load_options.mode!r} - expected one of {', '.join(LOAD_MODES)}")
+    if load_options.mode == "merge" and not load_options.merge_keys:
+        raise ValueError("Merge loads need at least one key column")
+    if load_options.mode == "replace" and load_options.table_name and file_count is not None and file_count > 1:
+        raise ValueError(f"Replacing table {load_options.table_name} from {file_count} files would keep only the "
+                         f"last one - load a single file, or use append or merge")
+    return load_options
+
+
+def target_table_name(filename, load_options=None):
+    """Table a file loads into: the chosen table, or one named after the file"""
+    if load_options is not None and load_options.table_name:
+        # Accept CONVERTED_FILES.NAME as well as NAME
+        table_name = re.sub(r'[^a-zA-Z0-9_]', '_', str(load_options.table_name).split('.')[-1])
+        return re.sub(r'_+', '_', table_name).strip('_').upper()
+    return clean_table_name(filename)
+
+
+def staging_suffix(load_options):
+    """Suffix for the staging table of one load ('' for replace, which loads in place)
+
+    Unique per call so concurrent loads into the same target don't collide.
+    """
+    if load_options is None or load_options.mode == "replace":
+        return ""
+    return f"__{load_options.mode.upper()}_{uuid.uuid4().hex[:8].upper()}"
+
+
+def is_staging_table(table_name):
+    """True if table_name was made with staging_suffix"""
+    return bool(STAGING_SUFFIX_PATTERN.search(str(table_name)))
+
+
+def table_kind(table_name):
+    """'TRANSIENT TABLE' for staging tables, 'TABLE' otherwise, for CREATE statements"""
+    return "TRANSIENT TABLE" if is_staging_table(table_name) else "TABLE"
+
+
+def describe_load(table_name, load_options):
+    """Human-readable outcome of a load, for result messages"""
+    if load_options is None or load_options.mode == "replace":
+        return f"Table {table_name} created"
+    if load_options.mode == "append":
+        return f"Rows appended to table {table_name}"
+    return f"Rows merged into table {table_name} on {', '.join(load_options.merge_keys)}"
+
+
+def describe_columns(conn, table_name):
+    """Return [(column_name, data_type), ...] of a CONVERTED_FILES table"""
+    cursor = conn.cursor()
+    cursor.execute(f"DESCRIBE TABLE CONVERTED_FILES.{quote_identifier(table_name)}")
+    return [(row[0], row[1]) for row in cursor.fetchall()]
+
+
+def apply_load(conn, table_name, load_table, load_options):
+    """Append or merge a staging table into its target table
+
+    The target is created with the staging table's columns if it doesn't
+    exist yet, and columns the new file has but the target lacks are added to
+    it. Merge keeps the last row of each key, by SOURCE_FILE_NAME and
+    LOAD_ORDINAL_COLUMN. A no-op for replace loads, which write the target
+    directly.
+    """
+    if load_table == table_name:
+        return
+    cursor = conn.cursor()
+    target_ref = f"CONVERTED_FILES.{quote_identifier(table_name)}"
+    staging_ref = f"CONVERTED_FILES.{quote_identifier(load_table)}"
+
+    staging_columns = describe_columns(conn, load_table)
+    staged_names = {name.upper() for name, _ in staging_columns}
+    staging_columns = [(name, data_type) for name, data_type in staging_columns
+                       if name.upper() != LOAD_ORDINAL_COLUMN]
+    column_defs = ", ".join(f"{quote_identifier(name)} {data_type}" for name, data_type in staging_columns)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {target_ref} ({column_defs})")
+    target_columns = {name.upper() for name, _ in describe_columns(conn, table_name)}
+    for name, data_type in staging_columns:
+        if name.upper() not in target_columns:
+            cursor.execute(f"ALTER TABLE {target_ref} ADD COLUMN IF NOT EXISTS {quote_identifier(name)} {data_type}")
+
+    column_names = [name for name, _ in staging_columns]
+    column_list = ", ".join(quote_identifier(name) for name in column_names)
+    if load_options.mode == "append":
+        cursor.execute(f"INSERT INTO {target_ref} ({column_list}) SELECT {column_list} FROM {staging_ref}")
+        return
+
+    # Merge: key columns are matched case-insensitively against the file's columns
+    by_upper = {name.upper(): name for name in column_names}
+    missing = [key for key in load_options.merge_keys if key.upper() not in by_upper]
+    if missing:
+        raise ValueError(f"Merge key column(s) not found in the file: {', '.join(missing)}")
+    keys = [by_upper[key.upper()] for key in load_options.merge_keys]
+    key_list = ", ".join(quote_identifier(key) for key in keys)
+    on_sql = " AND ".join(f"t.{quote_identifier(key)} = s.{quote_identifier(key)}" for key in keys)
+    update_sql = ", ".join(f"t.{quote_identifier(name)} = s.{quote_identifier(name)}"
+                           for name in column_names if name not in keys)
+    insert_values = ", ".join(f"s.{quote_identifier(name)}" for name in column_names)
+    # One source row per key, otherwise MERGE fails on nondeterministic
+    # updates: the last one loaded (by file, then row within the file)
+    order_by = [f"{quote_identifier(name)} DESC" for name in ("SOURCE_FILE_NAME", LOAD_ORDINAL_COLUMN)
+                if name in staged_names]
+    cursor.execute(f"""
+        MERGE INTO {target_ref} t
+        USING (
+            SELECT {column_list} FROM {staging_ref}
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY {key_list} ORDER BY {', '.join(order_by) or key_list}) = 1
+        ) s
+        ON {on_sql}
+        {f"WHEN MATCHED THEN UPDATE SET {update_sql}" if update_sql else ""}
+        WHEN NOT MATCHED THEN INSERT ({column_list}) VALUES ({insert_values})
+    """)
+
+
+def drop_staging_table(conn, table_name, load_table):
+    """Drop a load's staging table (nothing to do for replace loads)"""
+    if load_table == table_name:
+        return
+    try:
+        conn.cursor().execute(f"DROP TABLE IF EXISTS CONVERTED_FILES.{quote_identifier(load_table)}")
+    except Exception:
+        # Called from finally blocks - don't hide the load's own error
+        pass
@@ -0,0 +1,1010 @@
+"""Loading CSV, Excel and PDF files into CONVERTED_FILES tables"""
+import codecs
+import csv
+import importlib.util
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import types
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import pandas as pd
+
+from file_extract.audit import AUDIT_LOG_INSERT_BATCH_ROWS
+from file_extract.load_modes import (
+    LOAD_ORDINAL_COLUMN, apply_load, describe_columns, describe_load, drop_staging_table, is_staging_table,
+    normalize_load_options, staging_suffix, table_kind,
+    target_table_name
+)
+from file_extract.parsers import (
+    conform_to_dtypes, iter_workbook_sheets, list_workbook_sheets, parse_sheet_to_parts, read_parts,
+    count_pdf_pages, extract_pdf_pages
+)
+from file_extract.profiling import ColumnProfiler
+from file_extract.runtime import (
+    SNOWPARK_AVAILABLE, get_active_session, add_process_log, warn, worker_thread_initializer
+)
+from file_extract.sql import (
+    clean_table_name, ensure_file_format, insert_rows, quote_identifier, sql_string_literal
+)
+from file_extract.stages import invalidate_stage_listing
+
+
+# Set FILE_EXTRACT_WAREHOUSE_PARSING=1 once stored_procedures.sql has created the
+# Python procedures to parse Excel and PDF files on warehouse compute instead of
+# downloading them
+WAREHOUSE_PARSING = os.getenv("FILE_EXTRACT_WAREHOUSE_PARSING", "").lower() in ("1", "true", "yes")
+WAREHOUSE_PARSING_PROCEDURES = {
+    '.xlsx': 'PROCESS_EXCEL_FILE_PY',
+    '.xls': 'PROCESS_EXCEL_FILE_PY',
+    '.pdf': 'PROCESS_PDF_FILE_PY',
+}
+
+# pyarrow lets the fallback load path stage DataFrames as Parquet
+PYARROW_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+
+# Server-side CSV/TXT loading: delimiters tried when sniffing a staged file's
+# header line, and how many records INFER_SCHEMA samples per file
+CSV_DELIMITER_CANDIDATES = [',', '\t', '|', ';']
+INFER_SCHEMA_SAMPLE_RECORDS = 1000
+
+# Client-side CSV/TXT parsing only sniffs the dialect and encoding on this
+# many leading bytes (and lines) before handing off to the C parser
+CSV_SNIFF_SAMPLE_BYTES = 256 * 1024
+CSV_SNIFF_SAMPLE_LINES = 200
+
+# Client-side CSV/TXT files are parsed and loaded in row chunks sized so one
+# parsed chunk stays within this memory budget
+CSV_STREAM_MEMORY_BUDGET_MB = int(os.getenv("FILE_EXTRACT_CSV_MEMORY_MB", "256"))
+CSV_MIN_CHUNK_ROWS = 1000
+# Rough ratio of a parsed DataFrame's memory to the raw CSV bytes it came from
+DATAFRAME_MEMORY_FACTOR = 5
+
+# Excel sheets are streamed in read-only mode and loaded this many rows at a time
+EXCEL_BATCH_ROWS = int(os.getenv("FILE_EXTRACT_EXCEL_BATCH_ROWS", "50000"))
+
+# Multi-sheet workbooks: sheets parsed in parallel processes, loaded on threads
+EXCEL_PARSE_PROCESSES = int(os.getenv("FILE_EXTRACT_EXCEL_PROCESSES", str(min(4, os.cpu_count() or 1))))
+EXCEL_LOAD_THREADS = 4
+
+# PDFs: pages extracted in parallel processes, PDF_PAGES_PER_TASK pages per
+# task, and written to the table PDF_BATCH_PAGES pages at a time
+PDF_PARSE_PROCESSES = int(os.getenv("FILE_EXTRACT_PDF_PROCESSES", str(min(4, os.cpu_count() or 1))))
+PDF_PAGES_PER_TASK = 25
+PDF_BATCH_PAGES = 200
+
+
+# Column profiles written at load time and read by View Tables
+TABLE_PROFILE_DDL = """
+    CREATE TABLE IF NOT EXISTS LOGS.TABLE_PROFILE (
+        TABLE_NAME VARCHAR(500) NOT NULL,
+        LOAD_TIME TIMESTAMP_NTZ NOT NULL,
+        SOURCE_FILE_NAME VARCHAR(500),
+        COLUMN_NAME VARCHAR(500) NOT NULL,
+        ORDINAL_POSITION NUMBER,
+        INFERRED_TYPE VARCHAR(50),
+        ROW_COUNT NUMBER,
+        NULL_COUNT NUMBER,
+        DISTINCT_ESTIMATE NUMBER,
+        MIN_VALUE VARCHAR(1000),
+        MAX_VALUE VARCHAR(1000)
+    )
+"""
+
+TABLE_PROFILE_COLUMNS = [
+    "TABLE_NAME", "LOAD_TIME", "SOURCE_FILE_NAME", "COLUMN_NAME", "ORDINAL_POSITION",
+    "INFERRED_TYPE", "ROW_COUNT", "NULL_COUNT", "DISTINCT_ESTIMATE", "MIN_VALUE", "MAX_VALUE"
+]
+
+
+def save_table_profile(conn, table_name, filename, profiler):
+    """Write a ColumnProfiler's results to LOGS.TABLE_PROFILE
+    
+    Profiling is best effort - a failed write is logged and never fails the load.
+    """
+    load_time = str(datetime.now())
+    rows = [
+        (table_name, load_time, filename, column["column"], column["position"], column["type"],
+         column["row_count"], column["null_count"], column["distinct"], column["min"], column["max"])
+        for column in profiler.results()
+    ]
+    try:
+        for offset in range(0, len(rows), AUDIT_LOG_INSERT_BATCH_ROWS):
+            insert_rows(conn, "LOGS.TABLE_PROFILE", TABLE_PROFILE_COLUMNS, rows[offset:offset + AUDIT_LOG_INSERT_BATCH_ROWS])
+        return True
+    except Exception as e:
+        add_process_log(f"Could not save column profile for {table_name}: {str(e)}")
+        return False
+
+
+def get_table_profile(conn, table_name, row_count, columns_info):
+    """Return the latest ingest-time profile of a table as quality metrics
+    
+    Returns None when there is no profile, or when it no longer matches the
+    table (different row count or columns), so callers can fall back to
+    scanning the table.
+    """
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT COLUMN_NAME, INFERRED_TYPE, ROW_COUNT, NULL_COUNT, DISTINCT_ESTIMATE, MIN_VALUE, MAX_VALUE, LOAD_TIME
+        FROM LOGS.TABLE_PROFILE
+        WHERE TABLE_NAME = {sql_string_literal(table_name)}
+        AND LOAD_TIME = (
+            SELECT MAX(LOAD_TIME) FROM LOGS.TABLE_PROFILE
+            WHERE TABLE_NAME = {sql_string_literal(table_name)}
+        )
+    """)
+    profile_rows = {row[0]: row for row in cursor.fetchall()}
+    if not profile_rows:
+        return None
+    
+    column_metrics = []
+    for col_name, col_type in columns_info:
+        row = profile_rows.get(col_name)
+        if row is None or row[2] != row_count:
+            return None
+        column_metrics.append({
+            "column": col_name,
+            "type": col_type,
+            "null_count": row[3],
+            "distinct": row[4],
+            "min": row[5],
+            "max": row[6],
+        })
+    
+    return {"row_count": row_count, "columns": column_metrics, "profiled_at": str(next(iter(profile_rows.values()))[7])}
+
+
+def write_dataframe_to_table(conn, df, table_name, filename, overwrite=True):
+    """Write a DataFrame to CONVERTED_FILES.<table_name>
+
+    Uses Snowpark's write_pandas when running in Snowflake, otherwise stages the
+    frame as compressed Parquet (gzip CSV without pyarrow) in PROCESSING_STAGE
+    and loads it with COPY INTO ... MATCH_BY_COLUMN_NAME. Pass overwrite=False
+    to append to a table created by an earlier call.
+    """
+    # Check if we're running in Snowflake environment
+    is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
+    
+    if is_snowflake_env and SNOWPARK_AVAILABLE:
+        # Use Snowpark's write_pandas for direct DataFrame to table
+        try:
+            session = get_active_session()
+            
+            # Write DataFrame directly to Snowflake table using Snowpark
+            session.write_pandas(
+                df,
+                table_name,
+                database="FILE_EXTRACT_DB",
+                schema="CONVERTED_FILES",
+                overwrite=overwrite,
+                auto_create_table=True,
+                table_type="transient" if is_staging_table(table_name) else ""
+            )
+            return
+        except Exception as e:
+            warn(f"Snowpark method failed for {table_name}, falling back to traditional method: {str(e)}")
+    
+    # Traditional method for local development or fallback: stage the frame
+    # compressed and COPY it in by column name
+    cursor = conn.cursor()
+    table_ref = f"CONVERTED_FILES.{quote_identifier(table_name)}"
+    
+    temp_dir = tempfile.mkdtemp()
+    staged_part = None
+    try:
+        local_path, format_name = write_dataframe_intermediate(conn, df, temp_dir)
+        staged_dir = f"PROCESSING_STAGE/{table_name}_parts"
+        staged_file = os.path.basename(local_path)
+        
+        # Upload to its own path so earlier parts aren't re-read; the file is
+        # already compressed
+        staged_part = f"{staged_dir}/{staged_file}"
+        cursor.execute(f"PUT file://{local_path} @{staged_dir} AUTO_COMPRESS=FALSE OVERWRITE=TRUE")
+        invalidate_stage_listing("PROCESSING_STAGE")
+        
+        if overwrite:
+            # Create the table from the intermediate's own column names and types
+            cursor.execute(f"""
+                CREATE OR REPLACE {table_kind(table_name)} {table_ref} USING TEMPLATE (
+                    SELECT ARRAY_AGG(OBJECT_CONSTRUCT(*)) WITHIN GROUP (ORDER BY ORDER_ID)
+                    FROM TABLE(INFER_SCHEMA(
+                        LOCATION => '@{staged_dir}/',
+                        FILES => {sql_string_literal(staged_file)},
+                        FILE_FORMAT => '{format_name}'
+                    ))
+                )
+            """)
+        
+        cursor.execute(f"""
+            COPY INTO {table_ref}
+            FROM @{staged_dir}/
+            FILES = ({sql_string_literal(staged_file)})
+            FILE_FORMAT = (FORMAT_NAME = '{format_name}')
+            MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
+            ON_ERROR = ABORT_STATEMENT
+            PURGE = TRUE
+        """)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        if staged_part:
+            # PURGE only runs when the COPY succeeds - don't leave the part behind
+            try:
+                cursor.execute(f"REMOVE @{staged_part}")
+                invalidate_stage_listing("PROCESSING_STAGE")
+            except Exception:
+                pass
+
+
+class ChunkSchema:
+    """Column types of a table loaded chunk by chunk, pinned by its first chunk
+
+    The first chunk creates the table, so its pandas dtypes decide the column
+    types. conform() coerces every later chunk to those types, and widens a
+    column to VARCHAR (in the table and in this and later chunks) when a
+    chunk's values don't fit, e.g. text at row 1500 of a numeric column.
+    """
+
+    def __init__(self, conn, table_name):
+        self.conn = conn
+        self.table_name = table_name
+        self.dtypes = None
+
+    def conform(self, df):
+        """Return df with its columns converted to the pinned types"""
+        if self.dtypes is None:
+            self.dtypes = dict(df.dtypes)
+            return df
+        df, conflicts = conform_to_dtypes(df, self.dtypes)
+        if conflicts:
+            self.widen_to_text(conflicts)
+        return df
+
+    def widen_to_text(self, columns):
+        """Change columns of the table to VARCHAR, keeping its rows and column order"""
+        add_process_log(f"Widening {', '.join(map(str, columns))} of {self.table_name} to VARCHAR for mixed-type values")
+        wanted = {str(column).upper() for column in columns}
+        select_list = ", ".join(
+            f"{quote_identifier(name)}::VARCHAR AS {quote_identifier(name)}" if name.upper() in wanted
+            else quote_identifier(name)
+            for name, _ in describe_columns(self.conn, self.table_name)
+        )
+        table_ref = f"CONVERTED_FILES.{quote_identifier(self.table_name)}"
+        # Snowflake can't ALTER a NUMBER/DATE column to VARCHAR, so rebuild the table
+        self.conn.cursor().execute(
+            f"CREATE OR REPLACE {table_kind(self.table_name)} {table_ref} AS SELECT {select_list} FROM {table_ref}"
+        )
+        for column in columns:
+            self.dtypes[column] = pd.Series(dtype=object).dtype
+
+
+def write_dataframe_intermediate(conn, df, temp_dir):
+    """Write a DataFrame to a compressed file for staging; returns (path, file format name)
+    
+    Parquet (snappy) when pyarrow is available, which keeps pandas dtypes and
+    needs no parsing on the server; gzip CSV with a header row otherwise.
+    """
+    file_stem = f"part_{time.time_ns()}_{threading.get_ident()}"
+    if PYARROW_AVAILABLE:
+        local_path = os.path.join(temp_dir, f"{file_stem}.parquet")
+        parquet_options = dict(index=False, compression="snappy", coerce_timestamps="us",
+                               allow_truncated_timestamps=True)
+        try:
+            df.to_parquet(local_path, **parquet_options)
+        except Exception:
+            # Object columns with mixed types (e.g. numbers and text in one
+            # Excel column) can't be typed by Arrow - store them as text
+            text_df = df.copy()
+            for column in text_df.columns[text_df.dtypes == object]:
+                text_df[column] = text_df[column].where(text_df[column].isna(), text_df[column].astype(str))
+            text_df.to_parquet(local_path, **parquet_options)
+        return local_path, ensure_file_format(conn, "FILE_EXTRACT_PARQUET_FORMAT", "TYPE = PARQUET")
+    
+    local_path = os.path.join(temp_dir, f"{file_stem}.csv.gz")
+    df.to_csv(local_path, index=False, compression="gzip")
+    return local_path, ensure_file_format(
+        conn,
+        "FILE_EXTRACT_GZIP_CSV_FORMAT",
+        "TYPE = CSV COMPRESSION = GZIP PARSE_HEADER = TRUE FIELD_OPTIONALLY_ENCLOSED_BY = '\"' "
+        "EMPTY_FIELD_AS_NULL = TRUE ERROR_ON_COLUMN_COUNT_MISMATCH = FALSE"
+    )
+
+
+def csv_chunk_rows(sample, memory_budget_bytes=None):
+    """Estimate how many CSV rows fit in the memory budget once parsed"""
+    if memory_budget_bytes is None:
+        memory_budget_bytes = CSV_STREAM_MEMORY_BUDGET_MB * 1024 * 1024
+    line_count = max(sample.count(b'\n'), 1)
+    avg_row_bytes = max(len(sample) / line_count, 1)
+    return max(CSV_MIN_CHUNK_ROWS, int(memory_budget_bytes / (avg_row_bytes * DATAFRAME_MEMORY_FACTOR)))
+
+
+def process_csv_file(conn, filename, file_data, progress_callback=None, load_options=None):
+    """Process CSV/TXT file and create table
+
+    file_data is either the file's bytes or the path of a local copy. The file
+    is parsed and loaded in row chunks sized to CSV_STREAM_MEMORY_BUDGET_MB, so
+    peak memory stays bounded however large the file is. progress_callback, if
+    given, is called with the number of rows loaded after each chunk.
+    load_options (a LoadOptions) chooses replace, append or merge.
+    """
+    table_name = load_table = None
+    try:
+        load_options = normalize_load_options(load_options)
+        table_name = target_table_name(filename, load_options)
+        # Append and merge load into a staging table first
+        load_table = table_name + staging_suffix(load_options)
+        
+        # Sniff delimiter, quoting, header and encoding on a bounded sample so
+        # the whole file can go through the fast C parser
+        if isinstance(file_data, (bytes, bytearray)):
+            sample = file_data[:CSV_SNIFF_SAMPLE_BYTES]
+            source = io.BytesIO(file_data)
+        else:
+            with open(file_data, 'rb') as f:
+                sample = f.read(CSV_SNIFF_SAMPLE_BYTES)
+            source = file_data
+        sniffed = sniff_csv_format(sample)
+        
+        reader = pd.read_csv(
+            source,
+            sep=sniffed['delimiter'],
+            quotechar=sniffed['quotechar'],
+            header=0 if sniffed['has_header'] else None,
+            encoding=sniffed['encoding'],
+            engine='c',
+            on_bad_lines='skip',
+            chunksize=csv_chunk_rows(sample)
+        )
+        
+        total_rows = 0
+        chunk_count = 0
+        profiler = ColumnProfiler()
+        # Later chunks are coerced to the types the first chunk gave the table
+        schema = ChunkSchema(conn, load_table)
+        with reader:
+            for df in reader:
+                if not sniffed['has_header']:
+                    df.columns = [f"COLUMN_{idx}" for idx in range(1, len(df.columns) + 1)]
+                
+                # Add source file name column
+                df['SOURCE_FILE_NAME'] = filename
+                df = schema.conform(df)
+                
+                # Profile the chunk while it's in memory
+                profiler.update(df)
+                if load_table != table_name:
+                    df[LOAD_ORDINAL_COLUMN] = range(total_rows, total_rows + len(df))
+                
+                # First chunk creates the table, the rest append to it
+                write_dataframe_to_table(conn, df, load_table, filename, overwrite=(chunk_count == 0))
+                
+                chunk_count += 1
+                total_rows += len(df)
+                if progress_callback:
+                    progress_callback(len(df))
+                if chunk_count > 1:
+                    add_process_log(f"{filename}: loaded {total_rows:,} rows so far")
+        
+        if chunk_count == 0:
+            return False, f"File {filename} contained no rows"
+        
+        apply_load(conn, table_name, load_table, load_options)
+        if load_table == table_name:
+            # An append or merge profiles just the file's rows, not the table's
+            save_table_profile(conn, table_name, filename, profiler)
+        
+        return True, f"File {filename} processed successfully ({total_rows:,} rows). {describe_load(table_name, load_options)}."
+                
+    except Exception as e:
+        return False, f"Error processing CSV file: {str(e)}"
+    finally:
+        if load_table:
+            drop_staging_table(conn, table_name, load_table)
+
+
+def line_file_format(conn):
+    """Named file format that reads a staged text file as one column per line"""
+    return ensure_file_format(
+        conn,
+        "FILE_EXTRACT_LINE_FORMAT",
+        "TYPE = CSV FIELD_DELIMITER = NONE FIELD_OPTIONALLY_ENCLOSED_BY = NONE "
+        "ESCAPE_UNENCLOSED_FIELD = NONE SKIP_BLANK_LINES = TRUE"
+    )
+
+
+def peek_stage_file_lines(conn, filename, stage_name, max_lines=5):
+    """Return the first lines of a staged text file without downloading it"""
+    line_format = line_file_format(conn)
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT $1
+        FROM @{stage_name}/{filename} (FILE_FORMAT => '{line_format}')
+        WHERE METADATA$FILE_ROW_NUMBER <= {max_lines}
+        ORDER BY METADATA$FILE_ROW_NUMBER
+    """)
+    return [row[0] for row in cursor.fetchall() if row and row[0] is not None]
+
+
+def guess_delimiter(lines):
+    """Pick the candidate delimiter that splits the header line most consistently"""
+    if not lines:
+        return ','
+    best_delimiter, best_count = ',', 0
+    for delimiter in CSV_DELIMITER_CANDIDATES:
+        count = lines[0].count(delimiter)
+        # Prefer delimiters that appear the same number of times on the next line
+        if count and len(lines) > 1 and lines[1].count(delimiter) != count:
+            count = count // 2
+        if count > best_count:
+            best_delimiter, best_count = delimiter, count
+    return best_delimiter
+
+
+def detect_text_encoding(sample):
+    """Detect the encoding of a text sample: BOMs first, then UTF-8, then Windows-1252"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    for encoding in ('utf-8', 'cp1252'):
+        try:
+            # Incremental decode so a multi-byte character cut off at the end
+            # of the sample doesn't count as invalid
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    # Latin-1 maps every byte, so it never fails
+    return 'latin-1'
+
+
+def sniff_csv_dialect(lines):
+    """Detect delimiter, quote character and header presence from sample lines"""
+    sample_text = "\n".join(lines)
+    sniffer = csv.Sniffer()
+    try:
+        dialect = sniffer.sniff(sample_text, delimiters="".join(CSV_DELIMITER_CANDIDATES))
+        delimiter, quotechar = dialect.delimiter, dialect.quotechar or '"'
+    except csv.Error:
+        delimiter, quotechar = guess_delimiter(lines), '"'
+
+    # Only trust "no header" when the first row has a numeric field - the
+    # sniffer's heuristic is unreliable for all-text data
+    has_header = True
+    try:
+        if not sniffer.has_header(sample_text) and lines:
+            first_row = next(csv.reader([lines[0]], delimiter=delimiter, quotechar=quotechar), [])
+            has_header = not any(re.fullmatch(r'\s*-?\d+(\.\d+)?\s*', field) for field in first_row)
+    except csv.Error:
+        pass
+
+    return {'delimiter': delimiter, 'quotechar': quotechar, 'has_header': has_header}
+
+
+def sniff_csv_format(sample):
+    """Detect encoding, delimiter, quote character and header from the leading bytes of a file"""
+    encoding = detect_text_encoding(sample)
+    text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(sample, final=False)
+    lines = text.splitlines()
+    # Drop the last line when the sample cut it off part way
+    if len(lines) > 1 and not text.endswith(('\n', '\r')):
+        lines = lines[:-1]
+    lines = [line for line in lines[:CSV_SNIFF_SAMPLE_LINES] if line.strip()]
+    sniffed = sniff_csv_dialect(lines)
+    sniffed['encoding'] = encoding
+    return sniffed
+
+
+def widen_inferred_type(type_name):
+    """Widen INFER_SCHEMA types so rows beyond the sample don't overflow them"""
+    match = re.match(r'NUMBER\((\d+),\s*(\d+)\)', type_name)
+    if match:
+        return f"NUMBER(38, {match.group(2)})"
+    if type_name.startswith('TEXT'):
+        return "VARCHAR"
+    return type_name
+
+
+def infer_csv_columns(conn, filenames, stage_name, delimiter, has_header=True):
+    """Return [(column_name, type), ...] INFER_SCHEMA finds in staged CSV files
+
+    Types are widened (see widen_inferred_type) since only a sample of each
+    file's records is read. Files without a header row get COLUMN_1,
+    COLUMN_2, ... like the pandas path.
+    """
+    infer_format = ensure_file_format(
+        conn,
+        f"FILE_EXTRACT_CSV_INFER_{ord(delimiter)}" + ("" if has_header else "_NO_HEADER"),
+        f"TYPE = CSV PARSE_HEADER = {'TRUE' if has_header else 'FALSE'} "
+        f"FIELD_DELIMITER = {sql_string_literal(delimiter)} "
+        "FIELD_OPTIONALLY_ENCLOSED_BY = '\"' ERROR_ON_COLUMN_COUNT_MISMATCH = FALSE"
+    )
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT COLUMN_NAME, TYPE
+        FROM TABLE(INFER_SCHEMA(
+            LOCATION => '@{stage_name}',
+            FILES => ({', '.join(sql_string_literal(filename) for filename in filenames)}),
+            FILE_FORMAT => '{infer_format}',
+            MAX_RECORDS_PER_FILE => {INFER_SCHEMA_SAMPLE_RECORDS}
+        ))
+        ORDER BY ORDER_ID
+    """)
+    columns = [(col_name, widen_inferred_type(col_type)) for col_name, col_type in cursor.fetchall()]
+    if not has_header:
+        columns = [(f"COLUMN_{idx}", col_type) for idx, (_, col_type) in enumerate(columns, 1)]
+    return columns
+
+
+def create_csv_table(conn, table_name, columns):
+    """Create (or replace) CONVERTED_FILES.<table_name> with columns plus SOURCE_FILE_NAME
+
+    Staging tables also get LOAD_ORDINAL_COLUMN, filled by copy_csv_files_into.
+    """
+    column_defs = ",\n".join(f"{quote_identifier(col_name)} {col_type}" for col_name, col_type in columns)
+    if is_staging_table(table_name):
+        column_defs += f",\n{LOAD_ORDINAL_COLUMN} NUMBER"
+    conn.cursor().execute(f"""
+        CREATE OR REPLACE {table_kind(table_name)} CONVERTED_FILES.{quote_identifier(table_name)} (
+            {column_defs},
+            SOURCE_FILE_NAME VARCHAR
+        )
+    """)
+
+
+def copy_csv_files_into(conn, table_name, column_count, filenames, stage_name, delimiter,
+                        on_error="ABORT_STATEMENT", has_header=True):
+    """COPY staged CSV files into a table made by create_csv_table and return the COPY result rows
+
+    SOURCE_FILE_NAME is filled from METADATA$FILENAME (and a staging table's
+    LOAD_ORDINAL_COLUMN from METADATA$FILE_ROW_NUMBER), and the first line is
+    skipped only when the files have a header row. Each result row is
+    (file, status, rows_parsed, rows_loaded, error_limit, errors_seen,
+    first_error, ...).
+    """
+    select_list = ", ".join(f"${idx}" for idx in range(1, column_count + 1))
+    if is_staging_table(table_name):
+        select_list += ", METADATA$FILE_ROW_NUMBER"
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        COPY INTO CONVERTED_FILES.{quote_identifier(table_name)}
+        FROM (
+            SELECT {select_list}, METADATA$FILENAME
+            FROM @{stage_name}
+        )
+        FILES = ({', '.join(sql_string_literal(filename) for filename in filenames)})
+        FILE_FORMAT = (TYPE = CSV FIELD_DELIMITER = {sql_string_literal(delimiter)} SKIP_HEADER = {1 if has_header else 0}
+                       FIELD_OPTIONALLY_ENCLOSED_BY = '"' EMPTY_FIELD_AS_NULL = TRUE
+                       ERROR_ON_COLUMN_COUNT_MISMATCH = FALSE)
+        ON_ERROR = {on_error}
+    """)
+    return cursor.fetchall()
+
+
+def load_csv_from_stage(conn, filename, stage_name="PROCESSING_STAGE", delimiter=None, progress_callback=None,
+                        load_options=None, has_header=None):
+    """Load a staged CSV/TXT file into a table entirely inside Snowflake
+
+    Infers the schema with INFER_SCHEMA on a sample of records, creates the
+    table and runs COPY INTO straight from the staged file, adding
+    SOURCE_FILE_NAME from METADATA$FILENAME. No file bytes come back to the app.
+    delimiter and has_header are sniffed from the file's first lines unless given.
+    progress_callback, if given, is called with the number of rows loaded.
+    load_options (a LoadOptions) chooses replace, append or merge.
+    """
+    table_name = load_table = None
+    try:
+        load_options = normalize_load_options(load_options)
+        table_name = target_table_name(filename, load_options)
+        # Append and merge COPY into a staging table first
+        load_table = table_name + staging_suffix(load_options)
+
+        if delimiter is None or has_header is None:
+            dialect = sniff_csv_dialect(peek_stage_file_lines(conn, filename, stage_name))
+            delimiter = dialect['delimiter'] if delimiter is None else delimiter
+            has_header = dialect['has_header'] if has_header is None else has_header
+        inferred_columns = infer_csv_columns(conn, [filename], stage_name, delimiter, has_header)
+        if not inferred_columns:
+            return False, f"Could not infer a schema for {filename}"
+
+        create_csv_table(conn, load_table, inferred_columns)
+        copy_results = copy_csv_files_into(conn, load_table, len(inferred_columns), [filename], stage_name, delimiter,
+                                           has_header=has_header)
+        # COPY result rows: file, status, rows_parsed, rows_loaded, ...
+        rows_loaded = sum(row[3] or 0 for row in copy_results if row and len(row) > 3)
+        apply_load(conn, table_name, load_table, load_options)
+        if progress_callback:
+            progress_callback(rows_loaded)
+
+        return True, f"File {filename} loaded server-side ({rows_loaded:,} rows). {describe_load(table_name, load_options)}."
+    except Exception as e:
+        return False, f"Error loading CSV file server-side: {str(e)}"
+    finally:
+        if load_table:
+            drop_staging_table(conn, table_name, load_table)
+
+
+# Set once the parsing procedures turn out to be missing so the remaining files
+# in this run go straight to client-side parsing
+warehouse_parsing_unavailable = False
+
+
+def warehouse_parsing_enabled(filename):
+    """True if filename should be parsed by a stored procedure in the warehouse"""
+    return (WAREHOUSE_PARSING and not warehouse_parsing_unavailable
+            and Path(filename).suffix.lower() in WAREHOUSE_PARSING_PROCEDURES)
+
+
+def process_file_in_warehouse(conn, filename, stage_name="PROCESSING_STAGE", progress_callback=None,
+                              load_options=None):
+    """Parse a staged Excel or PDF file with its Snowpark stored procedure
+
+    The procedure reads the file from the stage and writes the same
+    CONVERTED_FILES tables as process_excel_file / process_pdf_file, so the
+    file never has to be downloaded. For append and merge loads it writes
+    staging tables (its tables plus a suffix) which are then applied to the
+    targets here. Returns (success, message).
+    """
+    global warehouse_parsing_unavailable
+    procedure = WAREHOUSE_PARSING_PROCEDURES[Path(filename).suffix.lower()]
+    staged_tables = []
+    suffix = ""
+    try:
+        load_options = normalize_load_options(load_options)
+        suffix = staging_suffix(load_options)
+        cursor = conn.cursor()
+        cursor.execute(f"CALL {procedure}({sql_string_literal(stage_name)}, {sql_string_literal(filename)}, "
+                       f"{sql_string_literal(target_table_name(filename, load_options))}, {sql_string_literal(suffix)})")
+        row = cursor.fetchone()
+        result = row[0] if row else None
+        if isinstance(result, str):
+            result = json.loads(result)
+        if not result:
+            return False, f"{procedure} returned no result for {filename}"
+        staged_tables = result.get("tables") or []
+        if not result.get("success"):
+            return False, result.get("message", "")
+        message = result.get("message", "")
+        if suffix:
+            targets = [table[:-len(suffix)] for table in staged_tables]
+            for target, staged in zip(targets, staged_tables):
+                apply_load(conn, target, staged, load_options)
+            message = (f"File {filename} processed successfully in the warehouse ({result.get('rows') or 0:,} rows). "
+                       + "; ".join(describe_load(target, load_options) for target in targets) + ".")
+        if progress_callback:
+            progress_callback(result.get("rows") or 0)
+        return True, message
+    except Exception as e:
+        error_msg = str(e).lower()
+        if "does not exist" in error_msg or "not authorized" in error_msg:
+            warehouse_parsing_unavailable = True
+        return False, f"Error calling {procedure}: {str(e)}"
+    finally:
+        for staged in staged_tables:
+            if suffix and staged.endswith(suffix):
+                drop_staging_table(conn, staged[:-len(suffix)], staged)
+
+
+def load_sheet_batches(conn, filename, table_name, batches, progress_callback=None, load_options=None):
+    """Load an iterable of DataFrame batches into one table and return the row count
+
+    The first non-empty batch creates the table and the rest append to it
+    (for append and merge loads, a staging table that is then applied to
+    table_name). Each batch is profiled as it's loaded, and for replace loads
+    the profile is saved to LOGS.TABLE_PROFILE.
+    """
+    load_table = table_name + staging_suffix(load_options)
+    sheet_rows = 0
+    profiler = ColumnProfiler()
+    # Later batches are coerced to the types the first batch gave the table
+    schema = ChunkSchema(conn, load_table)
+    try:
+        for df in batches:
+            # Skip empty batches
+            if df.empty:
+                continue
+            
+            # Add source file name column
+            df['SOURCE_FILE_NAME'] = filename
+            df = schema.conform(df)
+            profiler.update(df)
+            if load_table != table_name:
+                df[LOAD_ORDINAL_COLUMN] = range(sheet_rows, sheet_rows + len(df))
+            
+            write_dataframe_to_table(conn, df, load_table, filename, overwrite=(sheet_rows == 0))
+            
+            sheet_rows += len(df)
+            if progress_callback:
+                progress_callback(len(df))
+        
+        if sheet_rows > 0:
+            apply_load(conn, table_name, load_table, load_options)
+            if load_table == table_name:
+                # An append or merge profiles just the file's rows, not the table's
+                save_table_profile(conn, table_name, filename, profiler)
+    finally:
+        drop_staging_table(conn, table_name, load_table)
+    return sheet_rows
+
+
+def parser_process_context():
+    """Return the multiprocessing context for Excel and PDF parser processes
+
+    The parent runs threads (Streamlit's, the connector's, our thread pools),
+    and a forked child can deadlock on a lock one of them held. Workers are
+    started from a forkserver instead, or spawned where there is none; the
+    forkserver preloads file_extract.parsers so each worker starts with
+    pandas, openpyxl and PyPDF2 imported. Start the workers inside
+    parser_processes_starting().
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(["file_extract.parsers"])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+# Held while __main__ is swapped out for starting parser processes
+parser_start_lock = threading.Lock()
+
+
+@contextmanager
+def parser_processes_starting():
+    """Hide __main__ from parser processes started (pool tasks submitted) in this block
+
+    Forkserver and spawned children re-import the parent's __main__ before
+    their first task. Under Streamlit that is the app script itself, which
+    would re-run in every worker, so an empty module stands in for it while
+    the workers start.
+    """
+    with parser_start_lock:
+        main_module = sys.modules.get('__main__')
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            yield
+        finally:
+            sys.modules['__main__'] = main_module
+
+
+def load_excel_sheets_in_parallel(conn, filename, workbook_path, work_dir, progress_callback=None,
+                                  load_options=None):
+    """Parse sheets in a process pool and load them concurrently
+
+    Each sheet is parsed by its own worker process into pickled batches (so
+    CPU-bound parsing isn't serialised by the GIL), and as soon as a sheet is
+    parsed its batches are loaded on a thread pool. Returns a list of
+    (table_name, row_count) in sheet order.
+    """
+    base_table_name = target_table_name(filename, load_options)
+    sheet_names = list_workbook_sheets(workbook_path)
+    table_names = [f"{base_table_name}_{clean_table_name(sheet_name)}" for sheet_name in sheet_names]
+    
+    sheet_rows = {}
+    process_count = max(1, min(EXCEL_PARSE_PROCESSES, len(sheet_names)))
+    with ProcessPoolExecutor(max_workers=process_count, mp_context=parser_process_context()) as parsers, \
+            ThreadPoolExecutor(max_workers=EXCEL_LOAD_THREADS, initializer=worker_thread_initializer()) as loaders:
+        with parser_processes_starting():
+            parse_futures = {
+                parsers.submit(parse_sheet_to_parts, workbook_path, sheet_name, work_dir, f"sheet{idx:04d}",
+                               EXCEL_BATCH_ROWS): idx
+                for idx, sheet_name in enumerate(sheet_names)
+            }
+        load_futures = {}
+        for future in as_completed(parse_futures):
+            idx = parse_futures[future]
+            load_futures[idx] = loaders.submit(
+                load_sheet_batches, conn, filename, table_names[idx], read_parts(future.result()), progress_callback,
+                load_options
+            )
+        for idx, future in load_futures.items():
+            sheet_rows[idx] = future.result()
+    
+    return [(table_names[idx], sheet_rows[idx]) for idx in range(len(sheet_names))]
+
+
+def process_excel_file(conn, filename, file_data, progress_callback=None, load_options=None):
+    """Process Excel file and create a table for each sheet
+
+    file_data is either the file's bytes or the path of a local copy. Each
+    sheet is streamed in batches of EXCEL_BATCH_ROWS rows: the first batch
+    creates the table and the rest append to it, so memory stays flat however
+    large the sheet is. Multi-sheet .xlsx workbooks are parsed in a process
+    pool and their sheets loaded concurrently. progress_callback, if given, is
+    called with the number of rows loaded after each batch. load_options (a
+    LoadOptions) chooses replace, append or merge, per sheet table.
+    """
+    work_dir = tempfile.mkdtemp()
+    try:
+        load_options = normalize_load_options(load_options)
+        sheet_results = None
+        
+        if Path(filename).suffix.lower() == '.xlsx' and EXCEL_PARSE_PROCESSES > 1:
+            # Worker processes need the workbook on disk
+            workbook_path = file_data
+            if isinstance(file_data, (bytes, bytearray)):
+                workbook_path = os.path.join(work_dir, "workbook.xlsx")
+                with open(workbook_path, 'wb') as f:
+                    f.write(file_data)
+            
+            if len(list_workbook_sheets(workbook_path)) > 1:
+                try:
+                    sheet_results = load_excel_sheets_in_parallel(conn, filename, workbook_path, work_dir,
+                                                                  progress_callback, load_options)
+                except (OSError, NotImplementedError, BrokenProcessPool) as pool_error:
+                    # Process pools can be unavailable in restricted containers
+                    add_process_log(f"Parallel sheet parsing unavailable for {filename}, parsing sheets one at a time: {str(pool_error)}")
+        
+        if sheet_results is None:
+            base_table_name = target_table_name(filename, load_options)
+            sheet_results = []
+            
+            # Process each sheet
+            for sheet_name, batches in iter_workbook_sheets(file_data, filename, EXCEL_BATCH_ROWS):
+                # Create table name: {filename}_{sheetname}
+                table_name = f"{base_table_name}_{clean_table_name(sheet_name)}"
+                sheet_results.append((table_name, load_sheet_batches(conn, filename, table_name, batches,
+                                                                     progress_callback, load_options)))
+        
+        if not sheet_results:
+            return False, f"Excel file {filename} contains no sheets"
+        
+        # Skip empty sheets
+        processed_tables = [table_name for table_name, sheet_rows in sheet_results if sheet_rows > 0]
+        
+        if processed_tables:
+            tables_str = ", ".join(processed_tables)
+            if load_options.mode != "replace":
+                loads_str = "; ".join(describe_load(table_name, load_options) for table_name in processed_tables)
+                return True, f"File {filename} processed successfully. {loads_str}."
+            return True, f"File {filename} processed successfully. Created {len(processed_tables)} table(s): {tables_str}"
+        else:
+            return False, f"File {filename} contained no data in any sheet"
+                
+    except Exception as e:
+        return False, f"Error processing Excel file: {str(e)}\n{traceback.format_exc()}"
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def iter_pdf_page_results(pdf_path, page_count):
+    """Yield lists of (page_number, text, tables) covering every page of a PDF
+
+    Page ranges of PDF_PAGES_PER_TASK pages are extracted in a process pool
+    and yielded as they finish (not in page order). Falls back to extracting
+    the remaining ranges in this process when a pool can't be used.
+    """
+    page_ranges = [(first, min(first + PDF_PAGES_PER_TASK, page_count))
+                   for first in range(0, page_count, PDF_PAGES_PER_TASK)]
+    completed = set()
+    
+    if PDF_PARSE_PROCESSES > 1 and len(page_ranges) > 1:
+        try:
+            process_count = min(PDF_PARSE_PROCESSES, len(page_ranges))
+            with ProcessPoolExecutor(max_workers=process_count, mp_context=parser_process_context()) as pool:
+                with parser_processes_starting():
+                    futures = {pool.submit(extract_pdf_pages, pdf_path, first, last): (first, last)
+                               for first, last in page_ranges}
+                for future in as_completed(futures):
+                    page_results = future.result()
+                    completed.add(futures[future])
+                    yield page_results
+        except (OSError, NotImplementedError, BrokenProcessPool) as pool_error:
+            # Process pools can be unavailable in restricted containers
+            add_process_log(f"Parallel page extraction unavailable, extracting pages one range at a time: {str(pool_error)}")
+    
+    for first, last in page_ranges:
+        if (first, last) not in completed:
+            yield extract_pdf_pages(pdf_path, first, last)
+
+
+def process_pdf_file(conn, filename, file_data, progress_callback=None, load_options=None):
+    """Process PDF file and extract its text and tables into tables
+
+    file_data is either the file's bytes or the path of a local copy. Each
+    page's text goes into CONVERTED_FILES.<name> (PAGE_NUMBER, PAGE_TEXT,
+    SOURCE_FILE_NAME), and table-like blocks detected in the text go into
+    CONVERTED_FILES.<name>_TABLES with one row per table row. Pages are
+    extracted in a process pool and written in batches of PDF_BATCH_PAGES
+    pages, so memory stays bounded for large documents. progress_callback, if
+    given, is called with the number of pages loaded after each batch.
+    load_options (a LoadOptions) chooses replace, append or merge.
+    """
+    work_dir = tempfile.mkdtemp()
+    table_name = tables_table_name = None
+    try:
+        load_options = normalize_load_options(load_options)
+        cursor = conn.cursor()
+        table_name = target_table_name(filename, load_options)
+        tables_table_name = f"{table_name}_TABLES"
+        # Append and merge load into staging tables first
+        suffix = staging_suffix(load_options)
+        load_table = table_name + suffix
+        tables_load_table = tables_table_name + suffix
+        
+        # Worker processes need the PDF on disk
+        pdf_path = file_data
+        if isinstance(file_data, (bytes, bytearray)):
+            pdf_path = os.path.join(work_dir, "document.pdf")
+            with open(pdf_path, 'wb') as f:
+                f.write(file_data)
+        
+        page_count = count_pdf_pages(pdf_path)
+        if page_count == 0:
+            return False, f"PDF file {filename} contains no pages"
+        
+        page_rows = []
+        table_rows = []
+        pages_loaded = 0
+        table_rows_loaded = 0
+        
+        def flush_pages():
+            nonlocal pages_loaded
+            if page_rows:
+                df = pd.DataFrame(page_rows, columns=["PAGE_NUMBER", "PAGE_TEXT", "SOURCE_FILE_NAME"])
+                if load_table != table_name:
+                    # Pages finish out of order, so number rows by position in the document
+                    df[LOAD_ORDINAL_COLUMN] = df["PAGE_NUMBER"]
+                write_dataframe_to_table(conn, df, load_table, filename, overwrite=(pages_loaded == 0))
+                pages_loaded += len(df)
+                if progress_callback:
+                    progress_callback(len(df))
+                page_rows.clear()
+        
+        def flush_table_rows():
+            nonlocal table_rows_loaded
+            if table_rows:
+                df = pd.DataFrame(table_rows, columns=["PAGE_NUMBER", "TABLE_INDEX", "ROW_INDEX", "ROW_CELLS", "SOURCE_FILE_NAME"])
+                if tables_load_table != tables_table_name:
+                    df[LOAD_ORDINAL_COLUMN] = (df["PAGE_NUMBER"] * 1000 + df["TABLE_INDEX"]) * 1000000 + df["ROW_INDEX"]
+                write_dataframe_to_table(conn, df, tables_load_table, filename, overwrite=(table_rows_loaded == 0))
+                table_rows_loaded += len(df)
+                table_rows.clear()
+        
+        table_count = 0
+        for page_results in iter_pdf_page_results(pdf_path, page_count):
+            for page_number, text, tables in page_results:
+                page_rows.append((page_number, text, filename))
+                table_count += len(tables)
+                for table_idx, table in enumerate(tables, 1):
+                    for row_idx, cells in enumerate(table, 1):
+                        table_rows.append((page_number, table_idx, row_idx, json.dumps(cells), filename))
+            if len(page_rows) >= PDF_BATCH_PAGES:
+                flush_pages()
+            if len(table_rows) >= PDF_BATCH_PAGES * 10:
+                flush_table_rows()
+        flush_pages()
+        flush_table_rows()
+        apply_load(conn, table_name, load_table, load_options)
+        
+        message = f"File {filename} processed successfully. Extracted {pages_loaded} page(s) into table {table_name}"
+        if table_rows_loaded:
+            apply_load(conn, tables_table_name, tables_load_table, load_options)
+            message += f" and {table_count} detected table(s) into {tables_table_name}"
+        elif load_options.mode == "replace":
+            # Don't leave tables from an earlier load of this file behind
+            cursor.execute(f"DROP TABLE IF EXISTS CONVERTED_FILES.{quote_identifier(tables_table_name)}")
+        if load_options.mode != "replace":
+            message += f" ({describe_load(table_name, load_options)})"
+        return True, message + "."
+        
+    except Exception as e:
+        return False, f"Error processing PDF file: {str(e)}"
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if table_name and load_options.mode != "replace":
+            drop_staging_table(conn, table_name, load_table)
+            drop_staging_table(conn, tables_table_name, tables_load_table)
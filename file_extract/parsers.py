@@ -0,0 +1,215 @@
+"""File parsing helpers that run without Streamlit or a Snowflake session
+
+These live outside app.py so ProcessPoolExecutor workers can import them.
+"""
+import io
+import os
+import re
+from pathlib import Path
+
+import openpyxl
+import pandas as pd
+from PyPDF2 import PdfReader
+
+
+def excel_header(row):
+    """Build unique column names from a worksheet header row, like pandas does"""
+    values = list(row)
+    # Drop trailing empty header cells left behind by formatting
+    while values and values[-1] is None:
+        values.pop()
+    header = []
+    seen = {}
+    for idx, value in enumerate(values):
+        name = f"Unnamed: {idx}" if value is None else str(value)
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        header.append(name)
+    return header
+
+
+def iter_worksheet_batches(worksheet, batch_rows):
+    """Yield DataFrames of up to batch_rows rows from a read-only worksheet
+
+    The first non-empty row is the header and fully empty rows are skipped,
+    matching pd.read_excel. Only one batch of rows is held in memory at a time.
+    """
+    # Read-only sheets trust the stored dimensions, which are often wrong
+    worksheet.reset_dimensions()
+    header = None
+    batch = []
+    for row in worksheet.iter_rows(values_only=True):
+        if all(value is None for value in row):
+            continue
+        if header is None:
+            header = excel_header(row)
+            width = len(header)
+            continue
+        batch.append(tuple(row[:width]) + (None,) * max(0, width - len(row)))
+        if len(batch) >= batch_rows:
+            yield pd.DataFrame(batch, columns=header)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch, columns=header)
+
+
+def iter_workbook_sheets(file_data, filename, batch_rows):
+    """Yield (sheet_name, batch_iterator) for every sheet in an Excel workbook
+
+    file_data is either the file's bytes or the path of a local copy. .xlsx
+    files are read with openpyxl in read-only mode so rows are streamed;
+    legacy .xls files can't be, so each of their sheets is one batch.
+    """
+    source = io.BytesIO(file_data) if isinstance(file_data, (bytes, bytearray)) else file_data
+
+    if Path(filename).suffix.lower() == '.xls':
+        excel_file = pd.ExcelFile(source)
+        for sheet_name in excel_file.sheet_names:
+            yield sheet_name, iter([pd.read_excel(excel_file, sheet_name=sheet_name)])
+        return
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            yield worksheet.title, iter_worksheet_batches(worksheet, batch_rows)
+    finally:
+        workbook.close()
+
+
+def list_workbook_sheets(workbook_path):
+    """Return the sheet names of an .xlsx workbook without reading any rows"""
+    workbook = openpyxl.load_workbook(workbook_path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+
+def parse_sheet_to_parts(workbook_path, sheet_name, out_dir, part_prefix, batch_rows):
+    """Parse one worksheet into pickled DataFrame parts of up to batch_rows rows
+
+    Runs in a worker process: the parsed batches are written to out_dir rather
+    than returned, so the parent never has to hold a whole sheet. Returns the
+    part paths in row order.
+    """
+    workbook = openpyxl.load_workbook(workbook_path, read_only=True, data_only=True)
+    try:
+        part_paths = []
+        for batch_idx, df in enumerate(iter_worksheet_batches(workbook[sheet_name], batch_rows)):
+            part_path = os.path.join(out_dir, f"{part_prefix}_{batch_idx:05d}.pkl")
+            df.to_pickle(part_path)
+            part_paths.append(part_path)
+        return part_paths
+    finally:
+        workbook.close()
+
+
+def read_parts(part_paths):
+    """Yield the DataFrames saved by parse_sheet_to_parts, deleting each part once read"""
+    for part_path in part_paths:
+        df = pd.read_pickle(part_path)
+        os.remove(part_path)
+        yield df
+
+
+def text_values(series):
+    """A column as text, keeping nulls"""
+    return series.where(series.isna(), series.astype(str)).astype(object)
+
+
+def coerce_to_dtype(series, dtype):
+    """Convert a later chunk's column to the type pinned by the first chunk
+
+    Returns None when its values don't fit that type (e.g. text in a numeric
+    column, or fractions in an integer column).
+    """
+    if dtype.kind == 'O':
+        return text_values(series)
+    if dtype.kind in 'iuf':
+        values = pd.to_numeric(series, errors='coerce')
+        if (values.isna() & series.notna()).any():
+            return None
+        if dtype.kind == 'f':
+            return values.astype('float64')
+        if (values.dropna() % 1 != 0).any():
+            return None
+        # Nullable, so chunks with empty cells keep the integer type
+        return values.astype('Int64')
+    if dtype.kind == 'b':
+        if series.dtype.kind == 'b' or set(series.dropna().unique()) <= {True, False}:
+            return series.astype('boolean')
+        return None
+    if dtype.kind == 'M':
+        values = pd.to_datetime(series, errors='coerce')
+        if (values.isna() & series.notna()).any():
+            return None
+        return values
+    try:
+        return series.astype(dtype)
+    except (TypeError, ValueError):
+        return None
+
+
+def conform_to_dtypes(df, dtypes):
+    """Return a copy of df with its columns converted to dtypes (column -> dtype)
+
+    Used to keep a table's later chunks at the types its first chunk gave it.
+    Columns whose values don't fit their type become text instead; returns
+    (df, conflicts) with those columns listed in conflicts.
+    """
+    df = df.copy()
+    conflicts = []
+    for column in df.columns:
+        if column not in dtypes:
+            continue
+        coerced = coerce_to_dtype(df[column], dtypes[column])
+        if coerced is None:
+            conflicts.append(column)
+            df[column] = text_values(df[column])
+        else:
+            df[column] = coerced
+    return df, conflicts
+
+
+def count_pdf_pages(pdf_path):
+    """Return the number of pages in a PDF"""
+    return len(PdfReader(pdf_path).pages)
+
+
+def detect_text_tables(text):
+    """Find table-like blocks in extracted page text
+
+    A line counts as a table row when it splits on tabs or runs of 2+ spaces
+    into at least two cells; two or more consecutive rows with the same number
+    of cells form a table. Returns a list of tables, each a list of rows.
+    """
+    tables = []
+    current = []
+    for line in text.splitlines():
+        cells = [cell.strip() for cell in re.split(r'\t|\s{2,}', line.strip()) if cell.strip()]
+        if len(cells) >= 2 and (not current or len(cells) == len(current[0])):
+            current.append(cells)
+            continue
+        if len(current) >= 2:
+            tables.append(current)
+        current = [cells] if len(cells) >= 2 else []
+    if len(current) >= 2:
+        tables.append(current)
+    return tables
+
+
+def extract_pdf_pages(pdf_path, first_page, last_page):
+    """Extract text and detected tables for pages [first_page, last_page)
+
+    Runs in a worker process. Returns a list of (page_number, text, tables)
+    with 1-based page numbers.
+    """
+    reader = PdfReader(pdf_path)
+    results = []
+    for page_idx in range(first_page, last_page):
+        text = reader.pages[page_idx].extract_text() or ""
+        results.append((page_idx + 1, text, detect_text_tables(text)))
+    return results
@@ -0,0 +1,573 @@
+"""The RAW -> PROCESSING -> COMPLETED/ERROR processing workflow
+
+process_file runs one staged file through the whole workflow and
+process_files_concurrently runs many on a thread pool; process_files_in_batches
+bulk-loads groups of small same-schema files first. None of them depend on
+Streamlit, so the app, the CLI (python -m file_extract) and scheduled jobs all
+share them.
+"""
+import shutil
+import tempfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+
+from file_extract.audit import log_operation
+from file_extract.file_groups import BATCH_LOAD_MIN_FILES, load_file_group, plan_file_groups
+from file_extract.load_modes import normalize_load_options, target_table_name
+from file_extract.loaders import (
+    TABLE_PROFILE_DDL, load_csv_from_stage, process_csv_file, process_excel_file, process_pdf_file,
+    process_file_in_warehouse, warehouse_parsing_enabled
+)
+from file_extract.registry import (
+    CONTENT_REGISTRY_DDL, CONTENT_REGISTRY_UPGRADE, find_already_loaded, hash_file_content, lookup_uploaded_hash,
+    lookup_uploaded_hashes, register_file_contents
+)
+from file_extract.runtime import add_process_log, warn, worker_thread_initializer
+from file_extract.stages import (
+    download_file_from_stage, download_file_from_stage_to_path, get_stage_file_md5s, get_stage_files,
+    move_file_between_stages, move_files_between_stages, transfer_file_between_stages
+)
+from file_extract.work_queue import FILE_WORK_QUEUE_DDL, FileWorkQueue, USE_WORK_QUEUE
+
+
+# Number of files processed concurrently by "Process All Files"
+DEFAULT_PROCESS_WORKERS = 4
+MAX_PROCESS_WORKERS = 16
+
+# Schemas and log tables every entry point needs, created in this order
+SETUP_STATEMENTS = [
+    "CREATE SCHEMA IF NOT EXISTS CONVERTED_FILES",
+    "CREATE SCHEMA IF NOT EXISTS LOGS",
+    TABLE_PROFILE_DDL,
+    CONTENT_REGISTRY_DDL,
+    CONTENT_REGISTRY_UPGRADE,
+    FILE_WORK_QUEUE_DDL,
+]
+
+
+def ensure_schemas(conn):
+    """Create the CONVERTED_FILES and LOGS schemas and the LOGS tables if missing
+
+    Each statement is tried on its own, since creation can fail for lack of
+    privileges on objects that already exist. Returns the error messages.
+    """
+    errors = []
+    cursor = conn.cursor()
+    for statement in SETUP_STATEMENTS:
+        try:
+            cursor.execute(statement)
+        except Exception as e:
+            errors.append(str(e))
+    return errors
+
+
+def skip_loaded_file(conn, filename, source_stage, table_name, loaded, start_time):
+    """Move a file whose content table_name already holds to COMPLETED_STAGE and log it as SKIPPED
+
+    loaded is the (loaded_from_filename, registered_at) find_already_loaded
+    found. Returns the message logged.
+    """
+    loaded_from, loaded_at = loaded
+    move_result = transfer_file_between_stages(conn, filename, source_stage, "COMPLETED_STAGE")
+    message = (f"File {filename} skipped - identical content (from {loaded_from}) "
+               f"was already loaded into {table_name} at {str(loaded_at)[:19]}")
+    end_time = datetime.now()
+    log_operation(conn, "PROCESS", filename, source_stage, "COMPLETED_STAGE", "SKIPPED",
+                 start_time, end_time, error_message=message, table_name=table_name)
+    add_process_log(f"⏭️ {message}")
+    if not move_result['success']:
+        add_process_log(f"{filename}: {move_result['message']}")
+    return message
+
+
+def process_file(conn, filename, progress_callback=None, source_stage="RAW_STAGE", load_options=None):
+    """Process file and convert to table - follows RAW -> PROCESSING -> COMPLETED/ERROR flow
+
+    progress_callback, if given, is called with the number of rows loaded as
+    each chunk of the file lands in its table. source_stage is the stage the
+    file is picked up from. load_options (a LoadOptions) chooses whether the
+    file replaces its table or is appended or merged into it.
+    """
+    start_time = datetime.now()
+    table_name = None
+    work_dir = None
+    rows_loaded = 0
+    
+    def report_rows(row_count):
+        nonlocal rows_loaded
+        rows_loaded += row_count
+        if progress_callback:
+            progress_callback(row_count)
+    
+    # Bad options are the caller's mistake, not the file's - raise before it moves
+    load_options = normalize_load_options(load_options)
+    try:
+        # Log process start
+        log_operation(conn, "PROCESS", filename, source_stage, None, "STARTED", start_time)
+        add_process_log(f"Started processing {filename}")
+        
+        # Step 0: Skip files whose exact content already backs their table.
+        # The uploaded hash only counts if the staged file is still the one
+        # that was uploaded (same MD5 as at upload)
+        content_sha256 = None
+        try:
+            staged_md5 = get_stage_file_md5s(conn, [filename], source_stage).get(filename)
+            content_sha256 = lookup_uploaded_hash(conn, filename, staged_md5)
+            already_loaded = (find_already_loaded(conn, [(filename, content_sha256)], load_options)
+                              if content_sha256 else {})
+        except Exception as registry_error:
+            already_loaded = {}
+            add_process_log(f"Content registry unavailable for {filename}: {str(registry_error)}")
+        if filename in already_loaded:
+            table_name = target_table_name(filename, load_options)
+            return True, skip_loaded_file(conn, filename, source_stage, table_name, already_loaded[filename], start_time)
+        
+        # Step 1: Move file from the source stage (normally RAW_STAGE) to PROCESSING_STAGE
+        add_process_log(f"Moving {filename} to processing stage...")
+        move_result = transfer_file_between_stages(conn, filename, source_stage, "PROCESSING_STAGE")
+        move_success, move_message = move_result['success'], move_result['message']
+        if not move_success:
+            end_time = datetime.now()
+            log_operation(conn, "PROCESS", filename, source_stage, "PROCESSING_STAGE", "FAILED", 
+                         start_time, end_time, error_message=move_message)
+            add_process_log(f"❌ Failed to move {filename}: {move_message}")
+            return False, f"Failed to move file to processing stage: {move_message}"
+        
+        add_process_log(f"{filename}: {move_message}")
+        
+        # Get file extension
+        file_ext = Path(filename).suffix.lower()
+        
+        bytes_saved = 0
+        file_data = move_result['data']
+        
+        # Step 2: CSV/TXT files are loaded server-side with COPY INTO first (and
+        # Excel/PDF parsed by stored procedures when enabled); the bytes are
+        # only needed if that fails
+        server_side_loaded = False
+        if file_ext in ['.csv', '.txt']:
+            add_process_log(f"Loading {filename} server-side with COPY INTO...")
+            success, message = load_csv_from_stage(conn, filename, "PROCESSING_STAGE", progress_callback=report_rows,
+                                                   load_options=load_options)
+            if success:
+                server_side_loaded = True
+                add_process_log(f"{filename}: {message}")
+            else:
+                add_process_log(f"Server-side load failed for {filename}, falling back to pandas: {message}")
+        elif warehouse_parsing_enabled(filename):
+            add_process_log(f"Parsing {filename} in the warehouse...")
+            success, message = process_file_in_warehouse(conn, filename, "PROCESSING_STAGE", progress_callback=report_rows,
+                                                         load_options=load_options)
+            if success:
+                server_side_loaded = True
+                add_process_log(f"{filename}: {message}")
+            else:
+                add_process_log(f"Warehouse parsing failed for {filename}, parsing it here instead: {message}")
+        
+        # Step 3: Get the file bytes - reuse them if the move already brought them
+        # down, so each file crosses the network at most once per run
+        file_source = file_data
+        if server_side_loaded:
+            pass
+        elif file_data is not None:
+            bytes_saved += len(file_data)
+            add_process_log(f"Reusing {len(file_data):,} bytes of {filename} from the move (skipped download)")
+        else:
+            try:
+                add_process_log(f"Downloading {filename} from processing stage...")
+                if file_ext in ['.csv', '.txt', '.xlsx', '.xls', '.pdf']:
+                    # Keep files on disk so they can be streamed in chunks
+                    work_dir = tempfile.mkdtemp()
+                    file_source = download_file_from_stage_to_path(conn, filename, "PROCESSING_STAGE", work_dir)
+                else:
+                    file_data = file_source = download_file_from_stage(conn, filename, "PROCESSING_STAGE")
+                add_process_log(f"Downloaded {filename} successfully")
+            except Exception as e:
+                # Move to error stage if download fails
+                move_file_between_stages(conn, filename, "PROCESSING_STAGE", "ERROR_STAGE")
+                add_process_log(f"❌ Failed to download {filename}: {str(e)}")
+                return False, f"Error downloading file from processing stage: {str(e)}"
+        
+        # Step 4: Process based on file type
+        if not server_side_loaded:
+            add_process_log(f"Processing {filename} as {file_ext} file...")
+        try:
+            if server_side_loaded:
+                pass
+            elif file_ext in ['.csv', '.txt']:
+                success, message = process_csv_file(conn, filename, file_source, progress_callback=report_rows,
+                                                    load_options=load_options)
+            elif file_ext in ['.xlsx', '.xls']:
+                success, message = process_excel_file(conn, filename, file_source, progress_callback=report_rows,
+                                                      load_options=load_options)
+            elif file_ext == '.pdf':
+                success, message = process_pdf_file(conn, filename, file_source, progress_callback=report_rows,
+                                                    load_options=load_options)
+            else:
+                success = False
+                message = f"Unsupported file type: {file_ext}"
+            
+            # Step 5: Move to appropriate stage based on success
+            if success:
+                add_process_log(f"Moving {filename} to completed stage...")
+                move_result = transfer_file_between_stages(conn, filename, "PROCESSING_STAGE", "COMPLETED_STAGE", file_data)
+                bytes_saved += move_result['bytes_reused']
+                add_process_log(f"{filename}: {move_result['message']}")
+                if bytes_saved:
+                    add_process_log(f"{filename}: saved {bytes_saved:,} bytes of redundant downloads")
+                end_time = datetime.now()
+                table_name = target_table_name(filename, load_options)
+                log_operation(conn, "PROCESS", filename, source_stage, "COMPLETED_STAGE", "SUCCESS", 
+                             start_time, end_time, rows_processed=rows_loaded or None, table_name=table_name)
+                
+                # Record what content the table now holds; hash locally only
+                # when the upload didn't register it (e.g. files staged outside the app)
+                if content_sha256 is None and file_source is None:
+                    # Loaded server-side, so the bytes were never downloaded
+                    try:
+                        work_dir = work_dir or tempfile.mkdtemp()
+                        file_source = download_file_from_stage_to_path(conn, filename, "COMPLETED_STAGE", work_dir)
+                    except Exception as hash_error:
+                        add_process_log(f"Could not hash {filename} for the content registry: {str(hash_error)}")
+                if content_sha256 is None and file_source is not None:
+                    content_sha256 = hash_file_content(file_source)
+                if content_sha256:
+                    file_size = move_result['bytes_moved']
+                    register_file_contents(conn, [(content_sha256, filename, file_size, table_name, rows_loaded or None)], "LOADED")
+                add_process_log(f"✅ Successfully processed {filename} → table {table_name}")
+                return True, message
+            else:
+                add_process_log(f"Moving {filename} to error stage...")
+                move_result = transfer_file_between_stages(conn, filename, "PROCESSING_STAGE", "ERROR_STAGE", file_data)
+                add_process_log(f"{filename}: {move_result['message']}")
+                end_time = datetime.now()
+                log_operation(conn, "PROCESS", filename, source_stage, "ERROR_STAGE", "FAILED", 
+                             start_time, end_time, error_message=message)
+                add_process_log(f"⚠️ Failed to process {filename}: {message}")
+                return False, message
+                
+        except Exception as proc_error:
+            # Move to error stage on processing exception
+            add_process_log(f"❌ Error processing {filename}: {str(proc_error)}")
+            transfer_file_between_stages(conn, filename, "PROCESSING_STAGE", "ERROR_STAGE", file_data)
+            return False, f"Error processing file: {str(proc_error)}\n{traceback.format_exc()}"
+            
+    except Exception as e:
+        # General error - try to move to error stage from wherever it is
+        try:
+            # Try to move from processing stage first
+            move_file_between_stages(conn, filename, "PROCESSING_STAGE", "ERROR_STAGE")
+        except:
+            # If not in processing, try from raw
+            try:
+                move_file_between_stages(conn, filename, source_stage, "ERROR_STAGE")
+            except:
+                pass
+        add_process_log(f"❌ Error in workflow for {filename}: {str(e)}")
+        return False, f"Error in process workflow: {str(e)}\n{traceback.format_exc()}"
+    finally:
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def process_files_concurrently(conn, filenames, max_workers=DEFAULT_PROCESS_WORKERS, on_file_done=None,
+                               on_rows_progress=None, source_stage="RAW_STAGE", load_options=None):
+    """Process several files with a pool of worker threads
+
+    Each file runs through process_file on its own worker, and every Snowflake
+    call inside it opens its own cursor, so stage transitions and log entries
+    stay per file. on_file_done(filename, success, message, done_count) is
+    called from the calling thread as each file finishes, and
+    on_rows_progress(total_rows) about once a second while files are loading,
+    so both can safely update Streamlit widgets. load_options applies to
+    every file.
+
+    Returns a list of (filename, success, message) in completion order.
+    """
+    rows_lock = threading.Lock()
+    rows_total = 0
+
+    def count_rows(row_count):
+        nonlocal rows_total
+        with rows_lock:
+            rows_total += row_count
+
+    results = []
+    max_workers = max(1, min(max_workers, len(filenames)))
+    with ThreadPoolExecutor(max_workers=max_workers, initializer=worker_thread_initializer()) as executor:
+        futures = {executor.submit(process_file, conn, filename, count_rows, source_stage, load_options): filename
+                   for filename in filenames}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+            for future in done:
+                filename = futures[future]
+                try:
+                    success, message = future.result()
+                except Exception as e:
+                    success, message = False, f"Error in process workflow: {str(e)}"
+                results.append((filename, success, message))
+                if on_file_done:
+                    on_file_done(filename, success, message, len(results))
+            if on_rows_progress:
+                on_rows_progress(rows_total)
+    return results
+
+
+def process_queued_files(conn, filenames=None, max_workers=DEFAULT_PROCESS_WORKERS, on_file_done=None,
+                         on_rows_progress=None, source_stage="RAW_STAGE", worker_id=None, load_options=None):
+    """Process files through LOGS.FILE_WORK_QUEUE so concurrent runs never share a file
+
+    The files in source_stage (only those named in filenames, if given) are
+    enqueued, then this worker claims files as its pool has free slots and
+    processes them until none are left to claim. Files claimed by other app
+    instances or headless workers are left to them, and claims this worker
+    abandons are picked up by others once their lease expires. Callbacks and
+    load_options are the same as process_files_concurrently; if the queue
+    table can't be used the files are processed without it.
+
+    Returns a list of (filename, success, message) for the files this worker
+    processed, in completion order.
+    """
+    queue = FileWorkQueue(conn, source_stage, worker_id)
+    wanted = set(filenames) if filenames is not None else None
+    try:
+        listing = get_stage_files(conn, source_stage)
+        queue.enqueue((file_info[0], file_info[3] if len(file_info) > 3 else None) for file_info in listing
+                      if wanted is None or file_info[0] in wanted)
+    except Exception as e:
+        warn(f"Work queue unavailable, processing files without claiming them: {str(e)}")
+        if filenames is None:
+            filenames = [file_info[0] for file_info in get_stage_files(conn, source_stage)]
+        return process_files_concurrently(conn, filenames, max_workers, on_file_done, on_rows_progress, source_stage,
+                                          load_options)
+
+    rows_lock = threading.Lock()
+    rows_total = 0
+
+    def count_rows(row_count):
+        nonlocal rows_total
+        with rows_lock:
+            rows_total += row_count
+
+    results = []
+    max_workers = max(1, max_workers)
+    with queue, ThreadPoolExecutor(max_workers=max_workers, initializer=worker_thread_initializer()) as executor:
+        running = {}
+        can_claim = True
+        while True:
+            if can_claim and len(running) < max_workers:
+                requested = max_workers - len(running)
+                claimed = queue.claim(requested, sorted(wanted) if wanted is not None else None)
+                for filename in claimed:
+                    running[executor.submit(process_file, conn, filename, count_rows, source_stage,
+                                            load_options)] = filename
+                # A short claim means the queue is drained for now; try again
+                # once one of this worker's files finishes
+                can_claim = len(claimed) == requested
+            if not running:
+                break
+            done, _ = wait(running, timeout=1.0, return_when=FIRST_COMPLETED)
+            if done:
+                can_claim = True
+            for future in done:
+                filename = running.pop(future)
+                try:
+                    success, message = future.result()
+                except Exception as e:
+                    success, message = False, f"Error in process workflow: {str(e)}"
+                queue.complete(filename, success, message)
+                results.append((filename, success, message))
+                if on_file_done:
+                    on_file_done(filename, success, message, len(results))
+            if on_rows_progress:
+                on_rows_progress(rows_total)
+    return results
+
+
+def process_file_group(conn, group, source_stage="RAW_STAGE", load_options=None, progress_callback=None, queue=None,
+                       content_hashes=None):
+    """Bulk-load one FileGroup from source_stage and move its files to COMPLETED_STAGE together
+
+    With a work queue, the group's files are claimed together first and only
+    the claimed ones are loaded. content_hashes ({filename: verified uploaded
+    hash}) is recorded in the content registry for the files loaded; for
+    append and merge loads it also skips files whose content the group's
+    table already holds. Returns (results, leftover): (filename,
+    success, message) for every file the group loaded, and the files it
+    couldn't load, which should be processed on their own.
+    """
+    start_time = datetime.now()
+    if queue is not None:
+        claimed = queue.claim(len(group.filenames), group.filenames)
+        if len(claimed) < BATCH_LOAD_MIN_FILES:
+            return [], claimed
+        group = group._replace(filenames=sorted(claimed))
+
+    content_hashes = content_hashes or {}
+    results = []
+    if load_options is not None and load_options.mode != "replace":
+        # Checked here, once the files are claimed: the group's table is only
+        # known after planning, and appending a file twice duplicates its rows
+        try:
+            already_loaded = find_already_loaded(
+                conn, [(filename, content_hashes[filename]) for filename in group.filenames
+                       if content_hashes.get(filename)], load_options, table_name=group.table_name)
+        except Exception as registry_error:
+            already_loaded = {}
+            add_process_log(f"Content registry unavailable for {group.table_name}: {str(registry_error)}")
+        for filename in sorted(already_loaded):
+            message = skip_loaded_file(conn, filename, source_stage, group.table_name, already_loaded[filename],
+                                       start_time)
+            if queue is not None:
+                queue.complete(filename, True, message)
+            results.append((filename, True, message))
+        if already_loaded:
+            group = group._replace(filenames=[f for f in group.filenames if f not in already_loaded])
+            if len(group.filenames) < BATCH_LOAD_MIN_FILES:
+                return results, list(group.filenames)
+
+    add_process_log(f"Bulk-loading {len(group.filenames)} file(s) into {group.table_name} with COPY INTO...")
+    try:
+        file_results = load_file_group(conn, group, source_stage, load_options, progress_callback)
+    except Exception as e:
+        add_process_log(f"Bulk load into {group.table_name} failed, processing its files one at a time: {str(e)}")
+        return results, list(group.filenames)
+
+    loaded = [filename for filename in group.filenames if file_results[filename][0]]
+    leftover = [filename for filename in group.filenames if not file_results[filename][0]]
+    for filename in leftover:
+        add_process_log(f"{file_results[filename][1]} - processing it on its own")
+    if not loaded:
+        return results, leftover
+
+    # The files never left source_stage, so one COPY FILES moves them all
+    not_moved = set(move_files_between_stages(conn, loaded, source_stage, "COMPLETED_STAGE"))
+    end_time = datetime.now()
+    registry_entries = []
+    for filename in loaded:
+        _, message, rows_loaded = file_results[filename]
+        if filename in not_moved:
+            message += f" It could not be moved out of {source_stage}."
+        log_operation(conn, "PROCESS", filename, source_stage, "COMPLETED_STAGE", "SUCCESS",
+                      start_time, end_time, rows_processed=rows_loaded or None, table_name=group.table_name)
+        if content_hashes.get(filename):
+            registry_entries.append((content_hashes[filename], filename, None, group.table_name, rows_loaded or None))
+        results.append((filename, True, message))
+    if registry_entries:
+        register_file_contents(conn, registry_entries, "LOADED")
+    if queue is not None:
+        queue.complete_many(loaded, True, f"Bulk-loaded into {group.table_name}")
+    add_process_log(f"✅ Bulk-loaded {len(loaded)} file(s) → table {group.table_name}")
+    return results, leftover
+
+
+def process_files_in_batches(conn, filenames=None, max_workers=DEFAULT_PROCESS_WORKERS, on_file_done=None,
+                             on_rows_progress=None, source_stage="RAW_STAGE", load_options=None, grouping="header",
+                             use_queue=USE_WORK_QUEUE, worker_id=None):
+    """Bulk-load groups of small same-schema files, then process the rest file by file
+
+    The files in source_stage (only those named in filenames, if given) are
+    grouped by plan_file_groups (grouping is "header" or "pattern") and the
+    groups loaded concurrently, each with process_file_group. Files outside
+    any group, and files a group couldn't load, then go through
+    process_queued_files (use_queue) or process_files_concurrently. Callbacks,
+    load_options and the return value are the same as
+    process_files_concurrently.
+    """
+    load_options = normalize_load_options(load_options)
+    wanted = set(filenames) if filenames is not None else None
+    listing = [file_info for file_info in get_stage_files(conn, source_stage)
+               if wanted is None or file_info[0] in wanted]
+    files = [(file_info[0], file_info[1] if len(file_info) > 1 else None) for file_info in listing]
+    try:
+        # Uploaded hashes, for files still staged exactly as they were uploaded
+        staged_md5s = get_stage_file_md5s(conn, [filename for filename, _ in files], source_stage)
+        content_hashes = lookup_uploaded_hashes(conn, staged_md5s)
+        already_loaded = find_already_loaded(conn, list(content_hashes.items()), load_options)
+    except Exception as registry_error:
+        content_hashes, already_loaded = {}, {}
+        add_process_log(f"Content registry unavailable: {str(registry_error)}")
+    try:
+        # Files already loaded are left to process_file, which skips them
+        groups, singles = plan_file_groups(conn, [f for f in files if f[0] not in already_loaded], source_stage,
+                                           grouping, load_options)
+        singles += [filename for filename, _ in files if filename in already_loaded]
+    except Exception as e:
+        warn(f"Could not group files for bulk loading, processing them one at a time: {str(e)}")
+        groups, singles = [], [filename for filename, _ in files]
+
+    queue = None
+    if use_queue and groups:
+        queue = FileWorkQueue(conn, source_stage, worker_id)
+        grouped = {filename for group in groups for filename in group.filenames}
+        try:
+            queue.enqueue((file_info[0], file_info[3] if len(file_info) > 3 else None) for file_info in listing
+                          if file_info[0] in grouped)
+        except Exception as e:
+            warn(f"Work queue unavailable, bulk-loading files without claiming them: {str(e)}")
+            queue = None
+
+    rows_lock = threading.Lock()
+    rows_total = 0
+
+    def count_rows(row_count):
+        nonlocal rows_total
+        with rows_lock:
+            rows_total += row_count
+
+    results = []
+    leftover = []
+    if groups:
+        # Leaving the queue hands claims on files the groups couldn't load back
+        # to it, so they can be claimed again below
+        with (queue or nullcontext()), ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups))),
+                                                          initializer=worker_thread_initializer()) as executor:
+            futures = {
+                executor.submit(process_file_group, conn, group, source_stage, load_options, count_rows, queue,
+                                content_hashes): group
+                for group in groups
+            }
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        group_results, group_leftover = future.result()
+                    except Exception as e:
+                        warn(f"Bulk load into {futures[future].table_name} failed: {str(e)}")
+                        group_results, group_leftover = [], list(futures[future].filenames)
+                    for filename, success, message in group_results:
+                        results.append((filename, success, message))
+                        if on_file_done:
+                            on_file_done(filename, success, message, len(results))
+                    leftover.extend(group_leftover)
+                if on_rows_progress:
+                    on_rows_progress(rows_total)
+
+    remaining = singles + leftover
+    if not remaining:
+        return results
+
+    done_offset = len(results)
+    rows_offset = rows_total
+
+    def file_done(filename, success, message, done_count):
+        if on_file_done:
+            on_file_done(filename, success, message, done_offset + done_count)
+
+    def rows_progress(total_rows):
+        if on_rows_progress:
+            on_rows_progress(rows_offset + total_rows)
+
+    if use_queue:
+        results.extend(process_queued_files(conn, remaining, max_workers, file_done, rows_progress, source_stage,
+                                            queue.worker_id if queue else worker_id, load_options))
+    else:
+        results.extend(process_files_concurrently(conn, remaining, max_workers, file_done, rows_progress,
+                                                  source_stage, load_options))
+    return results
@@ -0,0 +1,121 @@
+"""Incremental column profiling for DataFrames loaded in chunks
+
+A ColumnProfiler is fed every chunk of a table as it is loaded and keeps a
+small, fixed-size summary per column, so profiling never needs a second pass
+over the data or a query against the finished table.
+"""
+import numpy as np
+import pandas as pd
+
+# Number of smallest hash values kept per column for the distinct estimate
+DISTINCT_SKETCH_SIZE = 1024
+# Longest min/max value kept, in characters
+PROFILE_VALUE_MAX_CHARS = 1000
+
+HASH_SPACE = float(2 ** 64)
+
+
+def snowflake_type_for_dtype(dtype):
+    """Map a pandas dtype to the Snowflake type write_pandas would create"""
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "NUMBER"
+    if pd.api.types.is_float_dtype(dtype):
+        return "FLOAT"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMP_NTZ"
+    return "VARCHAR"
+
+
+def widen_profile_type(current, new):
+    """Combine the types seen in two chunks into one that holds both"""
+    if current is None or current == new:
+        return new
+    if {current, new} == {"NUMBER", "FLOAT"}:
+        return "FLOAT"
+    return "VARCHAR"
+
+
+def combine_extreme(current, new, pick):
+    """Combine a running min/max with a chunk's, comparing as text if types clash"""
+    if current is None:
+        return new
+    try:
+        return pick(current, new)
+    except TypeError:
+        return pick(str(current), str(new))
+
+
+def series_extremes(series):
+    """Return (min, max) of a non-empty, null-free Series"""
+    try:
+        return series.min(), series.max()
+    except TypeError:
+        # Mixed types in an object column - fall back to text ordering
+        as_text = series.astype(str)
+        return as_text.min(), as_text.max()
+
+
+class ColumnProfiler:
+    """Accumulate null counts, distinct estimates, min/max and types per column
+
+    Distinct counts use a K-minimum-values sketch: each column keeps only the
+    DISTINCT_SKETCH_SIZE smallest 64-bit hashes of its values, which gives an
+    exact count for low-cardinality columns and a close estimate otherwise.
+    """
+
+    def __init__(self, sketch_size=DISTINCT_SKETCH_SIZE):
+        self.sketch_size = sketch_size
+        self.row_count = 0
+        self.columns = {}
+
+    def update(self, df):
+        """Add one chunk of rows to the profile"""
+        self.row_count += len(df)
+        for position, name in enumerate(df.columns):
+            series = df.iloc[:, position]
+            state = self.columns.setdefault(str(name), {
+                "null_count": 0,
+                "type": None,
+                "hashes": np.empty(0, dtype=np.uint64),
+                "min": None,
+                "max": None,
+            })
+            non_null = series.dropna()
+            state["null_count"] += len(series) - len(non_null)
+            if non_null.empty:
+                continue
+
+            # All-null chunks say nothing about the type, so only typed values count
+            state["type"] = widen_profile_type(state["type"], snowflake_type_for_dtype(series.dtype))
+
+            hashes = pd.util.hash_pandas_object(non_null, index=False).to_numpy(dtype=np.uint64)
+            state["hashes"] = np.unique(np.concatenate([state["hashes"], hashes]))[:self.sketch_size]
+
+            chunk_min, chunk_max = series_extremes(non_null)
+            state["min"] = combine_extreme(state["min"], chunk_min, min)
+            state["max"] = combine_extreme(state["max"], chunk_max, max)
+
+    def distinct_estimate(self, hashes):
+        """Estimate the distinct count from a column's KMV sketch"""
+        if len(hashes) < self.sketch_size:
+            return len(hashes)
+        kth_smallest = float(hashes[self.sketch_size - 1]) + 1
+        return int(round((self.sketch_size - 1) * HASH_SPACE / kth_smallest))
+
+    def results(self):
+        """Return one dict per column, in the order columns were first seen"""
+        profile = []
+        for position, (name, state) in enumerate(self.columns.items(), start=1):
+            profile.append({
+                "column": name,
+                "position": position,
+                "type": state["type"] or "VARCHAR",
+                "row_count": self.row_count,
+                "null_count": state["null_count"],
+                "distinct": self.distinct_estimate(state["hashes"]),
+                "min": None if state["min"] is None else str(state["min"])[:PROFILE_VALUE_MAX_CHARS],
+                "max": None if state["max"] is None else str(state["max"])[:PROFILE_VALUE_MAX_CHARS],
+            })
+        return profile
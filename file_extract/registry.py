@@ -0,0 +1,175 @@
+"""Content hashes of uploaded and loaded files (LOGS.FILE_CONTENT_REGISTRY)
+
+Lets uploads and processing skip files whose exact bytes are already staged or
+already back their table.
+"""
+import hashlib
+from datetime import datetime
+from pathlib import Path
+
+from file_extract.audit import AUDIT_LOG_INSERT_BATCH_ROWS
+from file_extract.load_modes import target_table_name
+from file_extract.runtime import add_process_log
+from file_extract.sql import insert_rows, sql_string_literal
+
+# Files are hashed in blocks of this size so large files are never copied whole
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def hash_file_content(source):
+    """Return the SHA-256 hex digest of a file's content, reading it in blocks
+    
+    source is bytes, a local file path, or a binary file-like object (which is
+    rewound afterwards). Bytes are hashed through a memoryview, so no slice of
+    the file is ever copied.
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source)
+        for offset in range(0, len(view), HASH_CHUNK_BYTES):
+            digest.update(view[offset:offset + HASH_CHUNK_BYTES])
+    elif isinstance(source, (str, Path)):
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+                digest.update(block)
+    else:
+        source.seek(0)
+        for block in iter(lambda: source.read(HASH_CHUNK_BYTES), b''):
+            digest.update(block)
+        source.seek(0)
+    return digest.hexdigest()
+
+
+# SHA-256 of uploaded and loaded files, used to skip identical files
+CONTENT_REGISTRY_DDL = """
+    CREATE TABLE IF NOT EXISTS LOGS.FILE_CONTENT_REGISTRY (
+        CONTENT_SHA256 VARCHAR(64) NOT NULL,
+        FILE_NAME VARCHAR(500) NOT NULL,
+        FILE_SIZE NUMBER,
+        STATUS VARCHAR(20) NOT NULL,
+        TABLE_NAME VARCHAR(500),
+        ROWS_PROCESSED NUMBER,
+        REGISTERED_AT TIMESTAMP_NTZ NOT NULL,
+        STAGED_MD5 VARCHAR(100)
+    )
+"""
+# Registries created before STAGED_MD5 was added
+CONTENT_REGISTRY_UPGRADE = "ALTER TABLE LOGS.FILE_CONTENT_REGISTRY ADD COLUMN IF NOT EXISTS STAGED_MD5 VARCHAR(100)"
+
+CONTENT_REGISTRY_COLUMNS = [
+    "CONTENT_SHA256", "FILE_NAME", "FILE_SIZE", "STATUS", "TABLE_NAME", "ROWS_PROCESSED", "REGISTERED_AT",
+    "STAGED_MD5"
+]
+
+
+def register_file_contents(conn, entries, status):
+    """Record (content_sha256, filename, file_size, table_name, rows_processed[, staged_md5]) entries
+    
+    status is UPLOADED (the file's hash, so processing can find it without
+    downloading the file) or LOADED (the content now backs table_name).
+    staged_md5 is the MD5 LIST reported for the staged file, which ties an
+    UPLOADED hash to that exact staged object. Registry writes are best effort
+    and never fail an upload or load.
+    """
+    registered_at = str(datetime.now())
+    rows = [(entry[0], entry[1], entry[2], status, entry[3], entry[4], registered_at,
+             entry[5] if len(entry) > 5 else None)
+            for entry in entries]
+    try:
+        for offset in range(0, len(rows), AUDIT_LOG_INSERT_BATCH_ROWS):
+            insert_rows(conn, "LOGS.FILE_CONTENT_REGISTRY", CONTENT_REGISTRY_COLUMNS,
+                        rows[offset:offset + AUDIT_LOG_INSERT_BATCH_ROWS])
+        return True
+    except Exception as e:
+        add_process_log(f"Could not update the file content registry: {str(e)}")
+        return False
+
+
+def lookup_uploaded_hash(conn, filename, staged_md5):
+    """Return the content hash recorded when filename was last uploaded, or None
+    
+    The hash is only returned if that upload recorded staged_md5, the MD5 the
+    staged file has now. A file re-staged outside the app, or whose upload was
+    never registered, has no trusted hash and must be hashed from its bytes.
+    """
+    return lookup_uploaded_hashes(conn, {filename: staged_md5}).get(filename)
+
+
+def lookup_uploaded_hashes(conn, staged_md5s):
+    """Return {filename: content hash recorded at its last upload} for many files in one query
+    
+    staged_md5s is {filename: current staged MD5}; as with lookup_uploaded_hash,
+    only files whose last upload recorded that MD5 are returned.
+    """
+    filenames = [filename for filename, md5 in staged_md5s.items() if md5]
+    if not filenames:
+        return {}
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT FILE_NAME, CONTENT_SHA256, STAGED_MD5
+        FROM LOGS.FILE_CONTENT_REGISTRY
+        WHERE STATUS = 'UPLOADED'
+        AND FILE_NAME IN ({', '.join(sql_string_literal(filename) for filename in filenames)})
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY FILE_NAME ORDER BY REGISTERED_AT DESC) = 1
+    """)
+    return {row[0]: row[1] for row in cursor.fetchall() if row[2] and row[2] == staged_md5s.get(row[0])}
+
+
+def table_exists_for_file(filename, table_name, existing_tables):
+    """True if the table(s) a file loads into are in existing_tables"""
+    if Path(filename).suffix.lower() in ('.xlsx', '.xls'):
+        # Excel files load one {table}_{sheet} table per sheet
+        return any(t.startswith(f"{table_name}_") for t in existing_tables)
+    return table_name in existing_tables
+
+
+def find_already_loaded(conn, files, load_options=None, table_name=None):
+    """Find files whose exact content is what their target table already holds
+    
+    files is a list of (filename, content_sha256). For replace loads a file
+    counts as already loaded when the most recent load into its table had the
+    same SHA-256 and that table still exists - processing it again would only
+    rebuild the same table. For append and merge loads (load_options) any
+    earlier load of the same content into the table counts, since loading it
+    again would duplicate or re-merge rows the table already has. table_name,
+    if given, is checked for every file instead of its own target table (a
+    bulk load's group table). Returns {filename: (loaded_from_filename,
+    registered_at)}.
+    """
+    incremental = load_options is not None and load_options.mode != "replace"
+    targets = {filename: table_name or target_table_name(filename, load_options) for filename, _ in files}
+    table_names = sorted(set(targets.values()))
+    if not table_names:
+        return {}
+    cursor = conn.cursor()
+    # Latest load per table, or per table and content for incremental loads
+    partition = "TABLE_NAME, CONTENT_SHA256" if incremental else "TABLE_NAME"
+    cursor.execute(f"""
+        SELECT TABLE_NAME, CONTENT_SHA256, FILE_NAME, REGISTERED_AT
+        FROM LOGS.FILE_CONTENT_REGISTRY
+        WHERE STATUS = 'LOADED'
+        AND TABLE_NAME IN ({', '.join(sql_string_literal(t) for t in table_names)})
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY {partition} ORDER BY REGISTERED_AT DESC) = 1
+    """)
+    if incremental:
+        latest_loads = {(row[0], row[1]): row[1:] for row in cursor.fetchall()}
+    else:
+        latest_loads = {row[0]: row[1:] for row in cursor.fetchall()}
+    if not latest_loads:
+        return {}
+    
+    cursor.execute("""
+        SELECT table_name
+        FROM information_schema.tables
+        WHERE table_schema = 'CONVERTED_FILES'
+    """)
+    existing_tables = {row[0] for row in cursor.fetchall()}
+    
+    already_loaded = {}
+    for filename, content_sha256 in files:
+        target = targets[filename]
+        latest = latest_loads.get((target, content_sha256) if incremental else target)
+        if (content_sha256 and latest and latest[0] == content_sha256
+                and table_exists_for_file(filename, target, existing_tables)):
+            already_loaded[filename] = (latest[1], latest[2])
+    return already_loaded
@@ -0,0 +1,64 @@
+"""Where the processing pipeline reports progress and warnings
+
+The pipeline runs both inside the Streamlit app and headless (python -m
+file_extract), so it never calls st.* itself. The app points these hooks at its
+process log and st.warning; anywhere else progress goes to stdout and warnings
+to stderr.
+"""
+import sys
+import threading
+from datetime import datetime
+
+# Try to import Snowpark for native Snowflake session
+try:
+    from snowflake.snowpark.context import get_active_session
+    SNOWPARK_AVAILABLE = True
+except ImportError:
+    SNOWPARK_AVAILABLE = False
+    get_active_session = None
+
+_print_lock = threading.Lock()
+_log_handler = None
+_warning_handler = None
+_thread_initializer_factory = None
+
+
+def print_log(message):
+    """Default progress handler: timestamped lines on stdout"""
+    timestamp = datetime.now().strftime("%H:%M:%S")
+    with _print_lock:
+        print(f"[{timestamp}] {message}", flush=True)
+
+
+def print_warning(message):
+    """Default warning handler: lines on stderr"""
+    with _print_lock:
+        print(f"Warning: {message}", file=sys.stderr, flush=True)
+
+
+def set_handlers(log=None, warning=None, thread_initializer_factory=None):
+    """Route pipeline progress and warnings, e.g. to the app's process log and st.warning
+
+    thread_initializer_factory, if given, is called on the thread that starts a
+    worker pool and must return the initializer for that pool's threads (the
+    app uses it to attach the Streamlit script run context).
+    """
+    global _log_handler, _warning_handler, _thread_initializer_factory
+    _log_handler = log
+    _warning_handler = warning
+    _thread_initializer_factory = thread_initializer_factory
+
+
+def add_process_log(message):
+    """Report a progress message for the file being processed"""
+    (_log_handler or print_log)(message)
+
+
+def warn(message):
+    """Report a recoverable problem, such as falling back to a slower path"""
+    (_warning_handler or print_warning)(message)
+
+
+def worker_thread_initializer():
+    """Return the initializer for a new worker thread pool (None if not needed)"""
+    return _thread_initializer_factory() if _thread_initializer_factory else None
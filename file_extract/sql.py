@@ -0,0 +1,64 @@
+"""SQL building blocks shared by the loaders, the audit log and the content registry"""
+import re
+import weakref
+
+
+def clean_table_name(filename):
+    """Clean filename to create valid table name"""
+    # Remove extension and clean special characters
+    table_name = re.sub(r'[^a-zA-Z0-9_]', '_', filename.rsplit('.', 1)[0])
+    table_name = re.sub(r'_+', '_', table_name).strip('_')
+    return table_name.upper()
+
+
+def sql_escape(value):
+    """Escape a value as a SQL literal"""
+    if value is None:
+        return "NULL"
+    elif isinstance(value, (int, float)):
+        return str(value)
+    else:
+        return f"'{str(value).replace(chr(39), chr(39)+chr(39))}'"  # Escape single quotes
+
+
+def insert_rows(conn, table_name, columns, rows):
+    """Insert rows into a table with one multi-row parameterised INSERT"""
+    cursor = conn.cursor()
+    column_list = ", ".join(columns)
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    insert_sql = f"INSERT INTO {table_name} ({column_list}) VALUES " + ", ".join([placeholders] * len(rows))
+    params = [value for row in rows for value in row]
+    try:
+        cursor.execute(insert_sql, params)
+    except TypeError:
+        # Cursor wrappers without parameter binding get escaped literals
+        values_sql = ", ".join("(" + ", ".join(sql_escape(value) for value in row) + ")" for row in rows)
+        cursor.execute(f"INSERT INTO {table_name} ({column_list}) VALUES {values_sql}")
+
+
+def quote_identifier(name):
+    """Quote SQL identifier to handle special characters"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def sql_string_literal(value):
+    """Render a Python string as a single-quoted SQL string literal"""
+    escaped = str(value).replace('\\', '\\\\').replace("'", "''")
+    escaped = escaped.replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+    return f"'{escaped}'"
+
+
+# Named file formats already created per connection (INFER_SCHEMA and staged
+# file queries only accept named formats, and they last as long as the session)
+created_file_formats = weakref.WeakKeyDictionary()
+
+
+def ensure_file_format(conn, format_name, format_options):
+    """Create a session-scoped named file format once per connection"""
+    formats = created_file_formats.setdefault(conn, set())
+    if format_name in formats:
+        return format_name
+    cursor = conn.cursor()
+    cursor.execute(f"CREATE TEMPORARY FILE FORMAT IF NOT EXISTS {format_name} {format_options}")
+    formats.add(format_name)
+    return format_name
@@ -0,0 +1,813 @@
+"""Uploading, moving, downloading and listing files on the app's stages"""
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+from file_extract.registry import HASH_CHUNK_BYTES
+from file_extract.runtime import SNOWPARK_AVAILABLE, get_active_session, warn
+from file_extract.sql import sql_string_literal
+
+# Number of upload threads used by a multi-file PUT (Snowflake allows 1-99)
+DEFAULT_UPLOAD_PARALLEL = 8
+
+# Stage listings are cached this long; uploads, moves and deletes made by the
+# app invalidate the affected stages straight away
+STAGE_LISTING_TTL_SECONDS = 30
+
+# Set FILE_EXTRACT_DIRECTORY_TABLES=1 once setup_stages.sql has enabled directory
+# tables on the stages to list them with SQL (filtered, sorted and paginated
+# in Snowflake) instead of LIST
+USE_DIRECTORY_TABLES = os.getenv("FILE_EXTRACT_DIRECTORY_TABLES", "").lower() in ("1", "true", "yes")
+STAGE_PAGE_SIZE = 50
+PROCESSABLE_EXTENSIONS = ('.csv', '.txt', '.xlsx', '.xls', '.pdf')
+# FILES = (...) lists in COPY FILES / COPY INTO take at most 1000 names
+STAGE_FILES_PER_STATEMENT = 1000
+
+
+def local_file_for_put(file_data, filename):
+    """Return (local_path, temp_dir) for a local file named filename holding file_data
+    
+    PUT names staged files after the local file, so the file must carry its
+    original name. A path that already does (like a spooled upload) is used
+    as is and temp_dir is None; otherwise the data is written to a new
+    temporary directory, which the caller removes.
+    """
+    if isinstance(file_data, (str, Path)) and os.path.basename(str(file_data)) == filename:
+        return str(file_data), None
+    temp_dir = tempfile.mkdtemp()
+    tmp_path = os.path.join(temp_dir, filename)
+    if isinstance(file_data, (str, Path)):
+        link_or_copy(file_data, tmp_path)
+    elif hasattr(file_data, 'read'):
+        file_data.seek(0)
+        with open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(file_data, f, HASH_CHUNK_BYTES)
+    else:
+        with open(tmp_path, 'wb') as f:
+            f.write(file_data)
+    return tmp_path, temp_dir
+
+
+def link_or_copy(source_path, dest_path):
+    """Hard-link a local file to a new name, copying it if linking isn't possible"""
+    try:
+        os.link(source_path, dest_path)
+    except OSError:
+        shutil.copyfile(source_path, dest_path)
+
+
+# Set once the streaming PUT API turns out to be missing so the remaining
+# uploads in this run go straight to the temp file path
+stream_upload_unavailable = False
+
+
+def put_stream_to_stage(conn, file_obj, filename, stage_name):
+    """PUT a binary file object to @stage_name/filename without a local file
+
+    Uses Snowpark's FileOperation.put_stream in Snowflake and the connector's
+    file_stream argument elsewhere.
+    """
+    is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
+    file_obj.seek(0)
+    if is_snowflake_env and SNOWPARK_AVAILABLE:
+        session = get_active_session()
+        session.file.put_stream(file_obj, f"@{stage_name}/{filename}", auto_compress=False, overwrite=True)
+    else:
+        cursor = conn.cursor()
+        # Only the file name of the local path is used - the data comes from file_stream
+        cursor.execute(f"PUT 'file:///stream/{filename}' @{stage_name} AUTO_COMPRESS=FALSE OVERWRITE=TRUE",
+                       file_stream=file_obj)
+    invalidate_stage_listing(stage_name)
+
+
+def upload_file_to_stage(conn, file_data, filename, stage_name="RAW_STAGE"):
+    """Upload file to Snowflake stage
+
+    file_data is the file's bytes, a binary file object, or the path of a
+    local copy such as a spooled upload. Bytes and file objects are streamed
+    straight to the stage; a temporary file is only written when the stream
+    API is unavailable. Paths are PUT without being read into memory.
+    """
+    global stream_upload_unavailable
+    if isinstance(file_data, (str, Path)) and not os.path.exists(file_data):
+        # e.g. a spooled upload deleted since it was selected
+        return False, f"Error uploading file: local copy {file_data} no longer exists"
+    if not stream_upload_unavailable and not isinstance(file_data, (str, Path)):
+        try:
+            # BytesIO shares the bytes object's buffer, so this doesn't copy it
+            file_obj = file_data if hasattr(file_data, 'read') else io.BytesIO(file_data)
+            put_stream_to_stage(conn, file_obj, filename, stage_name)
+            return True, f"File {filename} uploaded successfully to {stage_name}"
+        except (AttributeError, TypeError, NotImplementedError):
+            # Older Snowpark/connector versions, or cursor wrappers without file_stream
+            stream_upload_unavailable = True
+        except Exception as e:
+            warn(f"Streaming upload failed for {filename}, retrying from a temporary file: {str(e)}")
+    
+    try:
+        # Check if we're running in Snowflake environment
+        is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
+        
+        if is_snowflake_env and SNOWPARK_AVAILABLE:
+            # Use Snowpark session for file upload when running in Snowflake
+            try:
+                session = get_active_session()
+                
+                # Get a local file with the original filename
+                tmp_path, temp_dir = local_file_for_put(file_data, filename)
+                
+                try:
+                    # Use Snowpark's file.put method - this will preserve the filename
+                    session.file.put(
+                        tmp_path,
+                        f"@{stage_name}",
+                        auto_compress=False,
+                        overwrite=True
+                    )
+                    invalidate_stage_listing(stage_name)
+                    
+                    # Verify the file was uploaded with correct name
+                    verify_df = session.sql(f"LIST @{stage_name} PATTERN='{filename}'").collect()
+                    if verify_df and len(verify_df) > 0:
+                        uploaded_name = verify_df[0]['name'].split('/')[-1]
+                        if uploaded_name == filename:
+                            return True, f"File {filename} uploaded successfully to {stage_name}"
+                        else:
+                            warn(f"File uploaded as '{uploaded_name}' instead of '{filename}'")
+                            return True, f"File uploaded to {stage_name} as {uploaded_name}"
+                    
+                    return True, f"File {filename} uploaded successfully to {stage_name}"
+                finally:
+                    # Clean up temp file and directory
+                    if temp_dir:
+                        shutil.rmtree(temp_dir, ignore_errors=True)
+            except Exception as e:
+                # If Snowpark method fails, fall through to traditional method
+                warn(f"Snowpark upload failed, trying alternative method: {str(e)}")
+        
+        # Traditional method for local development or fallback
+        cursor = conn.cursor()
+        
+        # Get a local file with the original filename
+        tmp_path, temp_dir = local_file_for_put(file_data, filename)
+        
+        try:
+            # Upload to stage - PUT will use the actual filename
+            put_command = f"PUT file://{tmp_path} @{stage_name} AUTO_COMPRESS=FALSE OVERWRITE=TRUE"
+            cursor.execute(put_command)
+            invalidate_stage_listing(stage_name)
+            
+            return True, f"File {filename} uploaded successfully to {stage_name}"
+        finally:
+            # Clean up temp file and directory
+            if temp_dir:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                
+    except Exception as e:
+        return False, f"Error uploading file: {str(e)}"
+
+
+def upload_files_to_stage(conn, files, stage_name="RAW_STAGE", parallel=DEFAULT_UPLOAD_PARALLEL):
+    """Upload several files to a Snowflake stage with a single multi-file PUT
+
+    files is a list of (filename, file_data) tuples, where file_data is bytes or
+    a local path. The files are gathered into one temporary directory (paths
+    are hard-linked, not copied) and pushed with one PUT using PARALLEL upload
+    threads, so there is no per-file round trip or verifying LIST.
+
+    Returns a list of (filename, success, message) tuples in input order. If the
+    batch PUT fails as a whole, each file is retried with upload_file_to_stage.
+    A path that no longer exists fails just that file.
+    """
+    temp_dir = tempfile.mkdtemp()
+    try:
+        # Gather files under their original names - PUT uses the local filename
+        missing = {}
+        for filename, file_data in files:
+            if isinstance(file_data, (str, Path)):
+                if not os.path.exists(file_data):
+                    # e.g. a spooled upload deleted since it was selected
+                    missing[filename] = f"Error uploading file: local copy {file_data} no longer exists"
+                    continue
+                link_or_copy(file_data, os.path.join(temp_dir, filename))
+            else:
+                with open(os.path.join(temp_dir, filename), 'wb') as f:
+                    f.write(file_data)
+        if len(missing) == len(files):
+            return [(filename, False, missing[filename]) for filename, _ in files]
+
+        source_pattern = os.path.join(temp_dir, '*')
+        statuses = {}
+        try:
+            is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
+            if is_snowflake_env and SNOWPARK_AVAILABLE:
+                session = get_active_session()
+                put_results = session.file.put(
+                    source_pattern,
+                    f"@{stage_name}",
+                    auto_compress=False,
+                    overwrite=True,
+                    parallel=parallel
+                )
+                for put_result in put_results:
+                    statuses[os.path.basename(put_result.source)] = (put_result.status, put_result.message)
+            else:
+                cursor = conn.cursor()
+                cursor.execute(
+                    f"PUT 'file://{source_pattern}' @{stage_name} "
+                    f"AUTO_COMPRESS=FALSE OVERWRITE=TRUE PARALLEL={parallel}"
+                )
+                # Rows: source, target, source_size, target_size, source_compression,
+                # target_compression, status, message
+                for row in cursor.fetchall():
+                    statuses[os.path.basename(row[0])] = (row[6], row[7])
+            invalidate_stage_listing(stage_name)
+        except Exception as e:
+            invalidate_stage_listing(stage_name)
+            warn(f"Batch upload failed, uploading files one at a time: {str(e)}")
+            return [(filename, False, missing[filename]) if filename in missing
+                    else (filename,) + upload_file_to_stage(conn, file_data, filename, stage_name)
+                    for filename, file_data in files]
+
+        results = []
+        for filename, _ in files:
+            status, message = statuses.get(filename, (None, "File was not reported by PUT"))
+            if filename in missing:
+                results.append((filename, False, missing[filename]))
+            elif status in ("UPLOADED", "SKIPPED"):
+                results.append((filename, True, f"File {filename} uploaded successfully to {stage_name}"))
+            else:
+                results.append((filename, False, f"Error uploading file: {message or status}"))
+        return results
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def remove_file_from_stage(conn, filename, stage_name):
+    """Remove file from stage using Snowpark FileOperation.remove
+    
+    Uses the Snowpark FileOperation API as documented at:
+    https://docs.snowflake.com/en/developer-guide/snowpark/reference/python/1.42.0/snowpark/api/snowflake.snowpark.FileOperation.remove
+    
+    Note: In Streamlit in Snowflake, file removal may have limitations due to security restrictions.
+    """
+    is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
+    
+    try:
+        if is_snowflake_env and SNOWPARK_AVAILABLE:
+            # Use Snowpark FileOperation.remove API
+            session = get_active_session()
+            try:
+                # Use the file.remove() method
+                # Syntax: session.file.remove(stage_location, pattern=None)
+                # Returns a list of removed file paths
+                stage_location = f"@{stage_name}/{filename}"
+                result = session.file.remove(stage_location)
+                invalidate_stage_listing(stage_name)
+                # Result is a list of removed file paths
+                if result:
+                    return True
+                else:
+                    # No files removed, but don't block workflow
+                    return True
+            except Exception as snowpark_error:
+                error_msg = str(snowpark_error)
+                if "REMOVE_FILES" in error_msg or "Unsupported statement" in error_msg or "privilege" in error_msg.lower():
+                    # Expected limitation in Streamlit - files stay in stage
+                    # This is OK - we track file processing in the log table
+                    return True  # Return True to not block workflow
+                else:
+                    # Unexpected error - raise it
+                    raise snowpark_error
+        else:
+            # Use traditional REMOVE command for local development
+            if conn:
+                cursor = conn.cursor()
+                # Execute REMOVE command
+                # Syntax: REMOVE @stage_name/filename
+                remove_sql = f"REMOVE @{stage_name}/{filename}"
+                cursor.execute(remove_sql)
+                invalidate_stage_listing(stage_name)
+            return True
+    except Exception:
+        # If removal fails, log but don't raise - file is already processed
+        # Return True to not block the workflow
+        return True
+
+
+# Set once COPY FILES is known not to work on this account/role so the
+# remaining moves in this run go straight to the GET/PUT fallback
+server_side_copy_unavailable = False
+
+
+def get_stage_file_size(conn, filename, stage_name):
+    """Return the size in bytes of a staged file, or None if it can't be listed"""
+    try:
+        cursor = conn.cursor()
+        # LIST on a path is a prefix match, so pick out the exact filename
+        cursor.execute(f"LIST @{stage_name}/{filename}")
+        for file_info in cursor.fetchall():
+            if file_info and str(file_info[0]).split('/')[-1] == filename:
+                return file_info[1]
+    except Exception:
+        pass
+    return None
+
+
+def get_stage_file_md5s(conn, filenames, stage_name):
+    """Return {filename: MD5} for staged files, read with a fresh LIST
+    
+    Neither the listing cache nor the directory table is used, since either
+    may predate a file being re-staged. Files that can't be listed are left
+    out.
+    """
+    md5s = {}
+    wanted = set(filenames)
+    try:
+        cursor = conn.cursor()
+        for offset in range(0, len(filenames), STAGE_FILES_PER_STATEMENT):
+            batch = filenames[offset:offset + STAGE_FILES_PER_STATEMENT]
+            cursor.execute(f"LIST @{stage_name} PATTERN = {sql_string_literal(stage_files_pattern(batch))}")
+            # LIST rows: name, size, md5, last_modified
+            for file_info in cursor.fetchall():
+                filename = str(file_info[0]).split('/')[-1]
+                if filename in wanted and len(file_info) > 2 and file_info[2]:
+                    md5s[filename] = file_info[2]
+    except Exception:
+        pass
+    return md5s
+
+
+def copy_file_server_side(conn, filename, from_stage, to_stage):
+    """Copy a staged file to another stage inside Snowflake using COPY FILES
+
+    The file bytes never leave the warehouse. Returns the size of the copied file
+    in bytes (None if it could not be determined).
+    """
+    file_size = get_stage_file_size(conn, filename, from_stage)
+    cursor = conn.cursor()
+    escaped_filename = filename.replace("'", "''")
+    cursor.execute(f"COPY FILES INTO @{to_stage} FROM @{from_stage} FILES = ('{escaped_filename}')")
+    invalidate_stage_listing(to_stage)
+    return file_size
+
+
+def transfer_file_between_stages(conn, filename, from_stage, to_stage, file_data=None):
+    """Move file from one stage to another and report how it was moved
+
+    Tries a server-side COPY FILES first and only falls back to downloading the
+    file and uploading it again (GET/PUT round trip) when that is unavailable.
+    Pass file_data when the caller already holds the file's bytes so the
+    fallback can skip the GET.
+
+    Returns a dict with keys: success, message, method ('server' or 'client'),
+    bytes_moved, seconds, data (the file bytes if the move downloaded or reused
+    them, else None) and bytes_reused (bytes not downloaded thanks to file_data).
+    """
+    global server_side_copy_unavailable
+    start = time.perf_counter()
+    result = {'success': False, 'message': '', 'method': None, 'bytes_moved': None, 'seconds': 0.0,
+              'data': None, 'bytes_reused': 0}
+
+    try:
+        if not server_side_copy_unavailable:
+            try:
+                result['bytes_moved'] = copy_file_server_side(conn, filename, from_stage, to_stage)
+                result['method'] = 'server'
+            except Exception as copy_error:
+                error_msg = str(copy_error).lower()
+                if "syntax error" in error_msg or "unsupported" in error_msg or "not supported" in error_msg:
+                    server_side_copy_unavailable = True
+
+        if result['method'] is None:
+            # Client round trip: download file from source stage and upload it again
+            if file_data is None:
+                file_data = download_file_from_stage(conn, filename, from_stage)
+            else:
+                result['bytes_reused'] = len(file_data)
+            result['data'] = file_data
+            success, message = upload_file_to_stage(conn, file_data, filename, to_stage)
+            if not success:
+                result['message'] = f"Failed to upload to {to_stage}: {message}"
+                result['seconds'] = time.perf_counter() - start
+                return result
+            result['method'] = 'client'
+            result['bytes_moved'] = len(file_data)
+
+        # Remove from source stage
+        remove_file_from_stage(conn, filename, from_stage)
+
+        result['success'] = True
+        result['seconds'] = time.perf_counter() - start
+        size_text = f"{result['bytes_moved']:,} bytes" if result['bytes_moved'] is not None else "unknown size"
+        method_text = "server-side" if result['method'] == 'server' else "via client"
+        result['message'] = (f"File moved from {from_stage} to {to_stage} "
+                             f"({size_text} in {result['seconds']:.2f}s, {method_text})")
+        return result
+
+    except Exception as e:
+        result['seconds'] = time.perf_counter() - start
+        result['message'] = f"Error moving file: {str(e)}"
+        return result
+
+
+def move_file_between_stages(conn, filename, from_stage, to_stage):
+    """Move file from one stage to another"""
+    result = transfer_file_between_stages(conn, filename, from_stage, to_stage)
+    return result['success'], result['message']
+
+
+def stage_files_pattern(filenames):
+    """Regex for a PATTERN clause that matches exactly these staged files"""
+    escaped = (re.sub(r'([.^$*+?()\[\]{}|\\])', r'\\\1', filename) for filename in filenames)
+    return f"(.*/)?({'|'.join(escaped)})"
+
+
+def remove_files_from_stage(conn, filenames, stage_name):
+    """Remove several files from a stage with one REMOVE, or one at a time if that fails"""
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"REMOVE @{stage_name} PATTERN = {sql_string_literal(stage_files_pattern(filenames))}")
+        invalidate_stage_listing(stage_name)
+    except Exception:
+        for filename in filenames:
+            remove_file_from_stage(conn, filename, stage_name)
+
+
+def move_files_between_stages(conn, filenames, from_stage, to_stage):
+    """Move many files with one COPY FILES and one REMOVE per STAGE_FILES_PER_STATEMENT files
+
+    Falls back to moving the files one at a time (transfer_file_between_stages)
+    when server-side copies are unavailable. Returns the filenames that could
+    not be moved.
+    """
+    global server_side_copy_unavailable
+    failed = []
+    for offset in range(0, len(filenames), STAGE_FILES_PER_STATEMENT):
+        batch = filenames[offset:offset + STAGE_FILES_PER_STATEMENT]
+        if not server_side_copy_unavailable:
+            try:
+                cursor = conn.cursor()
+                cursor.execute(f"COPY FILES INTO @{to_stage} FROM @{from_stage} "
+                               f"FILES = ({', '.join(sql_string_literal(filename) for filename in batch)})")
+                invalidate_stage_listing(to_stage)
+                remove_files_from_stage(conn, batch, from_stage)
+                continue
+            except Exception as copy_error:
+                error_msg = str(copy_error).lower()
+                if "syntax error" in error_msg or "unsupported" in error_msg or "not supported" in error_msg:
+                    server_side_copy_unavailable = True
+        for filename in batch:
+            if not transfer_file_between_stages(conn, filename, from_stage, to_stage)['success']:
+                failed.append(filename)
+    return failed
+
+
+def put_file_to_stage_internal(tmp_path, stage_path):
+    """Internal helper to PUT file to stage using Snowpark or traditional method"""
+    is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
+    
+    if is_snowflake_env and SNOWPARK_AVAILABLE:
+        try:
+            session = get_active_session()
+            session.file.put(tmp_path, stage_path, auto_compress=False, overwrite=True)
+            return
+        except Exception as e:
+            # Fall through to SQL method
+            warn(f"Snowpark PUT failed, using SQL method: {str(e)}")
+    
+    # Use SQL cursor method
+    # This needs to be called from a context that has a cursor
+    raise NotImplementedError("put_file_to_stage_internal should be called with proper context")
+
+
+def download_file_from_stage_to_path(conn, filename, stage_name, dest_dir):
+    """Download file from Snowflake stage into dest_dir and return its local path
+
+    The file is left on disk so large files can be streamed instead of read
+    into memory. The caller owns dest_dir and is responsible for removing it.
+    """
+    # Check if we're running in Snowflake environment
+    is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
+    
+    downloaded = False
+    if is_snowflake_env and SNOWPARK_AVAILABLE:
+        # Use Snowpark session for file download when running in Snowflake
+        try:
+            session = get_active_session()
+            # Use Snowpark's file.get method
+            session.file.get(f"@{stage_name}/{filename}", dest_dir)
+            downloaded = True
+        except Exception as e:
+            # If Snowpark method fails, fall through to traditional method
+            warn(f"Snowpark download failed, trying alternative method: {str(e)}")
+    
+    if not downloaded:
+        # Traditional method for local development or fallback
+        cursor = conn.cursor()
+        # Use GET command to download file from stage
+        get_command = f"GET @{stage_name}/{filename} file://{dest_dir}/"
+        cursor.execute(get_command)
+    
+    # Find the downloaded file (GET may preserve path structure)
+    for root, dirs, files in os.walk(dest_dir):
+        for file in files:
+            return os.path.join(root, file)
+    
+    raise FileNotFoundError(f"File {filename} not found after download from {stage_name}")
+
+
+def download_file_from_stage(conn, filename, stage_name="RAW_STAGE"):
+    """Download file from Snowflake stage and return file content"""
+    # Create temporary directory for download
+    temp_dir = tempfile.mkdtemp()
+    try:
+        file_path = download_file_from_stage_to_path(conn, filename, stage_name, temp_dir)
+        # Read the file content
+        with open(file_path, 'rb') as f:
+            return f.read()
+    finally:
+        # Clean up temp directory
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class StageListingCache:
+    """Short-lived cache of LIST @stage results, keyed by stage name
+
+    Pages of directory table listings are cached too, keyed by stage name and
+    query. Entries expire after ttl_seconds. Operations in this app that change a
+    stage call invalidate() so their changes show up on the next render.
+    """
+    
+    def __init__(self, ttl_seconds=STAGE_LISTING_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.lock = threading.Lock()
+        self.entries = {}  # stage_name -> (fetched_at, files)
+        self.pages = {}  # (stage_name, query) -> (fetched_at, files, total_count)
+        self.refreshed = set()  # stages whose directory table is up to date
+    
+    def get(self, stage_name):
+        """Return the cached listing for a stage, or None if missing or expired"""
+        with self.lock:
+            entry = self.entries.get(stage_name)
+            if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+                return list(entry[1])
+        return None
+    
+    def put(self, stage_name, files):
+        with self.lock:
+            self.entries[stage_name] = (time.monotonic(), list(files))
+    
+    def get_page(self, stage_name, query):
+        """Return the cached (files, total_count) for a page query, or None if missing or expired"""
+        with self.lock:
+            entry = self.pages.get((stage_name, query))
+            if entry and time.monotonic() - entry[0] < self.ttl_seconds:
+                return list(entry[1]), entry[2]
+        return None
+    
+    def put_page(self, stage_name, query, files, total_count):
+        with self.lock:
+            self.pages[(stage_name, query)] = (time.monotonic(), list(files), total_count)
+    
+    def invalidate(self, *stage_names):
+        """Drop the cached listings for the given stages (all stages if none given)"""
+        with self.lock:
+            if not stage_names:
+                self.entries.clear()
+                self.pages.clear()
+                self.refreshed.clear()
+            for stage_name in stage_names:
+                # Accept stage paths like PROCESSING_STAGE/sub/dir
+                stage_name = str(stage_name).lstrip('@').split('/')[0]
+                self.entries.pop(stage_name, None)
+                for key in [key for key in self.pages if key[0] == stage_name]:
+                    del self.pages[key]
+                self.refreshed.discard(stage_name)
+    
+    def needs_refresh(self, stage_name):
+        """True if the stage changed since its directory table was last refreshed"""
+        with self.lock:
+            return stage_name not in self.refreshed
+    
+    def mark_refreshed(self, stage_name):
+        with self.lock:
+            self.refreshed.add(stage_name)
+
+
+stage_listing_cache = StageListingCache()
+
+
+def get_stage_listing_cache():
+    """Get the process-wide stage listing cache"""
+    return stage_listing_cache
+
+
+def invalidate_stage_listing(*stage_names):
+    """Forget cached listings so the next get_stage_files or list_stage_files_page call queries the stage again"""
+    get_stage_listing_cache().invalidate(*stage_names)
+
+
+# Set once a directory table query fails so the rest of the run uses LIST
+directory_tables_unavailable = False
+
+
+def directory_tables_enabled():
+    """True when stages should be listed through their directory tables"""
+    return USE_DIRECTORY_TABLES and not directory_tables_unavailable
+
+
+def disable_directory_tables(error):
+    """Fall back to LIST for the rest of the run after a directory table error"""
+    global directory_tables_unavailable
+    directory_tables_unavailable = True
+    warn(f"Directory tables unavailable, listing stages with LIST instead: {str(error)}")
+
+
+def refresh_stage_directory(conn, stage_name):
+    """Sync a stage's directory table if the app changed the stage since the last sync
+
+    Directory tables on internal stages don't refresh themselves, and the first
+    query in a process always refreshes in case files changed outside the app.
+    """
+    cache = get_stage_listing_cache()
+    if cache.needs_refresh(stage_name):
+        cursor = conn.cursor()
+        cursor.execute(f"ALTER STAGE {stage_name} REFRESH")
+        cache.mark_refreshed(stage_name)
+
+
+# Sortable stage file fields -> directory table column
+STAGE_SORT_COLUMNS = {"name": "RELATIVE_PATH", "size": "SIZE", "modified": "LAST_MODIFIED"}
+
+
+def query_stage_directory(conn, stage_name, search=None, sort_by="name", descending=False, limit=None, offset=0,
+                          extensions=None):
+    """List files through a stage's directory table, filtered and paginated in Snowflake
+    
+    Returns (files, total_count) where files are (filename, size, md5,
+    last_modified) tuples like get_stage_files rows, and total_count is the
+    number of matching files across all pages.
+    """
+    refresh_stage_directory(conn, stage_name)
+    
+    conditions = []
+    if search:
+        conditions.append(f"CONTAINS(LOWER(RELATIVE_PATH), {sql_string_literal(search.lower())})")
+    if extensions:
+        conditions.append("(" + " OR ".join(
+            f"ENDSWITH(LOWER(RELATIVE_PATH), {sql_string_literal(ext)})" for ext in extensions
+        ) + ")")
+    where_sql = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    direction = "DESC" if descending else "ASC"
+    order_sql = f"{STAGE_SORT_COLUMNS[sort_by]} {direction}"
+    if sort_by != "name":
+        order_sql += ", RELATIVE_PATH"
+    limit_sql = f"LIMIT {int(limit)} OFFSET {int(offset)}" if limit else ""
+    
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT RELATIVE_PATH, SIZE, MD5, LAST_MODIFIED, COUNT(*) OVER () AS TOTAL_COUNT
+        FROM DIRECTORY(@{stage_name})
+        {where_sql}
+        ORDER BY {order_sql}
+        {limit_sql}
+    """)
+    rows = cursor.fetchall()
+    
+    if rows:
+        total_count = rows[0][4]
+    elif offset:
+        # Past the last page - count separately
+        cursor.execute(f"SELECT COUNT(*) FROM DIRECTORY(@{stage_name}) {where_sql}")
+        total_count = cursor.fetchone()[0]
+    else:
+        total_count = 0
+    
+    # Match LIST output, which shows only the file name
+    files = [(str(row[0]).split('/')[-1], row[1], row[2], row[3]) for row in rows]
+    return files, total_count
+
+
+def stage_file_sort_key(file_info, sort_by):
+    """Sort key for a get_stage_files row"""
+    if sort_by == "size":
+        return file_info[1] if len(file_info) > 1 and file_info[1] is not None else 0
+    if sort_by == "modified":
+        modified = file_info[3] if len(file_info) > 3 else None
+        # LIST reports last_modified as an RFC 2822 string
+        try:
+            return parsedate_to_datetime(modified).timestamp() if isinstance(modified, str) else modified.timestamp()
+        except (TypeError, ValueError, AttributeError):
+            return 0
+    return str(file_info[0]).lower()
+
+
+def list_stage_files_page(conn, stage_name, search=None, sort_by="name", descending=False,
+                          page=0, page_size=STAGE_PAGE_SIZE, extensions=None):
+    """Return (files, total_count) for one page of a stage's files
+    
+    With directory tables enabled only the requested page is fetched from
+    Snowflake; otherwise the cached LIST output is filtered and sliced here.
+    Either way results are cached like get_stage_files listings.
+    extensions, if given, limits the files to those endings (lowercase).
+    """
+    if directory_tables_enabled():
+        cache = get_stage_listing_cache()
+        query = (search, sort_by, descending, page, page_size, tuple(extensions) if extensions else None)
+        cached_page = cache.get_page(stage_name, query)
+        if cached_page is not None:
+            return cached_page
+        try:
+            files, total_count = query_stage_directory(conn, stage_name, search, sort_by, descending,
+                                                       limit=page_size, offset=page * page_size,
+                                                       extensions=extensions)
+            cache.put_page(stage_name, query, files, total_count)
+            return files, total_count
+        except Exception as e:
+            disable_directory_tables(e)
+    
+    files = get_stage_files(conn, stage_name)
+    if search:
+        files = [f for f in files if search.lower() in str(f[0]).lower()]
+    if extensions:
+        files = [f for f in files if str(f[0]).lower().endswith(tuple(extensions))]
+    files = sorted(files, key=lambda f: stage_file_sort_key(f, sort_by), reverse=descending)
+    return files[page * page_size:(page + 1) * page_size], len(files)
+
+
+def count_stage_files(conn, stage_name, extensions=None):
+    """Return the number of files in a stage"""
+    return list_stage_files_page(conn, stage_name, page_size=1, extensions=extensions)[1]
+
+
+def get_stage_files(conn, stage_name):
+    """Get list of files in a stage
+
+    Listings are cached for STAGE_LISTING_TTL_SECONDS, so a page render runs at
+    most one LIST (or directory table query) per stage.
+    """
+    cached_files = get_stage_listing_cache().get(stage_name)
+    if cached_files is not None:
+        return cached_files
+    if directory_tables_enabled():
+        try:
+            files, _ = query_stage_directory(conn, stage_name)
+            get_stage_listing_cache().put(stage_name, files)
+            return files
+        except Exception as e:
+            disable_directory_tables(e)
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"LIST @{stage_name}")
+        files = cursor.fetchall()
+        
+        # Clean up file names - extract just the filename from the full stage path
+        cleaned_files = []
+        for file_info in files:
+            if file_info and len(file_info) > 0:
+                full_path = file_info[0]
+                # Extract just the filename from the stage path
+                # Stage paths look like: <database>/<schema>/<stage>/<filename>
+                if isinstance(full_path, str) and '/' in full_path:
+                    filename = full_path.split('/')[-1]
+                else:
+                    filename = full_path
+                
+                # Create new tuple with cleaned filename
+                cleaned_files.append((filename,) + file_info[1:])
+        
+        get_stage_listing_cache().put(stage_name, cleaned_files)
+        return cleaned_files
+    except Exception as e:
+        warn(f"Error listing files in {stage_name}: {str(e)}")
+        return []
+
+
+def delete_file_from_stage(conn, filename, stage_name):
+    """Delete a file from a Snowflake stage
+    
+    Note: In Streamlit in Snowflake, file deletion is restricted for security.
+    Files remain in stages but the operation log tracks processing status.
+    """
+    is_snowflake_env = os.path.exists("/home/udf") or os.getenv("SNOWFLAKE_ENVIRONMENT")
+    
+    try:
+        # Use the helper function that handles both environments
+        success = remove_file_from_stage(conn, filename, stage_name)
+        if success:
+            if is_snowflake_env:
+                # In Snowflake, files aren't actually removed due to security restrictions
+                return True, f"Note: File '{filename}' marked as processed. File remains in {stage_name} due to Snowflake security restrictions. Use Snowflake UI or SQL to manually remove files if needed."
+            else:
+                return True, f"File {filename} deleted successfully from {stage_name}"
+        else:
+            return False, f"Could not delete file {filename} from {stage_name}"
+    except Exception as e:
+        return False, f"Error deleting file: {str(e)}"
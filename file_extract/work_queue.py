@@ -0,0 +1,225 @@
+"""Durable work queue of staged files (LOGS.FILE_WORK_QUEUE)
+
+Lets several app instances and headless workers process the same stage at
+once without racing on it: every file is claimed by exactly one worker, under
+a lease the worker keeps extending with heartbeats while it runs. Claims whose
+lease runs out (the worker died or lost its connection) are picked up again by
+the next claim, up to WORK_QUEUE_MAX_ATTEMPTS times.
+
+Claims are single conditional UPDATEs, which Snowflake serialises per table,
+so two workers can never claim the same file. All times are UTC (SYSDATE()).
+"""
+import os
+import socket
+import threading
+import uuid
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+
+from file_extract.runtime import warn
+from file_extract.sql import sql_string_literal
+
+# Set FILE_EXTRACT_WORK_QUEUE=0 to process files without claiming them first
+USE_WORK_QUEUE = os.getenv("FILE_EXTRACT_WORK_QUEUE", "1").lower() not in ("0", "false", "no")
+
+# A claim is lost if its worker sends no heartbeat for this long; heartbeats
+# are sent a few times per lease
+WORK_QUEUE_LEASE_SECONDS = int(os.getenv("FILE_EXTRACT_QUEUE_LEASE_SECONDS", "300"))
+WORK_QUEUE_HEARTBEAT_SECONDS = max(1, WORK_QUEUE_LEASE_SECONDS // 5)
+# Files whose lease expired this many times are marked FAILED instead of retried
+WORK_QUEUE_MAX_ATTEMPTS = 3
+# Files per MERGE when enqueueing a stage listing (and per bulk completion)
+WORK_QUEUE_ENQUEUE_BATCH = 1000
+
+FILE_WORK_QUEUE_DDL = """
+    CREATE TABLE IF NOT EXISTS LOGS.FILE_WORK_QUEUE (
+        SOURCE_STAGE VARCHAR(255) NOT NULL,
+        FILE_NAME VARCHAR(500) NOT NULL,
+        STATUS VARCHAR(20) NOT NULL,
+        STAGED_AT TIMESTAMP_NTZ,
+        ENQUEUED_AT TIMESTAMP_NTZ NOT NULL,
+        WORKER_ID VARCHAR(255),
+        CLAIM_TOKEN VARCHAR(36),
+        CLAIMED_AT TIMESTAMP_NTZ,
+        HEARTBEAT_AT TIMESTAMP_NTZ,
+        LEASE_EXPIRES_AT TIMESTAMP_NTZ,
+        ATTEMPTS NUMBER DEFAULT 0,
+        FINISHED_AT TIMESTAMP_NTZ,
+        MESSAGE VARCHAR(16777216)
+    )
+"""
+
+# Unclaimed files, and claims whose worker stopped sending heartbeats
+CLAIMABLE_CONDITION = "(STATUS = 'PENDING' OR (STATUS = 'CLAIMED' AND LEASE_EXPIRES_AT < SYSDATE()))"
+
+
+def default_worker_id():
+    """Identify this worker in the queue: host, process and a random suffix"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def staged_at_literal(last_modified):
+    """Render a stage listing's last_modified (RFC 2822 string or datetime) as a UTC SQL literal"""
+    try:
+        modified = parsedate_to_datetime(last_modified) if isinstance(last_modified, str) else last_modified
+        if modified.tzinfo is not None:
+            modified = modified.astimezone(timezone.utc).replace(tzinfo=None)
+        return f"'{modified.strftime('%Y-%m-%d %H:%M:%S')}'::TIMESTAMP_NTZ"
+    except (TypeError, ValueError, AttributeError):
+        return "NULL::TIMESTAMP_NTZ"
+
+
+class FileWorkQueue:
+    """One worker's view of LOGS.FILE_WORK_QUEUE for a source stage
+
+    enqueue() adds files from a stage listing, claim() leases up to n of them
+    to this worker, and complete() records the outcome. Use it as a context
+    manager to send heartbeats from a background thread while files are being
+    processed and to hand back unfinished claims on exit.
+    """
+
+    def __init__(self, conn, source_stage="RAW_STAGE", worker_id=None,
+                 lease_seconds=WORK_QUEUE_LEASE_SECONDS, max_attempts=WORK_QUEUE_MAX_ATTEMPTS):
+        self.conn = conn
+        self.source_stage = source_stage
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.stop_heartbeat = threading.Event()
+        self.heartbeat_thread = None
+
+    def execute(self, query):
+        cursor = self.conn.cursor()
+        cursor.execute(query)
+        return cursor
+
+    @property
+    def stage_condition(self):
+        return f"SOURCE_STAGE = {sql_string_literal(self.source_stage)}"
+
+    def enqueue(self, files):
+        """Add (filename, last_modified) pairs as PENDING
+
+        Files already in the queue keep their state, except finished ones whose
+        staged copy is newer than the last run (they were uploaded again).
+        """
+        files = list(files)
+        for offset in range(0, len(files), WORK_QUEUE_ENQUEUE_BATCH):
+            batch = files[offset:offset + WORK_QUEUE_ENQUEUE_BATCH]
+            values_sql = ", ".join(f"({sql_string_literal(name)}, {staged_at_literal(modified)})"
+                                   for name, modified in batch)
+            self.execute(f"""
+                MERGE INTO LOGS.FILE_WORK_QUEUE q
+                USING (SELECT COLUMN1 AS FILE_NAME, COLUMN2 AS STAGED_AT FROM VALUES {values_sql}) s
+                ON q.{self.stage_condition} AND q.FILE_NAME = s.FILE_NAME
+                WHEN MATCHED AND q.STATUS IN ('DONE', 'FAILED')
+                        AND (s.STAGED_AT IS NULL OR q.FINISHED_AT IS NULL OR s.STAGED_AT > q.FINISHED_AT) THEN
+                    UPDATE SET STATUS = 'PENDING', STAGED_AT = s.STAGED_AT, ENQUEUED_AT = SYSDATE(),
+                               WORKER_ID = NULL, CLAIM_TOKEN = NULL, ATTEMPTS = 0,
+                               FINISHED_AT = NULL, MESSAGE = NULL
+                WHEN NOT MATCHED THEN
+                    INSERT (SOURCE_STAGE, FILE_NAME, STATUS, STAGED_AT, ENQUEUED_AT, ATTEMPTS)
+                    VALUES ({sql_string_literal(self.source_stage)}, s.FILE_NAME, 'PENDING', s.STAGED_AT, SYSDATE(), 0)
+            """)
+
+    def claim(self, limit, filenames=None):
+        """Lease up to limit claimable files to this worker and return their names
+
+        filenames, if given, restricts the claim to those files.
+        """
+        # Abandoned claims that have used up their retries are given up on
+        self.execute(f"""
+            UPDATE LOGS.FILE_WORK_QUEUE
+            SET STATUS = 'FAILED', FINISHED_AT = SYSDATE(),
+                MESSAGE = 'Lease expired ' || ATTEMPTS || ' time(s) without the file being finished'
+            WHERE {self.stage_condition} AND STATUS = 'CLAIMED'
+              AND LEASE_EXPIRES_AT < SYSDATE() AND ATTEMPTS >= {int(self.max_attempts)}
+        """)
+
+        file_filter = ""
+        if filenames is not None:
+            if not filenames:
+                return []
+            file_filter = "AND FILE_NAME IN (" + ", ".join(sql_string_literal(name) for name in filenames) + ")"
+        claim_token = str(uuid.uuid4())
+        # The condition is checked again on the rows being updated, so a file
+        # claimed by another worker between the subquery and the update is skipped
+        self.execute(f"""
+            UPDATE LOGS.FILE_WORK_QUEUE
+            SET STATUS = 'CLAIMED', WORKER_ID = {sql_string_literal(self.worker_id)},
+                CLAIM_TOKEN = {sql_string_literal(claim_token)}, CLAIMED_AT = SYSDATE(),
+                HEARTBEAT_AT = SYSDATE(), LEASE_EXPIRES_AT = DATEADD(second, {int(self.lease_seconds)}, SYSDATE()),
+                ATTEMPTS = ATTEMPTS + 1
+            WHERE {self.stage_condition} AND {CLAIMABLE_CONDITION} {file_filter}
+              AND FILE_NAME IN (
+                  SELECT FILE_NAME FROM LOGS.FILE_WORK_QUEUE
+                  WHERE {self.stage_condition} AND {CLAIMABLE_CONDITION} {file_filter}
+                  ORDER BY ENQUEUED_AT, FILE_NAME
+                  LIMIT {int(limit)}
+              )
+        """)
+        cursor = self.execute(f"""
+            SELECT FILE_NAME FROM LOGS.FILE_WORK_QUEUE
+            WHERE CLAIM_TOKEN = {sql_string_literal(claim_token)}
+            ORDER BY ENQUEUED_AT, FILE_NAME
+        """)
+        return [row[0] for row in cursor.fetchall()]
+
+    def heartbeat(self):
+        """Extend the lease on every file this worker has claimed"""
+        self.execute(f"""
+            UPDATE LOGS.FILE_WORK_QUEUE
+            SET HEARTBEAT_AT = SYSDATE(), LEASE_EXPIRES_AT = DATEADD(second, {int(self.lease_seconds)}, SYSDATE())
+            WHERE WORKER_ID = {sql_string_literal(self.worker_id)} AND STATUS = 'CLAIMED'
+        """)
+
+    def complete(self, filename, success, message=None):
+        """Record a claimed file as DONE or FAILED
+
+        A no-op if the lease was lost and another worker has claimed the file since.
+        """
+        self.complete_many([filename], success, message)
+
+    def complete_many(self, filenames, success, message=None):
+        """Record several claimed files as DONE or FAILED with the same message"""
+        for offset in range(0, len(filenames), WORK_QUEUE_ENQUEUE_BATCH):
+            batch = filenames[offset:offset + WORK_QUEUE_ENQUEUE_BATCH]
+            self.execute(f"""
+                UPDATE LOGS.FILE_WORK_QUEUE
+                SET STATUS = {"'DONE'" if success else "'FAILED'"}, FINISHED_AT = SYSDATE(),
+                    MESSAGE = {sql_string_literal(str(message or '')[:10000])}
+                WHERE {self.stage_condition} AND FILE_NAME IN ({', '.join(sql_string_literal(name) for name in batch)})
+                  AND WORKER_ID = {sql_string_literal(self.worker_id)} AND STATUS = 'CLAIMED'
+            """)
+
+    def release(self):
+        """Hand this worker's unfinished claims back to the queue"""
+        self.execute(f"""
+            UPDATE LOGS.FILE_WORK_QUEUE
+            SET STATUS = 'PENDING', WORKER_ID = NULL, CLAIM_TOKEN = NULL, LEASE_EXPIRES_AT = NULL,
+                ATTEMPTS = GREATEST(ATTEMPTS - 1, 0)
+            WHERE WORKER_ID = {sql_string_literal(self.worker_id)} AND STATUS = 'CLAIMED'
+        """)
+
+    def send_heartbeats(self):
+        while not self.stop_heartbeat.wait(WORK_QUEUE_HEARTBEAT_SECONDS):
+            try:
+                self.heartbeat()
+            except Exception as e:
+                warn(f"Work queue heartbeat failed: {str(e)}")
+
+    def __enter__(self):
+        self.stop_heartbeat.clear()
+        self.heartbeat_thread = threading.Thread(target=self.send_heartbeats, name="work-queue-heartbeat", daemon=True)
+        self.heartbeat_thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop_heartbeat.set()
+        if self.heartbeat_thread:
+            self.heartbeat_thread.join()
+        try:
+            self.release()
+        except Exception as e:
+            warn(f"Could not release work queue claims: {str(e)}")
+        return False
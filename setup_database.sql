@@ -45,3 +45,49 @@ CREATE TABLE IF NOT EXISTS LOGS.FILE_OPERATION_LOG (
     CREATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
 );
 
+
+-- Per-column profiles computed while files are loaded (read by View Tables)
+CREATE TABLE IF NOT EXISTS LOGS.TABLE_PROFILE (
+    TABLE_NAME VARCHAR(500) NOT NULL,
+    LOAD_TIME TIMESTAMP_NTZ NOT NULL,
+    SOURCE_FILE_NAME VARCHAR(500),
+    COLUMN_NAME VARCHAR(500) NOT NULL,
+    ORDINAL_POSITION NUMBER,
+    INFERRED_TYPE VARCHAR(50),
+    ROW_COUNT NUMBER,
+    NULL_COUNT NUMBER,
+    DISTINCT_ESTIMATE NUMBER,
+    MIN_VALUE VARCHAR(1000),
+    MAX_VALUE VARCHAR(1000)
+);
+
+-- SHA-256 of uploaded and loaded file content, used to skip identical files
+CREATE TABLE IF NOT EXISTS LOGS.FILE_CONTENT_REGISTRY (
+    CONTENT_SHA256 VARCHAR(64) NOT NULL,
+    FILE_NAME VARCHAR(500) NOT NULL,
+    FILE_SIZE NUMBER,
+    STATUS VARCHAR(20) NOT NULL,
+    TABLE_NAME VARCHAR(500),
+    ROWS_PROCESSED NUMBER,
+    REGISTERED_AT TIMESTAMP_NTZ NOT NULL,
+    STAGED_MD5 VARCHAR(100)
+);
+ALTER TABLE LOGS.FILE_CONTENT_REGISTRY ADD COLUMN IF NOT EXISTS STAGED_MD5 VARCHAR(100);
+
+-- Files claimed for processing, so several app sessions and headless workers
+-- can process the same stage without sharing files (see file_extract/work_queue.py)
+CREATE TABLE IF NOT EXISTS LOGS.FILE_WORK_QUEUE (
+    SOURCE_STAGE VARCHAR(255) NOT NULL,
+    FILE_NAME VARCHAR(500) NOT NULL,
+    STATUS VARCHAR(20) NOT NULL,
+    STAGED_AT TIMESTAMP_NTZ,
+    ENQUEUED_AT TIMESTAMP_NTZ NOT NULL,
+    WORKER_ID VARCHAR(255),
+    CLAIM_TOKEN VARCHAR(36),
+    CLAIMED_AT TIMESTAMP_NTZ,
+    HEARTBEAT_AT TIMESTAMP_NTZ,
+    LEASE_EXPIRES_AT TIMESTAMP_NTZ,
+    ATTEMPTS NUMBER DEFAULT 0,
+    FINISHED_AT TIMESTAMP_NTZ,
+    MESSAGE VARCHAR(16777216)
+);
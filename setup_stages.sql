@@ -7,21 +7,38 @@ USE DATABASE FILE_EXTRACT_DB;
 USE SCHEMA PUBLIC;
 
 -- Create stages
+-- Directory tables let the app list large stages with SQL (filtered, sorted and
+-- paginated) - set FILE_EXTRACT_DIRECTORY_TABLES=1 in the app's environment to use them
 CREATE OR REPLACE STAGE RAW_STAGE
-    FILE_FORMAT = (TYPE = 'CSV' FIELD_DELIMITER = ',' SKIP_HEADER = 0);
+    FILE_FORMAT = (TYPE = 'CSV' FIELD_DELIMITER = ',' SKIP_HEADER = 0)
+    DIRECTORY = (ENABLE = TRUE);
 
 CREATE OR REPLACE STAGE PROCESSING_STAGE
-    FILE_FORMAT = (TYPE = 'CSV' FIELD_DELIMITER = ',' SKIP_HEADER = 0);
+    FILE_FORMAT = (TYPE = 'CSV' FIELD_DELIMITER = ',' SKIP_HEADER = 0)
+    DIRECTORY = (ENABLE = TRUE);
 
 CREATE OR REPLACE STAGE COMPLETED_STAGE
-    FILE_FORMAT = (TYPE = 'CSV' FIELD_DELIMITER = ',' SKIP_HEADER = 0);
+    FILE_FORMAT = (TYPE = 'CSV' FIELD_DELIMITER = ',' SKIP_HEADER = 0)
+    DIRECTORY = (ENABLE = TRUE);
 
 CREATE OR REPLACE STAGE ERROR_STAGE
-    FILE_FORMAT = (TYPE = 'CSV' FIELD_DELIMITER = ',' SKIP_HEADER = 0);
+    FILE_FORMAT = (TYPE = 'CSV' FIELD_DELIMITER = ',' SKIP_HEADER = 0)
+    DIRECTORY = (ENABLE = TRUE);
+
+-- Code for the Excel/PDF Python procedures in stored_procedures.sql
+-- (file_extract/parsers.py is uploaded here by deploy.sh)
+CREATE STAGE IF NOT EXISTS FILE_EXTRACT_CODE_STAGE;
+
+-- To enable directory tables on stages created by an earlier version of this script:
+-- ALTER STAGE RAW_STAGE SET DIRECTORY = (ENABLE = TRUE);
+-- ALTER STAGE PROCESSING_STAGE SET DIRECTORY = (ENABLE = TRUE);
+-- ALTER STAGE COMPLETED_STAGE SET DIRECTORY = (ENABLE = TRUE);
+-- ALTER STAGE ERROR_STAGE SET DIRECTORY = (ENABLE = TRUE);
 
 -- Grant necessary permissions (adjust role as needed)
 -- GRANT USAGE ON STAGE RAW_STAGE TO ROLE <your_role>;
 -- GRANT USAGE ON STAGE PROCESSING_STAGE TO ROLE <your_role>;
 -- GRANT USAGE ON STAGE COMPLETED_STAGE TO ROLE <your_role>;
 -- GRANT USAGE ON STAGE ERROR_STAGE TO ROLE <your_role>;
+-- GRANT READ ON STAGE FILE_EXTRACT_CODE_STAGE TO ROLE <your_role>;
 
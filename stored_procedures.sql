@@ -1,5 +1,6 @@
 -- Stored Procedures for processing different file types
--- Note: These are optional - the Streamlit app processes files directly
+-- Note: These are optional - the Streamlit app processes files directly, and
+-- calls the Excel/PDF Python procedures below when FILE_EXTRACT_WAREHOUSE_PARSING=1
 -- Run setup_database.sql and setup_stages.sql first
 
 -- Ensure we're using the correct database and schema
@@ -45,76 +46,285 @@ BEGIN
 END;
 $$;
 
--- Simple procedure for Excel files (creates metadata table)
+-- Excel and PDF files are parsed on warehouse compute by Snowpark Python
+-- procedures, so heavy files never pass through the Streamlit container. They
+-- read the file straight from the stage with SnowflakeFile and write the same
+-- CONVERTED_FILES tables as the app:
+--   Excel: one table per sheet, <FILE>_<SHEET>, plus SOURCE_FILE_NAME
+--   PDF:   <FILE> (PAGE_NUMBER, PAGE_TEXT, SOURCE_FILE_NAME) and
+--          <FILE>_TABLES (PAGE_NUMBER, TABLE_INDEX, ROW_INDEX, ROW_CELLS, SOURCE_FILE_NAME)
+-- Parsing reuses file_extract/parsers.py from the repo - upload it first
+-- (deploy.sh does this):
+--   snow stage copy file_extract/parsers.py @FILE_EXTRACT_CODE_STAGE --overwrite
+-- Both return a VARIANT: {success, message, rows, tables}, where tables lists
+-- every table written, even by a load that failed part-way, so the app can
+-- drop its staging tables. Later Excel batches keep the column types of a
+-- sheet's first batch, as in the app. The app calls them
+-- when FILE_EXTRACT_WAREHOUSE_PARSING=1 is set in its environment.
+-- BASE_TABLE_NAME overrides the <FILE> part of the table names, and
+-- TABLE_SUFFIX is appended to every table written: append and merge loads
+-- write TRANSIENT staging tables this way, with a _LOAD_ORDINAL column
+-- numbering rows in file order, and the app applies them to the targets.
+-- Earlier versions only took (STAGE_NAME, FILENAME)
+DROP PROCEDURE IF EXISTS PROCESS_EXCEL_FILE_PY(STRING, STRING);
+DROP PROCEDURE IF EXISTS PROCESS_PDF_FILE_PY(STRING, STRING);
+
+CREATE OR REPLACE PROCEDURE PROCESS_EXCEL_FILE_PY(STAGE_NAME STRING, FILENAME STRING,
+                                                  BASE_TABLE_NAME STRING DEFAULT NULL, TABLE_SUFFIX STRING DEFAULT '')
+RETURNS VARIANT
+LANGUAGE PYTHON
+RUNTIME_VERSION = '3.11'
+PACKAGES = ('snowflake-snowpark-python', 'pandas', 'openpyxl', 'pypdf2', 'xlrd')
+IMPORTS = ('@FILE_EXTRACT_CODE_STAGE/parsers.py')
+HANDLER = 'process_excel_file'
+AS
+$$
+import os
+import re
+import shutil
+import tempfile
+
+import pandas as pd
+from snowflake.snowpark.files import SnowflakeFile
+from parsers import conform_to_dtypes, iter_workbook_sheets
+
+# Sheets are streamed and written this many rows at a time
+EXCEL_BATCH_ROWS = 50000
+
+
+def clean_table_name(filename):
+    """Clean filename to create valid table name (same rules as the app)"""
+    table_name = re.sub(r'[^a-zA-Z0-9_]', '_', filename.rsplit('.', 1)[0])
+    table_name = re.sub(r'_+', '_', table_name).strip('_')
+    return table_name.upper()
+
+
+def copy_from_stage(stage_name, filename, work_dir):
+    """Copy a staged file to local scratch space (openpyxl needs a seekable file)"""
+    local_path = os.path.join(work_dir, os.path.basename(filename))
+    with SnowflakeFile.open(f"@{stage_name}/{filename}", 'rb', require_scoped_url=False) as source:
+        with open(local_path, 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    return local_path
+
+
+def quote_identifier(name):
+    """Quote SQL identifier to handle special characters (same rules as the app)"""
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def widen_to_text(session, table_name, columns, transient):
+    """Change columns of a table to VARCHAR, keeping its rows and column order"""
+    wanted = {str(column).upper() for column in columns}
+    table_ref = f"CONVERTED_FILES.{quote_identifier(table_name)}"
+    select_list = ", ".join(
+        f"{quote_identifier(row['name'])}::VARCHAR AS {quote_identifier(row['name'])}"
+        if row['name'].upper() in wanted else quote_identifier(row['name'])
+        for row in session.sql(f"DESCRIBE TABLE {table_ref}").collect()
+    )
+    table_kind = "TRANSIENT TABLE" if transient else "TABLE"
+    session.sql(f"CREATE OR REPLACE {table_kind} {table_ref} AS SELECT {select_list} FROM {table_ref}").collect()
+
+
+def process_excel_file(session, stage_name, filename, base_table_name=None, table_suffix=''):
+    work_dir = tempfile.mkdtemp()
+    # Every table written so far, returned on failure too so the caller can
+    # drop staging tables a failed load leaves behind
+    tables = []
+    try:
+        workbook_path = copy_from_stage(stage_name, filename, work_dir)
+        base_table_name = base_table_name or clean_table_name(filename)
+        total_rows = 0
+        for sheet_name, batches in iter_workbook_sheets(workbook_path, filename, EXCEL_BATCH_ROWS):
+            table_name = f"{base_table_name}_{clean_table_name(sheet_name)}{table_suffix or ''}"
+            sheet_rows = 0
+            # Later batches are coerced to the types the first batch gave the table
+            dtypes = None
+            for df in batches:
+                if df.empty:
+                    continue
+                df['SOURCE_FILE_NAME'] = filename
+                if dtypes is None:
+                    dtypes = dict(df.dtypes)
+                else:
+                    df, conflicts = conform_to_dtypes(df, dtypes)
+                    if conflicts:
+                        widen_to_text(session, table_name, conflicts, bool(table_suffix))
+                        for column in conflicts:
+                            dtypes[column] = pd.Series(dtype=object).dtype
+                if table_suffix:
+                    df['_LOAD_ORDINAL'] = range(sheet_rows, sheet_rows + len(df))
+                if sheet_rows == 0:
+                    tables.append(table_name)
+                # The first batch creates the table and the rest append to it
+                session.write_pandas(df, table_name, schema="CONVERTED_FILES",
+                                     overwrite=(sheet_rows == 0), auto_create_table=True,
+                                     table_type="transient" if table_suffix else "")
+                sheet_rows += len(df)
+            total_rows += sheet_rows
+
+        if not tables:
+            return {"success": False, "message": f"File {filename} contained no data in any sheet",
+                    "rows": 0, "tables": []}
+        return {"success": True,
+                "message": f"File {filename} processed successfully in the warehouse. "
+                           f"Created {len(tables)} table(s): {', '.join(tables)}",
+                "rows": total_rows, "tables": tables}
+    except Exception as e:
+        return {"success": False, "message": f"Error processing Excel file: {str(e)}", "rows": 0, "tables": tables}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+$$;
+
+CREATE OR REPLACE PROCEDURE PROCESS_PDF_FILE_PY(STAGE_NAME STRING, FILENAME STRING,
+                                                BASE_TABLE_NAME STRING DEFAULT NULL, TABLE_SUFFIX STRING DEFAULT '')
+RETURNS VARIANT
+LANGUAGE PYTHON
+RUNTIME_VERSION = '3.11'
+PACKAGES = ('snowflake-snowpark-python', 'pandas', 'openpyxl', 'pypdf2')
+IMPORTS = ('@FILE_EXTRACT_CODE_STAGE/parsers.py')
+HANDLER = 'process_pdf_file'
+AS
+$$
+import json
+import os
+import re
+import shutil
+import tempfile
+
+import pandas as pd
+from snowflake.snowpark.files import SnowflakeFile
+from parsers import count_pdf_pages, extract_pdf_pages
+
+# Pages are written to the table this many at a time
+PDF_BATCH_PAGES = 200
+
+
+def clean_table_name(filename):
+    """Clean filename to create valid table name (same rules as the app)"""
+    table_name = re.sub(r'[^a-zA-Z0-9_]', '_', filename.rsplit('.', 1)[0])
+    table_name = re.sub(r'_+', '_', table_name).strip('_')
+    return table_name.upper()
+
+
+def copy_from_stage(stage_name, filename, work_dir):
+    """Copy a staged file to local scratch space (PdfReader needs a seekable file)"""
+    local_path = os.path.join(work_dir, os.path.basename(filename))
+    with SnowflakeFile.open(f"@{stage_name}/{filename}", 'rb', require_scoped_url=False) as source:
+        with open(local_path, 'wb') as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+    return local_path
+
+
+def process_pdf_file(session, stage_name, filename, base_table_name=None, table_suffix=''):
+    work_dir = tempfile.mkdtemp()
+    # Every table written so far, returned on failure too so the caller can
+    # drop staging tables a failed load leaves behind
+    tables = []
+    try:
+        pdf_path = copy_from_stage(stage_name, filename, work_dir)
+        base_table_name = base_table_name or clean_table_name(filename)
+        table_name = f"{base_table_name}{table_suffix or ''}"
+        tables_table_name = f"{base_table_name}_TABLES{table_suffix or ''}"
+
+        page_count = count_pdf_pages(pdf_path)
+        if page_count == 0:
+            return {"success": False, "message": f"PDF file {filename} contains no pages", "rows": 0, "tables": []}
+
+        pages_loaded = 0
+        table_rows_loaded = 0
+        table_count = 0
+        for first_page in range(0, page_count, PDF_BATCH_PAGES):
+            page_rows = []
+            table_rows = []
+            for page_number, text, tables in extract_pdf_pages(pdf_path, first_page, min(first_page + PDF_BATCH_PAGES, page_count)):
+                page_rows.append((page_number, text, filename))
+                table_count += len(tables)
+                for table_idx, table in enumerate(tables, 1):
+                    for row_idx, cells in enumerate(table, 1):
+                        table_rows.append((page_number, table_idx, row_idx, json.dumps(cells), filename))
+
+            df = pd.DataFrame(page_rows, columns=["PAGE_NUMBER", "PAGE_TEXT", "SOURCE_FILE_NAME"])
+            if table_suffix:
+                df['_LOAD_ORDINAL'] = df["PAGE_NUMBER"]
+            if pages_loaded == 0:
+                tables.append(table_name)
+            session.write_pandas(df, table_name, schema="CONVERTED_FILES",
+                                 overwrite=(pages_loaded == 0), auto_create_table=True,
+                                 table_type="transient" if table_suffix else "")
+            pages_loaded += len(df)
+            if table_rows:
+                df = pd.DataFrame(table_rows, columns=["PAGE_NUMBER", "TABLE_INDEX", "ROW_INDEX", "ROW_CELLS", "SOURCE_FILE_NAME"])
+                if table_suffix:
+                    df['_LOAD_ORDINAL'] = (df["PAGE_NUMBER"] * 1000 + df["TABLE_INDEX"]) * 1000000 + df["ROW_INDEX"]
+                if table_rows_loaded == 0:
+                    tables.append(tables_table_name)
+                session.write_pandas(df, tables_table_name, schema="CONVERTED_FILES",
+                                     overwrite=(table_rows_loaded == 0), auto_create_table=True,
+                                     table_type="transient" if table_suffix else "")
+                table_rows_loaded += len(df)
+
+        message = f"File {filename} processed successfully in the warehouse. Extracted {pages_loaded} page(s) into table {table_name}"
+        if table_rows_loaded:
+            message += f" and {table_count} detected table(s) into {tables_table_name}"
+        elif not table_suffix:
+            # Don't leave tables from an earlier load of this file behind
+            session.sql(f'DROP TABLE IF EXISTS CONVERTED_FILES."{tables_table_name}"').collect()
+        return {"success": True, "message": message + ".", "rows": pages_loaded, "tables": tables}
+    except Exception as e:
+        return {"success": False, "message": f"Error processing PDF file: {str(e)}", "rows": 0, "tables": tables}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+$$;
+
+-- Process an Excel file in RAW_STAGE and remove it afterwards
 CREATE OR REPLACE PROCEDURE PROCESS_EXCEL_FILE_V2(FILENAME STRING)
 RETURNS STRING
 LANGUAGE SQL
 AS
 $$
+DECLARE
+    result VARIANT;
 BEGIN
-    -- Clean filename for table name
-    LET table_name VARCHAR := REPLACE(REPLACE(REPLACE(UPPER(SPLIT_PART(:FILENAME, '.', 1)), '-', '_'), ' ', '_'), '.', '_');
-    table_name := REGEXP_REPLACE(table_name, '[^A-Z0-9_]', '_');
+    CALL PROCESS_EXCEL_FILE_PY('RAW_STAGE', :FILENAME) INTO :result;
 
-    -- For Excel files, create a metadata table
-    -- Use the Streamlit app for full Excel processing
+    -- Remove from RAW_STAGE
     BEGIN
-        EXECUTE IMMEDIATE 'CREATE OR REPLACE TABLE ' || table_name || ' AS 
-            SELECT 
-                ''Excel file: ' || :FILENAME || ' - Use Streamlit app for full data processing'' AS note,
-                ''' || :FILENAME || ''' AS SOURCE_FILE_NAME,
-                CURRENT_TIMESTAMP() AS PROCESSED_AT';
-
-        -- Remove from RAW_STAGE
         EXECUTE IMMEDIATE 'REMOVE @RAW_STAGE/' || :FILENAME;
-
-        RETURN 'SUCCESS - Note: Use Streamlit app for full Excel processing';
     EXCEPTION
         WHEN OTHER THEN
-            BEGIN
-                EXECUTE IMMEDIATE 'REMOVE @RAW_STAGE/' || :FILENAME;
-            EXCEPTION
-                WHEN OTHER THEN
-                    NULL;
-            END;
-            RETURN 'ERROR: ' || SQLERRM;
+            NULL;
     END;
+
+    IF (result:success::BOOLEAN) THEN
+        RETURN 'SUCCESS - ' || result:message::STRING;
+    END IF;
+    RETURN 'ERROR: ' || result:message::STRING;
 END;
 $$;
 
--- Simple procedure for PDF files (creates metadata table)
+-- Process a PDF file in RAW_STAGE and remove it afterwards
 CREATE OR REPLACE PROCEDURE PROCESS_PDF_FILE(FILENAME STRING)
 RETURNS STRING
 LANGUAGE SQL
 AS
 $$
+DECLARE
+    result VARIANT;
 BEGIN
-    -- Clean filename for table name
-    LET table_name VARCHAR := REPLACE(REPLACE(REPLACE(UPPER(SPLIT_PART(:FILENAME, '.', 1)), '-', '_'), ' ', '_'), '.', '_');
-    table_name := REGEXP_REPLACE(table_name, '[^A-Z0-9_]', '_');
+    CALL PROCESS_PDF_FILE_PY('RAW_STAGE', :FILENAME) INTO :result;
 
-    -- For PDF files, create a metadata table
-    -- Use the Streamlit app for full PDF processing
+    -- Remove from RAW_STAGE
     BEGIN
-        EXECUTE IMMEDIATE 'CREATE OR REPLACE TABLE ' || table_name || ' AS 
-            SELECT 
-                ''PDF file: ' || :FILENAME || ' - Use Streamlit app for full text extraction'' AS note,
-                ''' || :FILENAME || ''' AS SOURCE_FILE_NAME,
-                CURRENT_TIMESTAMP() AS PROCESSED_AT';
-
-        -- Remove from RAW_STAGE
         EXECUTE IMMEDIATE 'REMOVE @RAW_STAGE/' || :FILENAME;
-
-        RETURN 'SUCCESS - Note: Use Streamlit app for full PDF processing';
     EXCEPTION
         WHEN OTHER THEN
-            BEGIN
-                EXECUTE IMMEDIATE 'REMOVE @RAW_STAGE/' || :FILENAME;
-            EXCEPTION
-                WHEN OTHER THEN
-                    NULL;
-            END;
-            RETURN 'ERROR: ' || SQLERRM;
+            NULL;
     END;
+
+    IF (result:success::BOOLEAN) THEN
+        RETURN 'SUCCESS - ' || result:message::STRING;
+    END IF;
+    RETURN 'ERROR: ' || result:message::STRING;
 END;
 $$;